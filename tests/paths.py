@@ -60,6 +60,13 @@ channel_montage_file = EXPORTED_PATH / 'channel_montage.json'
 channel_montage_reref_file = EXPORTED_PATH / 'channel_montage_reref.json'
 fieldtrip_file = EXPORTED_PATH / 'fieldtrip.mat'
 wonambi_file = EXPORTED_PATH / 'exported.won'
+chunked_file = EXPORTED_PATH / 'exported_chunked'
+header_cache_dir = EXPORTED_PATH / 'header_cache'
+text_dir = EXPORTED_PATH / 'text'
+text_cache_dir = EXPORTED_PATH / 'text_cache'
+text_malformed_dir = EXPORTED_PATH / 'text_malformed'
+nev_synthetic_file = EXPORTED_PATH / 'synthetic.nev'
+bci2000_synthetic_file = EXPORTED_PATH / 'synthetic_bci2000.dat'
 
 # Store images
 DOCS_PATH = test_path.parent / 'docs'
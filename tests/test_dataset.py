@@ -0,0 +1,92 @@
+from os import utime
+from shutil import rmtree
+
+from numpy import savetxt
+from numpy.testing import assert_array_equal
+
+from wonambi import Dataset
+from wonambi.ioeeg import (Chunked, Edf, FieldTrip, Text, Wonambi, write_edf,
+                           write_chunked, write_wonambi)
+from wonambi.utils import create_data
+
+from .paths import (chunked_file, EXPORTED_PATH, fieldtrip_file,
+                    header_cache_dir, text_cache_dir, wonambi_file)
+
+gen_data = create_data(n_trial=1)
+
+
+def _fail(self):
+    raise AssertionError('the header should be read from the cache')
+
+
+def test_dataset_header_cache(monkeypatch):
+    write_wonambi(gen_data, wonambi_file, subj_id='test_subj')
+    d = Dataset(wonambi_file, cache_dir=header_cache_dir)
+
+    with monkeypatch.context() as m:
+        m.setattr(Wonambi, 'return_hdr', _fail)
+        d_cached = Dataset(wonambi_file, cache_dir=header_cache_dir)
+
+    assert d_cached.IOClass is Wonambi
+    assert d_cached.header == d.header
+    assert_array_equal(d_cached.read_data().data[0], gen_data(trial=0))
+
+    # the cache is not used if the file changes
+    write_wonambi(gen_data, wonambi_file, subj_id='another_subj')
+    utime(str(wonambi_file), ns=(0, 0))
+    d_new = Dataset(wonambi_file, cache_dir=header_cache_dir)
+    assert d_new.header['subj_id'] == 'another_subj'
+
+
+def _read_twice_from_cache(filename, IOClass, monkeypatch):
+    """Open the dataset once to fill the cache, then open it from the cache
+    and read the data twice (so that the readers use their own caches)."""
+    d = Dataset(filename, cache_dir=header_cache_dir)
+    expected = d.read_data().data[0]
+
+    with monkeypatch.context() as m:
+        m.setattr(IOClass, 'return_hdr', _fail)
+        d = Dataset(filename, cache_dir=header_cache_dir)
+
+    for _ in range(2):
+        assert_array_equal(d.read_data().data[0], expected)
+        assert_array_equal(d.read_data(begsam=10, endsam=20).data[0],
+                           expected[:, 10:20])
+
+
+def test_dataset_header_cache_wonambi(monkeypatch):
+    write_wonambi(gen_data, wonambi_file)
+    _read_twice_from_cache(wonambi_file, Wonambi, monkeypatch)
+
+
+def test_dataset_header_cache_wonambi_compressed(monkeypatch):
+    write_wonambi(gen_data, wonambi_file, compression='zlib')
+    _read_twice_from_cache(wonambi_file, Wonambi, monkeypatch)
+
+
+def test_dataset_header_cache_fieldtrip(monkeypatch):
+    gen_data.export(fieldtrip_file, export_format='fieldtrip')
+    _read_twice_from_cache(fieldtrip_file, FieldTrip, monkeypatch)
+
+
+def test_dataset_header_cache_chunked(monkeypatch):
+    write_chunked(gen_data, chunked_file, time_block=128, summary_block=32)
+    _read_twice_from_cache(chunked_file, Chunked, monkeypatch)
+
+
+def test_dataset_header_cache_edf(monkeypatch):
+    edf_file = EXPORTED_PATH / 'export_cache.edf'
+    write_edf(gen_data, edf_file)
+    _read_twice_from_cache(edf_file, Edf, monkeypatch)
+
+
+def test_dataset_header_cache_text(monkeypatch):
+    """The conversion of the other channels (in .wonambi) should not make the
+    cache outdated."""
+    text_cache_dir.mkdir(exist_ok=True)
+    rmtree(str(text_cache_dir / '.wonambi'), ignore_errors=True)
+    for chan, x in zip(gen_data.axis['chan'][0], gen_data(trial=0)):
+        savetxt(str(text_cache_dir / ('subj_' + chan + '.txt')), x,
+                header='Sampling Rate: 256 Hz', comments='')
+
+    _read_twice_from_cache(text_cache_dir, Text, monkeypatch)
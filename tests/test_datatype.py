@@ -1,6 +1,8 @@
 from pickle import load, dump
 from tempfile import NamedTemporaryFile
+from numpy import isnan, shares_memory
 from numpy.testing import assert_array_equal
+from pytest import raises
 
 from wonambi.trans import math
 from wonambi.utils import create_data
@@ -33,3 +35,53 @@ def test_copy_axis():
 
     output = data._copy(axis=False)
     assert len(data.axis) == len(output.axis)
+
+
+def test_call_lookup():
+    data = create_data(n_trial=2)
+
+    dat = data(trial=0, chan=['chan02', 'chan00', 'xxx'])
+    assert_array_equal(dat[0], data.data[0][2])
+    assert_array_equal(dat[1], data.data[0][0])
+    assert isnan(dat[2]).all()
+
+    time = data.time[1][[10, 3]] + 1e-6
+    dat = data(trial=1, time=time, tolerance=1e-4)
+    assert_array_equal(dat[:, 0], data.data[1][:, 10])
+    assert_array_equal(dat[:, 1], data.data[1][:, 3])
+
+    assert isnan(data(trial=1, time=time)).all()
+
+
+def test_call_view():
+    data = create_data()
+
+    dat = data(trial=0, chan=['chan01', 'chan02'], copy=False)
+    assert dat.base is not None
+    assert_array_equal(dat, data.data[0][1:3])
+
+    dat = data(trial=0, chan='chan01', copy=False)
+    assert dat.ndim == 1
+    assert dat.base is not None
+
+    # not contiguous, so it needs a copy
+    dat = data(trial=0, chan=['chan03', 'chan01'], copy=False)
+    assert dat.base is None
+
+
+def test_copy_shared_axis():
+    data = create_data(n_trial=2, attr=['chan', ])
+
+    output = data._copy()
+    assert shares_memory(output.axis['time'][0], data.axis['time'][0])
+    assert output.attr['chan'] is data.attr['chan']
+
+    with raises(ValueError):
+        output.axis['time'][0][0] = 10
+
+    # the input of a transformation can still be changed
+    math(data, operator_name='square')
+    data.axis['time'][0] += 1
+
+    output.axis['chan'][1] = output.axis['chan'][1][:2]
+    assert len(data.axis['chan'][1]) == data.data[1].shape[0]
@@ -1,6 +1,9 @@
+from numpy import arange, array, zeros
+from numpy.testing import assert_array_equal, assert_array_almost_equal
+
 from wonambi import Dataset
 
-from .paths import bci2000_file
+from .paths import bci2000_file, bci2000_synthetic_file
 
 
 def test_bci2000_data():
@@ -11,3 +14,60 @@ def test_bci2000_data():
 
     data = d.read_data()
     assert data.data[0][0, 0] == 179.702
+
+
+def _write_bci2000(filename, dat, statevector):
+    """Write a minimal BCI2000 file (float32, 2 bytes of states)."""
+    rows = ['[ State Vector Definition ] ',
+            'Running 1 0 0 0',
+            'MicromedCode 9 0 0 3',
+            'Other 4 0 1 4',
+            '[ Parameter Definition ] ',
+            'Source:Signal%20Properties int SamplingRate= 256 256 1 % // Hz',
+            'Source:Signal%20Properties floatlist SourceChGain= 2 0.5 2 '
+            '// gain',
+            'Source:Signal%20Properties floatlist SourceChOffset= 2 1 0 '
+            '// offset',
+            'Storage:Documentation string StorageTime= 2020-01-01T10:00:00 '
+            '// time',
+            'Storage:Documentation string SubjectName= test // subj',
+            '',
+            ]
+    first_row = ('BCI2000V= 3.0 HeaderLen= {:06d} SourceCh= 2 '
+                 'StatevectorLen= 2 DataFormat= float32')
+    text = '\r\n'.join([first_row, ] + rows)
+    header = (first_row.format(len(text)) + '\r\n' + '\r\n'.join(rows))
+
+    records = zeros(dat.shape[1], dtype=[('ch001', '<f4'), ('ch002', '<f4'),
+                                         ('statevector', '<u2')])
+    records['ch001'] = dat[0]
+    records['ch002'] = dat[1]
+    records['statevector'] = statevector
+    with filename.open('wb') as f:
+        f.write(header.encode())
+        f.write(records.tobytes())
+
+
+def test_bci2000_synthetic():
+    n_smp = 100
+    dat = arange(2 * n_smp).reshape(2, n_smp) / 4
+    running = arange(n_smp) % 2
+    code = array([0] * 40 + [300] * 20 + [5] * 40)
+    other = arange(n_smp) % 16
+    _write_bci2000(bci2000_synthetic_file, dat,
+                   running | (code << 3) | (other << 12))
+
+    d = Dataset(bci2000_synthetic_file)
+    assert d.header['n_samples'] == n_smp
+    data = d.read_data(chan=['ch002', 'ch001'], begsam=10, endsam=20)
+    assert_array_almost_equal(data.data[0],
+                              array([dat[1, 10:20] * 2,
+                                     (dat[0, 10:20] - 1) * 0.5]))
+
+    assert_array_equal(d.dataset.return_state('Running'), running)
+    assert_array_equal(d.dataset.return_state('MicromedCode'), code)
+    assert_array_equal(d.dataset.return_state('Other'), other)
+
+    markers = d.read_markers()
+    assert [m['name'] for m in markers] == ['0', '300', '5']
+    assert markers[1]['start'] == 40 / 256
@@ -1,8 +1,11 @@
-from numpy import isnan
+from numpy import dtype, isnan, zeros
+from numpy.testing import assert_array_equal
 from pytest import raises
 from wonambi import Dataset
+from wonambi.ioeeg.blackrock import (_nev_markers, _read_nev_packets,
+                                     _read_spikes)
 
-from .paths import ns2_file, ns4_file, nev_file
+from .paths import ns2_file, ns4_file, nev_file, nev_synthetic_file
 
 
 def test_blackrock_ns4_00():
@@ -36,3 +39,45 @@ def test_blackrock_nev():
     d = Dataset(nev_file)
     with raises(TypeError):
         d.read_data()
+
+
+def test_blackrock_nev_packets():
+    """Synthetic packet stream, with digital events and spikes."""
+    packet_bytes = 16
+    packets = zeros(6, dtype=dtype({'names': ['timestamp', 'packetID', 'class',
+                                              'digital'],
+                                    'formats': ['<u4', '<u2', 'u1', '<u2'],
+                                    'offsets': [0, 4, 6, 8],
+                                    'itemsize': packet_bytes,
+                                    }))
+    packets['timestamp'] = [300, 600, 900, 1200, 1500, 1800]
+    packets['packetID'] = [0, 5, 0, 2049, 12, 0]
+    packets['class'] = [1, 2, 1, 0, 3, 1]
+    packets['digital'] = [0x0102, 0, 0, 7, 0x0300, 0x00ff]
+
+    offset = 32
+    with nev_synthetic_file.open('wb') as f:
+        f.write(b'\x00' * offset)
+        f.write(packets.tobytes())
+
+    x = _read_nev_packets(str(nev_synthetic_file), offset, len(packets),
+                          packet_bytes)
+    for field in packets.dtype.names:
+        assert_array_equal(x[field], packets[field])
+
+    hdr = {'DataPacketOffset': offset,
+           'countDataPacket': len(packets),
+           'PacketBytes': packet_bytes,
+           'SampleRes': 30000,
+           }
+    spikes = _read_spikes(str(nev_synthetic_file), hdr)
+    assert_array_equal(spikes['electrode'], [5, 12])
+    assert_array_equal(spikes['unit'], [2, 3])
+    assert_array_equal(spikes['time'], [0.02, 0.05])
+
+    markers = _nev_markers(x, 30000)
+    assert [m['name'] for m in markers] == ['258', '7', '768', '255']
+    assert markers[0]['start'] == 0.01
+
+    markers = _nev_markers(x, 30000, trigger_bits=8)
+    assert [m['name'] for m in markers] == ['2', '7', '255']
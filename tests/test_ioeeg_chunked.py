@@ -0,0 +1,41 @@
+from numpy.testing import assert_array_equal, assert_array_almost_equal
+
+from wonambi import Dataset
+from wonambi.ioeeg import write_chunked
+from wonambi.trans import select
+from wonambi.utils import create_data
+
+from .paths import chunked_file
+
+gen_data = create_data(n_trial=1, n_chan=20)
+markers = [{'name': 'spindle', 'start': 0.1, 'end': 0.3, 'chan': None}, ]
+
+
+def test_chunked_write_read():
+    gen_data.export(chunked_file, export_format='chunked', dtype='float64',
+                    chan_block=8, time_block=128, summary_block=32,
+                    markers=markers)
+    d = Dataset(chunked_file)
+    assert d.header['n_samples'] == gen_data.number_of('time')[0]
+    assert_array_equal(d.read_data().data[0], gen_data(trial=0))
+    assert d.read_markers() == markers
+
+    chan = ['chan15', 'chan02', 'chan09']
+    data = d.read_data(chan=chan, begsam=100, endsam=200)
+    assert_array_equal(data.data[0], gen_data(trial=0, chan=chan)[:, 100:200])
+
+
+def test_chunked_write_pieces_summary():
+    pieces = [select(gen_data, time=(t, t + 0.3)) for t in (0, 0.3, 0.6, 0.9)]
+    write_chunked(pieces, chunked_file, chan_block=8, time_block=128,
+                  summary_block=32)
+    d = Dataset(chunked_file)
+    assert_array_almost_equal(d.read_data().data[0], gen_data(trial=0),
+                              decimal=5)
+
+    start, summary = d.dataset.return_summary([1, 12])
+    x = gen_data(trial=0)[[1, 12], 32:64]
+    assert start[1] == 32
+    assert_array_almost_equal(summary['max'][:, 1], x.max(axis=1), decimal=5)
+    assert_array_almost_equal(summary['rms'][:, 1],
+                              (x ** 2).mean(axis=1) ** .5, decimal=5)
@@ -1,4 +1,5 @@
-from numpy import isnan
+from numpy import abs, isnan
+from numpy.testing import assert_array_almost_equal
 
 from wonambi import Dataset
 from wonambi.ioeeg import write_edf
@@ -44,3 +45,40 @@ def test_edf_annot():
 def test_edf_write():
     data = create_data()
     write_edf(data, EXPORTED_PATH / 'export.edf')
+
+
+def test_edf_write_markers():
+    data = create_data(n_chan=2, s_freq=256, time=(0, 3.5))
+    markers = [{'name': 'stim', 'start': 1.5, 'end': 2},
+               {'name': 'spike', 'start': 2.2, 'end': 2.2},
+               ]
+    edf_file = EXPORTED_PATH / 'export_markers.edf'
+    write_edf(data, edf_file, physical_max=[10, 20], markers=markers)
+
+    d = Dataset(edf_file)
+    assert d.header['chan_name'] == ['chan00', 'chan01']
+    assert d.header['n_samples'] == 4 * 256  # last record is padded
+    dat = d.read_data(begsam=0, endsam=896)
+    assert_array_almost_equal(dat.data[0], data.data[0], decimal=3)
+    assert [x['name'] for x in d.read_markers()] == ['stim', 'spike']
+
+    # write the dataset again, in chunks
+    write_edf(d, EXPORTED_PATH / 'export_chunks.edf', chan=['chan01', ],
+              physical_max=20)
+    d1 = Dataset(EXPORTED_PATH / 'export_chunks.edf')
+    assert_array_almost_equal(d1.read_data().data[0], d.read_data(
+        chan=['chan01', ]).data[0], decimal=3)
+
+
+def test_edf_write_small_values():
+    data = create_data(n_chan=2, s_freq=256, time=(0, 2))
+    data.data[0] *= 1e-4
+    data.data[0][1, :] = 0  # flat channel
+    edf_file = EXPORTED_PATH / 'export_small.edf'
+    write_edf(data, edf_file, physical_max=None)
+
+    d = Dataset(edf_file)
+    assert d.header['orig']['physical_max'][1] > 0
+    dat = d.read_data()
+    phys_max = abs(data.data[0][0]).max()
+    assert abs(dat.data[0] - data.data[0]).max() < phys_max * 1e-4
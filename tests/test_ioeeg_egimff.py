@@ -1,27 +1,62 @@
-from numpy import isnan
+from numpy import arange, concatenate, cumsum, frombuffer, isnan
+from numpy.testing import assert_array_equal
 
 from wonambi import Dataset
+from wonambi.ioeeg.egimff import _find_runs, _read_samples
 
 from .paths import mff_file
 
 
-d = Dataset(mff_file)
-
 def test_mff_read():
+    d = Dataset(mff_file)
     d.read_data(begtime=10, endtime=20)
 
 
 def test_mff_before_start():
+    d = Dataset(mff_file)
     data = d.read_data(begsam=-100, endsam=10)
     assert isnan(data.data[0][0, 0])
 
 
 def test_mff_after_end():
+    d = Dataset(mff_file)
     n_samples = d.header['n_samples']
     data = d.read_data(begsam=n_samples - 100, endsam=n_samples + 100)
     assert isnan(data.data[0][0, -1])
 
 
 def test_mff_markers():
+    d = Dataset(mff_file)
     markers = d.read_markers()
     assert len(markers) == 8
+
+
+def test_mff_find_runs():
+    n_samples = [4, 4, 4, 2, 5, 5, 5]
+    i_data = [10, 50, 90, 130, 150, 200, 260]
+    assert _find_runs(n_samples, i_data) == [(0, 3), (3, 4), (4, 6), (6, 7)]
+
+
+def test_mff_read_samples():
+    """Synthetic signal file, with blocks of different size and headers of
+    different length."""
+    n_chan = 3
+    dtype = '<h'
+    n_samples = [4, 4, 4, 2, 5, 5, 5]
+    hdr_bytes = [8, 8, 8, 8, 8, 12, 8]
+    first_smp = concatenate(([0, ], cumsum(n_samples)))
+    values = arange(n_chan * first_smp[-1]).reshape(n_chan, -1)
+
+    signal = b''
+    i_data = []
+    for n_hdr, s0, s1 in zip(hdr_bytes, first_smp[:-1], first_smp[1:]):
+        signal += b'\xff' * n_hdr
+        i_data.append(len(signal))
+        signal += values[:, s0:s1].astype(dtype).tobytes()
+    signal = frombuffer(signal, dtype='u1')
+
+    for chan in ([0, 1, 2], [2, 0], [1, ]):
+        for begsam, endsam in ((0, first_smp[-1]), (3, 9), (5, 6), (11, 27)):
+            dat = _read_samples(signal, i_data, first_smp, n_chan, dtype,
+                                chan, begsam, endsam)
+            assert_array_equal(dat, values[chan, begsam:endsam])
@@ -1,3 +1,4 @@
+from numpy import isnan
 from numpy.testing import assert_array_equal
 from pytest import raises
 
@@ -26,6 +27,33 @@ def test_write_read_fieldtrip_hdf5():
     d.read_data()
 
 
+def test_read_fieldtrip_cached(monkeypatch):
+    data = create_data(n_trial=1, n_chan=3)
+    data.export(fieldtrip_file, export_format='fieldtrip')
+
+    loaded = []
+    loadmat = fieldtrip.loadmat
+
+    def counting_loadmat(*args, **kwargs):
+        loaded.append(args[0])
+        return loadmat(*args, **kwargs)
+
+    monkeypatch.setattr(fieldtrip, 'loadmat', counting_loadmat)
+
+    d = Dataset(fieldtrip_file)
+    ftdata = d.read_data(chan=['chan01', ])
+    assert_array_equal(ftdata.data[0], data.data[0][[1], :])
+
+    n_samples = d.header['n_samples']
+    ftdata = d.read_data(chan=['chan02', 'chan00'], begsam=n_samples - 10,
+                         endsam=n_samples + 10)
+    assert_array_equal(ftdata.data[0][:, :10],
+                       data.data[0][[2, 0], n_samples - 10:])
+    assert isnan(ftdata.data[0][:, 10:]).all()
+
+    assert len(loaded) == 1  # only when reading the header
+
+
 def test_wrong_variable_name():
     fieldtrip.VAR = 'unknown'
     with raises(KeyError):
@@ -0,0 +1,42 @@
+from numpy import isnan, savetxt
+from numpy.testing import assert_array_almost_equal
+from pytest import raises
+
+from wonambi import Dataset
+from wonambi.ioeeg import Text
+from wonambi.utils import create_data
+
+from .paths import text_dir, text_malformed_dir
+
+gen_data = create_data(n_trial=1, n_chan=2, s_freq=256)
+text_dir.mkdir(exist_ok=True)
+for chan, x in zip(gen_data.axis['chan'][0], gen_data(trial=0)):
+    savetxt(str(text_dir / ('subj_' + chan + '.txt')), x,
+            header='Sampling Rate: 256 Hz', comments='')
+
+
+def test_text_read():
+    d = Dataset(text_dir)
+    assert d.IOClass is Text
+    assert d.header['n_samples'] == gen_data.number_of('time')[0]
+    chan = list(gen_data.axis['chan'][0])
+    assert sorted(d.header['chan_name']) == chan
+
+    gain = (d.dataset.phys_max - d.dataset.phys_min) / (d.dataset.dig_max -
+                                                        d.dataset.dig_min)
+    data = d.read_data(chan=chan, begsam=100, endsam=300)
+    assert_array_almost_equal(data.data[0][:, :156] / gain,
+                              gen_data(trial=0)[:, 100:])
+    assert isnan(data.data[0][:, 156:]).all()
+    assert (text_dir / '.wonambi' / ('subj_' + chan[1] + '.dat')).exists()
+
+
+def test_text_malformed():
+    text_malformed_dir.mkdir(exist_ok=True)
+    txt_file = text_malformed_dir / 'subj_chan00.txt'
+    with txt_file.open('w') as f:
+        f.write('Sampling Rate: 256 Hz\n1.0\n2.0\nabc\n4.0\n')
+
+    with raises(ValueError):
+        Dataset(text_malformed_dir)
+    assert not (text_malformed_dir / '.wonambi' / 'subj_chan00.json').exists()
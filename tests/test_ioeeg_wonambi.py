@@ -1,7 +1,11 @@
-from numpy.testing import assert_array_equal
+from math import ceil
+
+from numpy import isnan, nan
+from numpy.testing import assert_array_equal, assert_array_almost_equal
 
 from wonambi import Dataset
-from wonambi.ioeeg import write_wonambi
+from wonambi.ioeeg import write_wonambi, WonambiWriter
+from wonambi.trans import select
 from wonambi.utils import create_data
 
 from .paths import wonambi_file
@@ -14,3 +18,57 @@ def test_wonambi_write_read():
     d = Dataset(wonambi_file)
     data = d.read_data()
     assert_array_equal(data(trial=0), gen_data(trial=0))
+
+
+def test_wonambi_read_epochs():
+    write_wonambi(gen_data, wonambi_file, subj_id='test_subj')
+    d = Dataset(wonambi_file)
+    s_freq = d.header['s_freq']
+
+    events = [0.5, 0.2, {'start': 0.25}, 0.7]
+    data = d.read_epochs(events, pre=0.1, post=0.2, chan=['chan01', ])
+    assert data.number_of('trial') == 4
+    assert data.data[0].base is data.data[1].base
+    assert data.time[0] is data.time[3]
+
+    for i, onset in enumerate((0.5, 0.2, 0.25, 0.7)):
+        onset = ceil(onset * s_freq)
+        dat = d.read_data(chan=['chan01', ],
+                          begsam=onset - round(0.1 * s_freq),
+                          endsam=onset + round(0.2 * s_freq))
+        assert_array_equal(data(trial=i), dat(trial=0))
+
+
+def test_wonambi_write_int16():
+    write_wonambi(gen_data, wonambi_file, dtype='int16')
+    data = Dataset(wonambi_file).read_data()
+    assert_array_almost_equal(data(trial=0), gen_data(trial=0), decimal=4)
+
+
+def test_wonambi_write_chunks():
+    chunks = [select(gen_data, time=(t, t + 0.3)) for t in (0, 0.3, 0.6, 0.9)]
+    write_wonambi(chunks[:2], wonambi_file, compression='zlib')
+    with WonambiWriter(wonambi_file, append=True) as writer:
+        for chunk in chunks[2:]:
+            writer.write(chunk)
+
+    d = Dataset(wonambi_file)
+    assert_array_equal(d.read_data().data[0], gen_data(trial=0))
+    assert_array_equal(d.read_data(begsam=10, endsam=20).data[0],
+                       gen_data(trial=0)[:, 10:20])
+
+
+def test_wonambi_write_int16_nan_and_clip(caplog):
+    data = create_data(n_trial=1)
+    data.data[0][0, 10:20] = nan
+    data.data[0][1, :] = nan
+    write_wonambi(data, wonambi_file, dtype='int16')
+    dat = Dataset(wonambi_file).read_data().data[0]
+    assert_array_equal(isnan(dat), isnan(data.data[0]))
+    assert_array_almost_equal(dat[2:], data.data[0][2:], decimal=4)
+
+    with WonambiWriter(wonambi_file, append=True) as writer:
+        writer.write(data.data[0] * 2)
+    assert 'clipped' in caplog.text
+    dat = Dataset(wonambi_file).read_data().data[0]
+    assert_array_equal(isnan(dat[:, -10:]), isnan(data.data[0][:, -10:]))
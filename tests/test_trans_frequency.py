@@ -1,11 +1,12 @@
 from wonambi.utils import create_data
-from numpy import arange, pi, sqrt, cos, sum
+from numpy import arange, pi, sqrt, cos, stack, sum
 from scipy.signal.spectral import _spectral_helper
 from numpy.random import seed
 from numpy.testing import assert_array_equal, assert_array_almost_equal, assert_almost_equal
+from pytest import raises
 
 from wonambi.trans.frequency import _fft
-from wonambi.trans import frequency, math, timefrequency
+from wonambi.trans import frequency, frequency_batch, math, timefrequency
 
 
 CORRECTION_FACTOR = 2 / 3
@@ -55,6 +56,80 @@ def test_trans_frequency_complex():
     assert freq.data[0].shape == (data.number_of('chan')[0], dur * s_freq, NW * 2 - 1)
 
 
+def test_trans_frequency_block_size():
+    seed(0)
+    data = create_data(n_trial=1, n_chan=2, s_freq=s_freq, time=(0, 10))
+
+    freq = frequency(data, taper='dpss', duration=1, overlap=0.9)
+    freq_block = frequency(data, taper='dpss', duration=1, overlap=0.9,
+                           block_size=7)
+    assert_array_almost_equal(freq.data[0], freq_block.data[0])
+
+
+def test_trans_frequency_block_size_invalid():
+    data = create_data(n_trial=1, n_chan=2, s_freq=s_freq, time=(0, 10))
+
+    with raises(ValueError):
+        frequency(data, duration=1, block_size=0)
+
+
+def test_trans_frequency_taper_list():
+    data = create_data(n_trial=1, n_chan=2, s_freq=s_freq, time=(0, 10))
+
+    freq_tuple = frequency(data, taper=('tukey', 0.5), duration=1)
+    freq_list = frequency(data, taper=['tukey', 0.5], duration=1)
+    assert_array_equal(freq_tuple.data[0], freq_list.data[0])
+
+
+def test_trans_frequency_batch():
+    seed(0)
+    data0 = create_data(n_trial=2, n_chan=2, s_freq=s_freq, time=(0, dur))
+    data1 = create_data(n_trial=1, n_chan=2, s_freq=s_freq, time=(0, 1))
+
+    freqs = frequency_batch([data0, data1], taper='hann', duration=.5)
+    assert len(freqs) == 2
+    for one_data, one_freq in zip((data0, data1), freqs):
+        freq = frequency(one_data, taper='hann', duration=.5)
+        assert one_freq.number_of('trial') == one_data.number_of('trial')
+        for i in range(one_data.number_of('trial')):
+            assert_array_equal(one_freq.freq[i], freq.freq[i])
+            assert_array_almost_equal(one_freq.data[i], freq.data[i])
+
+    freq = frequency_batch([data0, data1], stacked=True)
+    assert freq.number_of('trial') == 3
+    assert freq.data[2].shape == (2, s_freq // 2 + 1)
+
+
+def test_trans_frequency_batch_ndarray():
+    seed(0)
+    data = create_data(n_trial=3, n_chan=2, s_freq=s_freq, time=(0, dur))
+    x = stack(data.data)
+
+    freq = frequency_batch(x, s_freq=s_freq, stacked=True, output='complex',
+                           sides='two', taper='dpss')
+    freq0 = frequency(data, output='complex', sides='two', taper='dpss')
+    assert freq.list_of_axes == ('chan', 'freq', 'taper')
+    assert_array_almost_equal(freq.data[1], freq0.data[1])
+
+    with raises(TypeError):
+        frequency_batch(x)
+
+
+def test_trans_frequency_n_jobs():
+    seed(0)
+    data = create_data(n_trial=3, n_chan=2, s_freq=s_freq, time=(0, dur))
+
+    freq = frequency(data, taper='hann', duration=.5)
+    freq_jobs = frequency(data, taper='hann', duration=.5, n_jobs=2)
+    assert_array_almost_equal(freq.data[2], freq_jobs.data[2])
+
+    tf = timefrequency(data, method='morlet', foi=(10, 20), time_skip=3)
+    tf_jobs = timefrequency(data, method='morlet', foi=(10, 20), time_skip=3,
+                            n_jobs=2)
+    assert_array_almost_equal(tf.data[1], tf_jobs.data[1])
+    assert tf.data[1].shape[1] == len(tf.time[1])
+
+
 def test_trans_timefrequency_spectrogram():
     seed(0)
     data = create_data(n_trial=1, n_chan=2, s_freq=s_freq, time=(0, dur))
@@ -1,8 +1,12 @@
-from numpy import power, mean, nanmax, std
-from numpy.testing import assert_array_equal
+from numpy import (arange, ones, pi, power, mean, nanmax, sin, sqrt, square,
+                   std)
+from numpy.random import randn
+from scipy.signal import hilbert as scipy_hilbert
+from numpy.testing import assert_array_equal, assert_array_almost_equal
 from pytest import raises
 
 from wonambi.trans import math
+from wonambi.trans.envelope import envelope, hilbert
 from wonambi.utils import create_data
 
 
@@ -97,3 +101,59 @@ def test_math_diff():
     dat = data(trial=0, chan='chan01')[2] - data(trial=0, chan='chan01')[1]
     dat1 = data1(trial=0, chan='chan01')[2]
     assert dat == dat1
+
+
+def test_math_inplace():
+    data0 = create_data(n_trial=2)
+    data1 = math(data0, operator_name=('hilbert', 'abs', 'square', 'sqrt'),
+                 axis='time')
+    assert_array_almost_equal(data1.data[1],
+                              abs(math(data0, operator_name='hilbert',
+                                       axis='time').data[1]))
+
+    orig = data0.data[0].copy()
+    data2 = math(data0, operator_name=('square', 'sqrt'), inplace=True)
+    assert data2.data[0] is data0.data[0]
+    assert_array_almost_equal(data2.data[0], abs(orig))
+
+
+def test_math_view_not_inplace():
+    data0 = create_data()
+    orig = data0.data[0].copy()
+    math(data0, operator=(lambda x: x[:, :10], square))
+    assert_array_equal(data0.data[0], orig)
+
+
+def test_math_scalar_not_inplace():
+    data0 = create_data()
+    data1 = math(data0, operator=(square, lambda x: x.mean(), sqrt))
+    assert_array_almost_equal(data1.data[0],
+                              sqrt(mean(square(data0(trial=0)))))
+
+
+def test_math_n_jobs():
+    data1 = math(data, operator_name=('square', 'mean'), axis='time')
+    data2 = math(data, operator_name=('square', 'mean'), axis='time',
+                 n_jobs=2)
+    assert_array_almost_equal(data1.data[9], data2.data[9])
+
+
+def test_math_envelope():
+    data1 = math(data, operator_name='envelope', axis='time')
+    data2 = math(data, operator_name=('hilbert', 'abs'), axis='time')
+    assert_array_almost_equal(data1.data[0], data2.data[0])
+
+
+def test_hilbert_padding():
+    x = randn(2, 1000)  # 1000 doesn't need padding
+    assert_array_almost_equal(hilbert(x), scipy_hilbert(x))
+
+    x = randn(2, 1009)  # prime length
+    assert_array_almost_equal(hilbert(x)[:, 200:800],
+                              scipy_hilbert(x)[:, 200:800], decimal=1)
+
+    s_freq = 100
+    t = arange(1000) / s_freq
+    x = sin(2 * pi * 5 * t) + sin(2 * pi * 30 * t)
+    env = envelope(x, s_freq=s_freq, band=(20, 40))
+    assert_array_almost_equal(env, ones(1000))
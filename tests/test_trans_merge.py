@@ -1,4 +1,6 @@
-from numpy.random import seed
+from numpy import moveaxis
+from numpy.random import randn, seed
+from numpy.testing import assert_array_equal
 
 from wonambi.utils import create_data
 from wonambi.trans import concatenate
@@ -17,3 +19,20 @@ def test_concatenate_trial():
 def test_concatenate_axis():
     data1 = concatenate(data, axis='time')
     assert data1.number_of('time')[0] == data.number_of('time')[0] * data.number_of('trial')
+
+
+def test_concatenate_trial_view():
+    x = randn(4, 2, 10)
+    data0 = create_data(n_trial=4, n_chan=2)
+    for i in range(4):
+        data0.data[i] = x[i]
+        data0.axis['time'][i] = data0.axis['time'][0][:10]
+
+    data1 = concatenate(data0, axis='trial', check_unique=False)
+    assert data1.data[0].base is not None
+    assert_array_equal(data1.data[0], moveaxis(x, 0, -1))
+
+    data0.data[2] = x[2].copy()
+    data2 = concatenate(data0, axis='trial')
+    assert data2.data[0].base is None
+    assert_array_equal(data1.data[0], data2.data[0])
@@ -83,3 +83,43 @@ def test_montage_bipolar_03():
 
     with raises(ValueError):
         montage(data_wrongorder, bipolar=100)
+
+
+def test_montage_bipolar_attr():
+    bipol = montage(data, bipolar=100)
+
+    assert bipol.attr['chan'].n_chan == 28
+    assert data.attr['chan'].n_chan == 8
+
+
+def test_montage_laplacian_00():
+    lapl = montage(data, laplacian=100)
+
+    assert_array_equal(lapl.chan[0], data.chan[0])
+    # with all the channels as neighbors, it's the same as average reference
+    avg = montage(data, ref_to_avg=True)
+    assert_array_almost_equal(lapl(trial=0) * 7 / 8, avg(trial=0))
+
+
+def test_montage_laplacian_01():
+    with raises(TypeError):
+        montage(data, laplacian=100, bipolar=100)
+
+
+def test_montage_csd():
+    data_csd = create_data(n_chan=16, attr=['chan', ])
+    csd = montage(data_csd, csd=True)
+    assert csd.data[0].shape == data_csd.data[0].shape
+
+    # a signal which is the same in all the channels has no csd
+    data_csd.data[0][:] = data_csd.data[0][:1, :]
+    csd = montage(data_csd, csd={'m': 3})
+    assert_array_almost_equal(csd.data[0], zeros(csd.data[0].shape))
+
+
+def test_montage_csd_n_terms():
+    """The Legendre series converges (n ** m does not overflow)."""
+    data_csd = create_data(n_chan=16, attr=['chan', ])
+    csd_10 = montage(data_csd, csd={'m': 10, 'n_terms': 10})
+    csd_130 = montage(data_csd, csd={'m': 10, 'n_terms': 130})
+    assert_array_almost_equal(csd_10.data[0], csd_130.data[0])
@@ -0,0 +1,38 @@
+from numpy import argmax, nan
+from numpy.random import seed
+from numpy.testing import assert_array_equal
+
+from wonambi.utils import create_data
+from wonambi.trans import frequency, peaks
+
+
+seed(0)
+data = create_data(n_trial=5)
+freq = frequency(data)
+
+
+def test_peaks_max():
+    data1 = peaks(freq, axis='freq')
+    assert data1.list_of_axes == ('chan', )
+    assert_array_equal(data1.data[3],
+                       freq.freq[3][argmax(freq.data[3], axis=1)])
+
+
+def test_peaks_limits():
+    data1 = peaks(freq, method='min', axis='freq', limits=(10, 20))
+    for trl in range(5):
+        assert ((10 <= data1.data[trl]) & (data1.data[trl] <= 20)).all()
+
+
+def test_peaks_nan():
+    freq1 = frequency(data)
+    freq1.data[2][:, freq1.freq[2] == 15] = nan
+    data1 = peaks(freq1, axis='freq', limits=(15, 16))
+    assert (data1.data[2] == 16).all()
+
+
+def test_peaks_n_jobs():
+    data1 = peaks(freq, axis='freq', limits=(10, 20))
+    data2 = peaks(freq, axis='freq', limits=(10, 20), n_jobs=2)
+    for trl in range(5):
+        assert_array_equal(data1.data[trl], data2.data[trl])
@@ -0,0 +1,45 @@
+from numpy import arange, flatnonzero, pi, sin
+from numpy.random import randn, seed
+from numpy.testing import assert_array_equal
+
+from wonambi import Dataset
+from wonambi.ioeeg import write_wonambi
+from wonambi.trans import rejectbadchan, rejectbadepochs
+from wonambi.utils import create_data
+
+from .paths import wonambi_file
+
+
+seed(0)
+data = create_data(n_trial=1, n_chan=10, s_freq=256, time=(0, 120))
+x = data.data[0]
+x[3] *= 20  # noisy
+x[5] = 0  # flat
+x[:, 40 * 256:44 * 256] += 50 * randn(10, 4 * 256)
+t = arange(2 * 256) / 256
+x[7, 80 * 256:82 * 256] += 5 * sin(2 * pi * 50 * t)
+
+
+def test_reject_chan():
+    assert rejectbadchan(data) == ['chan03', 'chan05']
+
+
+def test_reject_epochs():
+    bad_chan, mask, events = rejectbadepochs(data, epoch_length=2)
+    assert mask.data[0].shape == (10, 60)
+    assert mask.data[0][7, 40]
+    assert len(events) == 1
+    assert events[0]['start'] == 40
+    assert events[0]['end'] == 44
+
+
+def test_reject_dataset():
+    write_wonambi(data, wonambi_file, subj_id='test_subj')
+    d = Dataset(wonambi_file)
+
+    bad_chan, mask, events = rejectbadepochs(d, chunk_length=30)
+    bad_chan_data, mask_data, _ = rejectbadepochs(data)
+    assert bad_chan == bad_chan_data
+    assert_array_equal(flatnonzero(mask.data[0][7]),
+                       flatnonzero(mask_data.data[0][7]))
+    assert events[0]['start'] == 40
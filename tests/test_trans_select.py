@@ -156,3 +156,44 @@ def test_resample():
     assert_array_almost_equal(sum(freq.data[0][0, :]),
                               sum(freq1.data[0][0, :]),
                               4)
+
+
+def test_resample_rational():
+    data = create_data(n_trial=1, s_freq=500, time=(0, 2))
+
+    data1 = resample(data, s_freq=256)
+    assert data1.s_freq == 256
+    assert data1.number_of('time')[0] == 512
+    assert_array_almost_equal(data1.time[0][:3],
+                              data.time[0][0] + arange(3) / 256)
+
+    data2 = resample(data, s_freq=256, chunk_size=300)
+    assert_array_almost_equal(data1.data[0], data2.data[0])
+
+    with raises(ValueError):
+        resample(data, s_freq=256, ftype='iir')
+
+
+def test_select_view():
+    data1 = select(data, time=(0.1, 0.5), chan=('chan01', 'chan02'),
+                   copy=False)
+    assert data1.data[3].base is not None
+    assert_array_equal(data1.data[3],
+                       data(trial=3, time=data1.time[3],
+                            chan=('chan01', 'chan02')))
+
+    data2 = select(data, time=(0.1, 0.5))
+    assert data2.data[3].base is None
+    assert_array_equal(data1.data[3], data2.data[3][1:3])
+
+
+def test_select_same_key_different_axis():
+    data0 = create_data(n_trial=3)
+    time = data0.time[0].copy()
+    time[1:-1] /= 2  # same first and last value
+    data0.axis['time'][1] = time
+    data0.axis['time'][2] = data0.time[0].copy()
+
+    data1 = select(data0, time=(0, 0.25))
+    assert len(data1.time[1]) > len(data1.time[0])
+    assert_array_equal(data1.time[2], data1.time[0])
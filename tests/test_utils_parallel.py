@@ -0,0 +1,30 @@
+from numpy import arange, ones
+from numpy.testing import assert_array_equal
+
+from wonambi.utils.parallel import map_trials
+
+
+def _scale(x, y, factor=1):
+    return x * factor + y
+
+
+def test_map_trials_serial():
+    trials = [(arange(5), 1), (arange(3), 2)]
+    output = map_trials(_scale, trials, factor=2)
+    assert_array_equal(output[0], arange(5) * 2 + 1)
+    assert_array_equal(output[1], arange(3) * 2 + 2)
+
+
+def test_map_trials_parallel():
+    trials = [(ones((2, 10)) * i, i) for i in range(4)]
+    output = map_trials(_scale, trials, n_jobs=2, factor=3)
+    assert len(output) == 4
+    for i, x in enumerate(output):
+        assert_array_equal(x, ones((2, 10)) * 4 * i)
+
+
+def test_map_trials_generator():
+    trials = ((ones((2, 10)) * i, i) for i in range(3))
+    output = map_trials(_scale, trials, n_jobs=2)
+    assert len(output) == 3
+    assert_array_equal(output[2], ones((2, 10)) * 4)
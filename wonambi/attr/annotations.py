@@ -603,7 +603,7 @@ class Annotations():
 
         self.save()
 
-    def add_event(self, name, time, chan=''):
+    def add_event(self, name, time, chan='', save=True):
         """Add event to annotations file.
         Parameters
         ----------
@@ -613,6 +613,9 @@ class Annotations():
             Start and end times of event, in seconds from recording start.
         chan : str or list of str, optional
             Channel or channels associated with event.
+        save : bool
+            if False, the file is not saved (useful when adding many events,
+            call save() at the end)
         Raises
         ------
         IndexError
@@ -641,7 +644,8 @@ class Annotations():
         # because the signal quality is good; anyway, it gets checked against
         # the epoch quality in get_events (JOB)
 
-        self.save()
+        if save:
+            self.save()
 
     def remove_event(self, name=None, time=None, chan=None):
         """get events inside window."""
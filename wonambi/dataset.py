@@ -2,22 +2,30 @@
 
 """
 from datetime import timedelta, datetime
+from hashlib import sha1
 from math import ceil
 from logging import getLogger
 from os import listdir
 from pathlib import Path
+from pickle import dump, load, HIGHEST_PROTOCOL, PicklingError
 
-from numpy import arange, asarray, empty, int64
+from numpy import arange, argsort, asarray, empty, int64
 
 from .ioeeg import (Abf, Edf, Ktlx, BlackRock, EgiMff, FieldTrip,
-                    Moberg, Wonambi, Micromed, BCI2000, Text)
+                    Moberg, Wonambi, Chunked, Micromed, BCI2000, Text)
 from .ioeeg.bci2000 import _read_header_length
+from .ioeeg.text import CACHE_DIR as TEXT_CACHE_DIR
 from .datatype import ChanTime
 from .utils import UnrecognizedFormat
+from . import __version__
 
 
 lg = getLogger('wonambi')
 
+MAX_READ = 2 ** 20  # max number of samples to read at once for epochs
+HEADER_CACHE_VERSION = 1  # increase it when the cached info changes
+HEADER_CACHE_DIR = Path.home() / '.wonambi' / 'header_cache'
+
 
 def _convert_time_to_sample(abs_time, dataset):
     """Convert absolute time into samples.
@@ -53,6 +61,46 @@ def _convert_time_to_sample(abs_time, dataset):
     return sample
 
 
+def _coalesce_reads(begsam, n_smp, max_gap, max_read=MAX_READ):
+    """Group epochs which are close in time, so that they can be read at once.
+
+    Parameters
+    ----------
+    begsam : ndarray of int
+        first sample of each epoch
+    n_smp : int
+        number of samples in each epoch
+    max_gap : int
+        epochs are grouped together if there are fewer than max_gap samples
+        between them (so, overlapping epochs are always grouped)
+    max_read : int
+        max number of samples to read in each group (a group can be longer if
+        n_smp is larger than max_read)
+
+    Returns
+    -------
+    list of tuple
+        for each group, the first sample, the last sample (not included), and
+        the indices of the epochs in the group
+    """
+    groups = []
+    for i in argsort(begsam, kind='mergesort'):
+        one_begsam = begsam[i]
+        one_endsam = one_begsam + n_smp
+
+        if groups:
+            grp_begsam, grp_endsam, idx = groups[-1]
+            if (one_begsam - grp_endsam <= max_gap and
+                    one_endsam - grp_begsam <= max_read):
+                groups[-1] = (grp_begsam, max(grp_endsam, one_endsam),
+                              idx + [i, ])
+                continue
+
+        groups.append((one_begsam, one_endsam, [i, ]))
+
+    return groups
+
+
 def detect_format(filename):
     """Detect file format.
 
@@ -74,6 +122,8 @@ def detect_format(filename):
             return Moberg
         elif (filename / 'info.xml').exists():
             return EgiMff
+        elif (filename / 'chunked.json').exists():
+            return Chunked
         elif '.txt' in [x[-4:] for x in listdir(filename)]:
             return Text
         else:
@@ -122,6 +172,10 @@ class Dataset:
         name of the file
     IOClass : class
         one of the classes of wonambi.ioeeg
+    cache_dir : str or Path, optional
+        directory where to store the header of the datasets (see Notes). If
+        None, the header is always read from the file (f.e. use
+        HEADER_CACHE_DIR).
 
     Attributes
     ----------
@@ -155,10 +209,22 @@ class Dataset:
     while the latter is the file that you really read. There might be
     differences, for example, if the argument points to a file within a
     directory, or if the file is mapped to memory.
+
+    Reading the header can be slow for some formats (Ktlx, EGI MFF, Text).
+    With cache_dir, the header and the info parsed by the reader are stored
+    after the first time and they are reused as long as the size and the
+    modification time of the file (or of the files in the directory) and the
+    version of wonambi don't change.
     """
-    def __init__(self, filename, IOClass=None):
+    def __init__(self, filename, IOClass=None, cache_dir=None):
         self.filename = Path(filename)
 
+        if cache_dir is not None:
+            cached = _read_header_cache(self.filename, IOClass, cache_dir)
+            if cached is not None:
+                self.IOClass, self.dataset, self.header = cached
+                return
+
         if IOClass is not None:
             self.IOClass = IOClass
         else:
@@ -175,6 +241,10 @@ class Dataset:
         hdr['orig'] = output[5]
         self.header = hdr
 
+        if cache_dir is not None:
+            _write_header_cache(self.filename, self.IOClass, self.dataset,
+                                self.header, cache_dir)
+
     def read_markers(self, **kwargs):
         """Return the markers. You can add optional arguments that will be
         passed to the method specific for each datafile.
@@ -331,3 +401,160 @@ class Dataset:
             data.data[i] = dat
 
         return data
+
+    def read_epochs(self, events, pre=0, post=1, chan=None, max_gap=1):
+        """Read epochs of the same length, locked to events.
+
+        Parameters
+        ----------
+        events : list of float or datedelta or datetime or dict
+            onset of each epoch (same types as begtime in read_data). It can
+            also be a list of dict with 'start' (such as the output of
+            read_markers or Annotations.get_events).
+        pre : float
+            duration in s of each epoch before the event
+        post : float
+            duration in s of each epoch after the event
+        chan : list of strings
+            names of the channels to read
+        max_gap : float
+            epochs closer than max_gap (in s) to each other are read from the
+            file at once.
+
+        Returns
+        -------
+        An instance of ChanTime
+            with one trial per event, in the same order as events. The time
+            axis is relative to the event (from -pre to post) and it is the
+            same array for all the trials.
+
+        Notes
+        -----
+        The epochs are sorted by time and overlapping or nearby epochs are
+        read with one call, to minimize the number of reads. The data of all
+        the epochs is stored in one contiguous array (trial x chan x time), so
+        each trial is a view of this array.
+        """
+        if chan is None:
+            chan = self.header['chan_name']
+        if not (isinstance(chan, list) or isinstance(chan, tuple)):
+            raise TypeError('Parameter "chan" should be a list')
+        idx_chan = [self.header['chan_name'].index(x) for x in chan]
+
+        s_freq = self.header['s_freq']
+        n_pre = int(round(pre * s_freq))
+        n_smp = n_pre + int(round(post * s_freq))
+
+        onsets = [x['start'] if isinstance(x, dict) else x for x in events]
+        begsam = asarray([_convert_time_to_sample(x, self) - n_pre
+                          for x in onsets], dtype=int64)
+        groups = _coalesce_reads(begsam, n_smp, int(round(max_gap * s_freq)))
+        lg.debug('Reading {} epochs in {} reads'.format(len(begsam),
+                                                        len(groups)))
+
+        epochs = empty((len(begsam), len(chan), n_smp))
+        for grp_begsam, grp_endsam, idx in groups:
+            dat = self.dataset.return_dat(idx_chan, grp_begsam, grp_endsam)
+            for i in idx:
+                offset = begsam[i] - grp_begsam
+                epochs[i] = dat[:, offset:offset + n_smp]
+
+        data = ChanTime()
+        data.start_time = self.header['start_time']
+        data.s_freq = s_freq
+
+        n_trl = len(begsam)
+        data.axis['chan'] = empty(n_trl, dtype='O')
+        data.axis['time'] = empty(n_trl, dtype='O')
+        data.data = empty(n_trl, dtype='O')
+
+        labels = asarray(chan, dtype='U')
+        time = arange(-n_pre, n_smp - n_pre) / s_freq
+        labels.setflags(write=False)
+        time.setflags(write=False)
+        for i in range(n_trl):
+            data.axis['chan'][i] = labels
+            data.axis['time'][i] = time
+            data.data[i] = epochs[i]
+
+        return data
+
+
+def _header_cache_file(filename, cache_dir):
+    """Name of the file containing the cached header of one dataset."""
+    key = sha1(str(filename.resolve()).encode()).hexdigest()
+    return Path(cache_dir) / (key + '.pkl')
+
+
+def _file_signature(filename):
+    """Size and modification time of the file, or of all the files in the
+    directory, to check if the dataset has changed.
+
+    The directory with the binary files of Text is skipped, because it
+    changes every time that a new channel is read.
+    """
+    if filename.is_dir():
+        paths = sorted(x for x in filename.iterdir()
+                       if x.name != TEXT_CACHE_DIR)
+    else:
+        paths = [filename, ]
+
+    signature = []
+    for one_path in paths:
+        st = one_path.stat()
+        signature.append((one_path.name, st.st_size, st.st_mtime_ns))
+    return signature
+
+
+def _read_header_cache(filename, IOClass, cache_dir):
+    """Return the reader and the header from the cache.
+
+    Returns
+    -------
+    tuple of (class, instance of the class, dict) or None
+        IOClass, reader and header, or None if the cache is missing or stale
+    """
+    cache_file = _header_cache_file(filename, cache_dir)
+    try:
+        with cache_file.open('rb') as f:
+            cached = load(f)
+        signature = _file_signature(filename)
+
+    except Exception as err:  # missing, corrupted or from an old version
+        lg.debug('Header cache not used for {}: {}'.format(filename, err))
+        return None
+
+    if (cached['version'] != (HEADER_CACHE_VERSION, __version__) or
+            cached['signature'] != signature or
+            (IOClass is not None and cached['IOClass'] is not IOClass)):
+        lg.debug('Header cache for {} is outdated'.format(filename))
+        return None
+
+    lg.debug('Reading header of {} from cache'.format(filename))
+    return cached['IOClass'], cached['dataset'], cached['header']
+
+
+def _write_header_cache(filename, IOClass, dataset, header, cache_dir):
+    """Store the reader and the header in the cache.
+
+    The reader is pickled with the rest. Readers which keep open files,
+    memory-mapped arrays or caches of the data should define __getstate__ to
+    reset them (they are opened again when reading the data).
+    """
+    cached = {'version': (HEADER_CACHE_VERSION, __version__),
+              'signature': _file_signature(filename),
+              'IOClass': IOClass,
+              'dataset': dataset,
+              'header': header,
+              }
+
+    cache_file = _header_cache_file(filename, cache_dir)
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_suffix('.tmp')
+        with tmp_file.open('wb') as f:
+            dump(cached, f, protocol=HIGHEST_PROTOCOL)
+        tmp_file.replace(cache_file)
+
+    except (OSError, PicklingError, TypeError, AttributeError) as err:
+        lg.debug('Could not cache header of {}: {}'.format(filename, err))
@@ -8,7 +8,9 @@ from collections import OrderedDict, Iterable
 from copy import deepcopy
 from logging import getLogger
 
-from numpy import arange, array, empty, ix_, NaN, squeeze, where
+from numpy import (abs, arange, array, array_equal, asarray, diff, empty,
+                   flatnonzero, ix_, maximum, minimum, NaN, ndarray, searchsorted, squeeze,
+                   where)
 
 lg = getLogger()
 
@@ -90,7 +92,9 @@ class Data:
                      'scores': None,
                      }
 
-    def __call__(self, trial=None, tolerance=None, **axes):
+        self._lookup = {}
+
+    def __call__(self, trial=None, tolerance=None, copy=True, **axes):
         """Return the recordings and their time stamps.
 
         Parameters
@@ -105,6 +109,10 @@ class Data:
             if one of the axiss is a number, it specifies the tolerance to
             consider one value as chosen (take into account floating-precision
             errors).
+        copy : bool
+            if False and the selection corresponds to a contiguous block of
+            the data, it returns a view of the data instead of a copy (so you
+            should not modify the output in place).
 
         Returns
         -------
@@ -122,6 +130,10 @@ class Data:
         -----
         You cannot specify intervals here, you can do it in Select.
 
+        The indices of string axes and of sorted numeric axes are looked up
+        with a cached index (see _create_lookup), which is recomputed only
+        when the axis is replaced by a new array.
+
         """
         if trial is None:
             trial = range(self.number_of('trial'))
@@ -155,7 +167,8 @@ class Data:
 
                     idx = _get_indices(values[i],
                                        selected_values,
-                                       tolerance=tolerance)
+                                       tolerance=tolerance,
+                                       lookup=self._get_lookup(axis, i))
                     if len(idx[0]) == 0:
                         lg.warning('No index was selected for ' + axis)
 
@@ -163,18 +176,14 @@ class Data:
                     idx_output.append(idx[1])
                 else:
                     n_values = len(values[i])
-                    idx_data.append(arange(n_values))
-                    idx_output.append(arange(n_values))
+                    idx_data.append(None)
+                    idx_output.append(None)
 
                 output_shape.append(n_values)
 
-            output[cnt] = empty(output_shape, dtype=self.data[i].dtype)
-            output[cnt].fill(NaN)
-
-            if all([len(x) > 0 for x in idx_data]):
-                ix_output = ix_(*idx_output)
-                ix_data = ix_(*idx_data)
-                output[cnt][ix_output] = self.data[i][ix_data]
+            output[cnt] = _select_from_indices(self.data[i], idx_data,
+                                               idx_output, output_shape,
+                                               copy=copy)
 
             if len(squeeze_axis) > 0:
                 output[cnt] = squeeze(output[cnt],
@@ -185,6 +194,44 @@ class Data:
 
         return output
 
+    def _get_lookup(self, axis, trial):
+        """Return the cached lookup for one axis in one trial.
+
+        Parameters
+        ----------
+        axis : str
+            Name of the axis (such as 'chan', 'time', etc)
+        trial : int
+            index of the trial
+
+        Returns
+        -------
+        dict or None
+            see _create_lookup
+
+        Notes
+        -----
+        The lookup is recomputed if the axis has been replaced by another
+        array. It is not recomputed if you modify the values of the axis in
+        place.
+        """
+        try:
+            lookups = self._lookup
+        except AttributeError:  # f.e. pickled before _lookup was added
+            lookups = self._lookup = {}
+
+        values = self.axis[axis][trial]
+        try:
+            cached_values, lookup = lookups[axis, trial]
+        except KeyError:
+            cached_values = None
+
+        if cached_values is not values:
+            lookup = _create_lookup(values)
+            lookups[axis, trial] = values, lookup
+
+        return lookup
+
     @property
     def list_of_axes(self):
         """Return the name of all the axes in the data."""
@@ -305,9 +352,9 @@ class Data:
         Parameters
         ----------
         axis : bool, optional
-            deep copy the axes (default: True)
+            copy the axes (default: True)
         attr : bool, optional
-            deep copy the attributes (default: True)
+            copy the attributes (default: True)
         data : bool, optional
             deep copy the data (default: False)
 
@@ -321,8 +368,17 @@ class Data:
         It's important that we copy all the relevant information here. If you
         add new attributes, you should add them here.
 
-        Remember that it deep-copies all the information, so if you copy data
-        the size might become really large.
+        The axes are copied on write: the copy gets its own list of trials for
+        each axis, but the values of the axis in each trial are read-only
+        views of the arrays in the original data (the original arrays are not
+        changed). To change an axis of the copy, you need to assign a new
+        array to the trial (f.e. output.axis['chan'][0] = new_chan), which
+        does not affect the original data. In the same way, the dict with the
+        attributes is new, but the attributes themselves (f.e. Channels) are
+        shared.
+
+        Remember that it deep-copies the data, so if you copy data the size
+        might become really large.
         """
         cdata = type(self)()  # create instance of the same class
 
@@ -330,7 +386,7 @@ class Data:
         cdata.start_time = self.start_time
 
         if axis:
-            cdata.axis = deepcopy(self.axis)
+            cdata.axis = _share_axis(self.axis)
         else:
             cdata_axis = OrderedDict()
             for axis_name in self.axis:
@@ -338,7 +394,7 @@ class Data:
             cdata.axis = cdata_axis
 
         if attr:
-            cdata.attr = deepcopy(self.attr)
+            cdata.attr = dict(self.attr)
 
         if data:
             cdata.data = deepcopy(self.data)
@@ -357,7 +413,8 @@ class Data:
         filename : path to file
             file to write
         export_format : str, optional
-            supported export format is currently FieldTrip, EDF, FIFF, Wonambi
+            supported export format is currently FieldTrip, EDF, FIFF, Wonambi,
+            Chunked
 
         Notes
         -----
@@ -366,6 +423,9 @@ class Data:
         wonambi takes an optional argument "subj_id", see write_wonambi.
         wonambi format creates two files, one .phy with the dataset info as json
         file and one .dat with the memmap recordings.
+
+        chunked takes optional arguments "subj_id" and "markers", see
+        write_chunked.
         """
         export_format = export_format.lower()
         if export_format == 'edf':
@@ -385,6 +445,10 @@ class Data:
             from .ioeeg import write_wonambi
             write_wonambi(self, filename, **options)
 
+        elif export_format == 'chunked':
+            from .ioeeg import write_chunked
+            write_chunked(self, filename, **options)
+
         else:
             raise ValueError('Cannot export to ' + export_format)
 
@@ -444,7 +508,41 @@ class ChanTimeFreq(Data):
         self.axis['freq'] = array([], dtype='O')
 
 
-def _get_indices(values, selected, tolerance):
+def _share_axis(axis):
+    """Copy the axes, so that the trials can be replaced independently, but
+    the values of each trial are shared, as read-only views (the input arrays
+    remain writeable).
+
+    Parameters
+    ----------
+    axis : OrderedDict
+        dictionary with axis, where the values are ndarray (dtype='O') with
+        one array per trial.
+
+    Returns
+    -------
+    OrderedDict
+        new dictionary with new ndarray (dtype='O'), containing views of the
+        arrays of the input. Trials which share the same array in the input
+        share the same view in the output.
+    """
+    views = {}
+    shared = OrderedDict()
+    for axis_name, values in axis.items():
+        shared[axis_name] = empty(len(values), dtype='O')
+        for i, one_trial in enumerate(values):
+            if isinstance(one_trial, ndarray):
+                if id(one_trial) not in views:
+                    view = one_trial.view()
+                    view.setflags(write=False)
+                    views[id(one_trial)] = view
+                one_trial = views[id(one_trial)]
+            shared[axis_name][i] = one_trial
+
+    return shared
+
+
+def _get_indices(values, selected, tolerance, lookup=None):
     """Get indices based on user-selected values.
 
     Parameters
@@ -455,6 +553,8 @@ def _get_indices(values, selected, tolerance):
         values selected by the user
     tolerance : float
         avoid rounding errors.
+    lookup : dict, optional
+        cached lookup of the values, created by _create_lookup
 
     Returns
     -------
@@ -474,7 +574,20 @@ def _get_indices(values, selected, tolerance):
 
     Maybe tolerance should be part of Select instead of here.
 
+    If lookup is specified, the string values are found with a hash table and
+    the sorted numeric values with a binary search, which give the same
+    results as the loop below but much faster.
     """
+    if lookup is not None:
+        if lookup['labels'] is not None and (tolerance is None or
+                                             values.dtype.kind == 'U'):
+            return _get_indices_from_labels(lookup['labels'], selected)
+
+        if lookup['sorted']:
+            selected = asarray(selected)
+            if selected.dtype.kind in 'iuf':
+                return _get_indices_from_sorted(values, selected, tolerance)
+
     idx_data = []
     idx_output = []
     for idx_of_selected, one_selected in enumerate(selected):
@@ -489,3 +602,180 @@ def _get_indices(values, selected, tolerance):
             idx_output.append(idx_of_selected)
 
     return idx_data, idx_output
+
+
+def _create_lookup(values):
+    """Create a lookup to find the indices of the values in one axis.
+
+    Parameters
+    ----------
+    values : ndarray (any dtype)
+        values present in the axis.
+
+    Returns
+    -------
+    dict
+        with keys:
+            - labels : dict (for string axes) from value to first index,
+              otherwise None
+            - sorted : bool, if the values are numeric and sorted
+    """
+    lookup = {'labels': None,
+              'sorted': False,
+              }
+    if values.dtype.kind in 'US':
+        labels = {}
+        for i, value in enumerate(values):
+            labels.setdefault(value, i)
+        lookup['labels'] = labels
+
+    elif values.dtype.kind in 'iuf' and values.ndim == 1 and len(values) > 0:
+        lookup['sorted'] = bool((diff(values) >= 0).all())
+
+    return lookup
+
+
+def _axis_key(values):
+    """Key to find the trials with the same values in one axis, without
+    hashing all the values.
+
+    Parameters
+    ----------
+    values : ndarray (any dtype)
+        values present in the axis.
+
+    Returns
+    -------
+    tuple
+        dtype, number of values, first and last value. Arrays with the same
+        key still need to be compared (see _same_axis).
+    """
+    if len(values) == 0:
+        return values.dtype.str, 0
+    return values.dtype.str, len(values), values[0], values[-1]
+
+
+def _same_axis(values0, values1):
+    """Check if two axes (with the same key) have the same values."""
+    return values0 is values1 or array_equal(values0, values1)
+
+
+def _get_indices_from_labels(labels, selected):
+    """Get indices of the selected values from a dict of labels."""
+    idx_data = []
+    idx_output = []
+    for idx_of_selected, one_selected in enumerate(selected):
+        idx_of_data = labels.get(one_selected)
+        if idx_of_data is not None:
+            idx_data.append(idx_of_data)
+            idx_output.append(idx_of_selected)
+
+    return asarray(idx_data, dtype=int), asarray(idx_output, dtype=int)
+
+
+def _get_indices_from_sorted(values, selected, tolerance):
+    """Get indices of the selected values from sorted numeric values.
+
+    It returns the first index which matches the selected value (or which is
+    within tolerance), as _get_indices does.
+    """
+    n_values = len(values)
+
+    if tolerance is None:
+        idx = searchsorted(values, selected)
+        idx_clipped = minimum(idx, n_values - 1)
+        found = (idx < n_values) & (values[idx_clipped] == selected)
+        idx_data = idx_clipped
+
+    else:
+        idx = searchsorted(values, selected - tolerance)
+        idx_prev = maximum(idx - 1, 0)  # only valid if idx > 0
+        idx_clipped = minimum(idx, n_values - 1)
+        found_prev = ((idx > 0) &
+                      (abs(values[idx_prev] - selected) <= tolerance))
+        found_this = ((idx < n_values) &
+                      (abs(values[idx_clipped] - selected) <= tolerance))
+        found = found_prev | found_this
+        idx_data = where(found_prev, idx_prev, idx_clipped)
+
+    return idx_data[found], flatnonzero(found)
+
+
+def _select_as_view(dat, idx_data, output_shape):
+    """Return a view of the data, if the selection is a contiguous block.
+
+    Parameters
+    ----------
+    dat : ndarray
+        data of one trial
+    idx_data : list of ndarray or slice or None
+        for each axis, indices of the selected values (None means all)
+    output_shape : list of int
+        for each axis, number of values which were selected
+
+    Returns
+    -------
+    ndarray or None
+        view of dat, or None if the selection cannot be a basic slice (f.e.
+        some values were not found, or they are not contiguous)
+    """
+    index = []
+    for idx, n_values in zip(idx_data, output_shape):
+        if idx is None:
+            index.append(slice(None))
+            continue
+        if isinstance(idx, slice):
+            index.append(idx)
+            continue
+
+        if len(idx) == 0 or len(idx) != n_values:
+            return None
+        if len(idx) > 1 and not (diff(idx) == 1).all():
+            return None
+        index.append(slice(idx[0], idx[0] + len(idx)))
+
+    return dat[tuple(index)]
+
+
+def _select_from_indices(dat, idx_data, idx_output, output_shape, copy=True):
+    """Select the data of one trial, based on the indices of each axis.
+
+    Parameters
+    ----------
+    dat : ndarray
+        data of one trial
+    idx_data : list of ndarray or slice or None
+        for each axis, indices of the selected values (None means all)
+    idx_output : list of ndarray or None
+        for each axis, position of the selected values in the output
+    output_shape : list of int
+        for each axis, number of values which were selected
+    copy : bool
+        if False, it returns a view of dat, if the selection is a contiguous
+        block (see _select_as_view)
+
+    Returns
+    -------
+    ndarray
+        selected data, with NaN for values which were not found
+    """
+    view = _select_as_view(dat, idx_data, output_shape)
+    if view is not None:
+        if copy:
+            return view.copy()
+        return view
+
+    idx_data = [arange(n) if idx is None else idx
+                for idx, n in zip(idx_data, output_shape)]
+    idx_data = [arange(idx.start, idx.stop) if isinstance(idx, slice) else idx
+                for idx in idx_data]
+    idx_output = [arange(n) if idx is None else idx
+                  for idx, n in zip(idx_output, output_shape)]
+
+    output = empty(output_shape, dtype=dat.dtype)
+    output.fill(NaN)
+
+    if all([len(x) > 0 for x in idx_data]):
+        output[ix_(*idx_output)] = dat[ix_(*idx_data)]
+
+    return output
@@ -7,9 +7,10 @@ from numpy import (absolute, arange, argmax, argmin, asarray, concatenate, cos,
                    square, std, vstack, where, zeros)
 from scipy.ndimage.filters import gaussian_filter
 from scipy.signal import (argrelmax, butter, cheby2, filtfilt, fftconvolve,
-                          hilbert, periodogram, tukey)
+                          periodogram, tukey)
 
 from ..graphoelement import Spindles
+from ..trans.envelope import hilbert
 
 lg = getLogger(__name__)
 MAX_FREQUENCY_OF_INTEREST = 50
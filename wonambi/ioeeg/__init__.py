@@ -9,7 +9,8 @@ from .egimff import EgiMff
 from .moberg import Moberg
 from .mnefiff import write_mnefiff
 from .fieldtrip import FieldTrip, write_fieldtrip
-from .wonambi import Wonambi, write_wonambi
+from .wonambi import Wonambi, WonambiWriter, write_wonambi
+from .chunked import Chunked, ChunkedWriter, write_chunked
 from .micromed import Micromed
 from .bci2000 import BCI2000
 from .text import Text
@@ -1,24 +1,21 @@
-from os import SEEK_CUR, SEEK_SET, SEEK_END
+from os import SEEK_END
 from re import search, finditer, match
 from datetime import datetime
 
-from numpy import (fromfile,
-                   fromstring,
-                   asmatrix,
-                   array,
+from numpy import (array,
                    arange,
-                   c_,
                    diff,
                    empty,
                    hstack,
+                   int64,
+                   memmap,
                    ndarray,
                    NaN,
-                   vstack,
                    where,
                    dtype,
-                   float64,
                    int32,
                    uint8,
+                   zeros,
                    )
 
 STATEVECTOR = ['Name', 'Length',  'Value', 'ByteLocation', 'BitLocation']
@@ -34,6 +31,15 @@ class BCI2000:
     """
     def __init__(self, filename):
         self.filename = filename
+        self._memmap = None
+        self._states = {}
+
+    def __getstate__(self):
+        """Pickle without the memory-mapped file and the decoded states."""
+        state = self.__dict__.copy()
+        state['_memmap'] = None
+        state['_states'] = {}
+        return state
 
     def return_hdr(self):
         """Return the header for further use.
@@ -89,7 +95,10 @@ class BCI2000:
         self.n_samples = n_samples
         self.statevectors = _prepare_statevectors(orig['StateVector'])
         # TODO: a better way to parse header
-        self.gain = array([float(x) for x in orig['Parameter']['SourceChGain'].split(' ')[1:]])
+        self.gain = _read_calibration(orig, 'SourceChGain', nchan, 1)
+        self.offset = _read_calibration(orig, 'SourceChOffset', nchan, 0)
+        self._memmap = None
+        self._states = {}
 
         return subj_id, start_time, s_freq, chan_name, n_samples, orig
 
@@ -109,41 +118,28 @@ class BCI2000:
         -------
         numpy.ndarray
             A 2d matrix, with dimension chan X samples
-        """
-        dat_begsam = max(begsam, 0)
-        dat_endsam = min(endsam, self.n_samples)
-        dur = dat_endsam - dat_begsam
-
-        dtype_onlychan = dtype({k: v for k, v in self.dtype.fields.items() if v[0].kind != 'S'})
-
-        # make sure we read some data at least, otherwise segfault
-        if dat_begsam < self.n_samples and dat_endsam > 0:
-
-            with self.filename.open('rb') as f:
-                f.seek(self.header_len, SEEK_SET)  # skip header
-
-                f.seek(self.dtype.itemsize * dat_begsam, SEEK_CUR)
-                dat = fromfile(f, dtype=self.dtype, count=dur)
-
-            dat = ndarray(dat.shape, dtype_onlychan, dat, 0, dat.strides).view((dtype_onlychan[0], len(dtype_onlychan.names))).T
 
-        else:
-            n_chan = len(dtype_onlychan.names)
-            dat = empty((n_chan, 0))
-
-        if begsam < 0:
+        Notes
+        -----
+        The file is memory-mapped and only the selected channels are converted
+        to float and calibrated ((value - offset) * gain).
+        """
+        chan = array(chan).reshape(-1)
 
-            pad = empty((dat.shape[0], 0 - begsam))
-            pad.fill(NaN)
-            dat = c_[pad, dat]
+        dat = empty((len(chan), endsam - begsam))
+        dat.fill(NaN)
 
-        if endsam >= self.n_samples:
+        first = max(begsam, 0)
+        last = min(endsam, self.n_samples)
+        if first >= last:
+            return dat
 
-            pad = empty((dat.shape[0], endsam - self.n_samples))
-            pad.fill(NaN)
-            dat = c_[dat, pad]
+        dat[:, first - begsam:last - begsam] = self._channels()[first:last,
+                                                                chan].T
+        dat -= self.offset[chan, None]
+        dat *= self.gain[chan, None]
 
-        return dat[chan, :] * self.gain[chan][:, None]  # apply gain
+        return dat
 
     def return_markers(self, state='MicromedCode'):
         """Return all the markers (also called triggers or events).
@@ -161,16 +157,13 @@ class BCI2000:
             when it cannot read the events for some reason (don't use other
             exceptions).
         """
-        markers = []
-        try:
-            all_states = self._read_states()
-        except ValueError:  # cryptic error when reading states
-            return markers
+        if self.n_samples == 0:
+            return []
 
         try:
-            x = all_states[state]
+            x = self.return_state(state)
         except KeyError:
-            return markers
+            return []
 
         markers = []
         i_mrk = hstack((0, where(diff(x))[0] + 1, len(x)))
@@ -183,25 +176,59 @@ class BCI2000:
 
         return markers
 
-    def _read_states(self):
-
-        all_states = []
-        with self.filename.open('rb') as f:
-            f.seek(self.header_len, SEEK_SET)  # skip header
-            StatevectorOffset = self.dtype.itemsize - self.statevector_len
+    def return_state(self, state):
+        """Return the values of one state, for each sample.
 
-            for i in range(self.n_samples):
-                f.seek(StatevectorOffset, SEEK_CUR)
-                raw_statevector = f.read(self.statevector_len)
-                all_states.append(fromstring(raw_statevector, dtype='<u1'))
+        Parameters
+        ----------
+        state : str
+            name of the state (as in the StateVector of the header)
 
-        all_states = vstack(all_states).T
+        Returns
+        -------
+        ndarray of int32
+            value of the state for each sample
 
-        states = {}
-        for statename, statedef in self.statevectors.items():
-            states[statename] = array(statedef['mult'] * asmatrix(all_states[statedef['slice'], :] & statedef['mask']), dtype=int32).squeeze()
+        Raises
+        ------
+        KeyError
+            if the state does not exist
 
-        return states
+        Notes
+        -----
+        The states are decoded only when they are requested (and then kept in
+        memory).
+        """
+        if state not in self._states:
+            statedef = self.statevectors[state]
+            x = self._statevector()[:, statedef['slice']] & statedef['mask']
+            x = x.astype(int64) << (8 * arange(x.shape[1]))
+            self._states[state] = (x.sum(axis=1) >>
+                                   statedef['shift']).astype(int32)
+
+        return self._states[state]
+
+    def _get_memmap(self):
+        """Memory-map the file as bytes (only the first time)."""
+        if self._memmap is None:
+            self._memmap = memmap(str(self.filename), dtype=uint8, mode='r')
+        return self._memmap
+
+    def _channels(self):
+        """Strided view of the data (samples x channels), without states."""
+        n_chan = len(self.dtype.names) - 1
+        chan_dtype = self.dtype[0]
+        return ndarray((self.n_samples, n_chan), chan_dtype,
+                       buffer=self._get_memmap(), offset=self.header_len,
+                       strides=(self.dtype.itemsize, chan_dtype.itemsize))
+
+    def _statevector(self):
+        """Strided view of the bytes of the state vector (samples x bytes)."""
+        return ndarray((self.n_samples, self.statevector_len), uint8,
+                       buffer=self._get_memmap(),
+                       offset=(self.header_len + self.dtype.itemsize -
+                               self.statevector_len),
+                       strides=(self.dtype.itemsize, 1))
 
 
 def _read_header(filename):
@@ -272,6 +299,16 @@ def _read_header_text(filename):
     return header
 
 
+def _read_calibration(orig, param, n_chan, default):
+    """Read the gain or offset of each channel (the first value is the number
+    of channels)."""
+    try:
+        values = orig['Parameter'][param].split(' ')[1:]
+    except KeyError:
+        return zeros(n_chan) + default
+    return array([float(x) for x in values])
+
+
 def _prepare_statevectors(sv):
 
     statedefs = {}
@@ -283,16 +320,14 @@ def _prepare_statevectors(sv):
         nbytes    = (startbit + nbits) // 8
         if (startbit + nbits) % 8:
             nbytes += 1
-        extrabits = int(nbytes * 8) - nbits - startbit;
+        extrabits = int(nbytes * 8) - nbits - startbit
         startmask = 255 & (255 << startbit)
         endmask   = 255 & (255 >> extrabits)
-        div       = (1 << startbit);
         v['slice'] = slice(startbyte, startbyte + nbytes)
         v['mask'] = array([255] * nbytes, dtype=uint8)
         v['mask'][0]  &= startmask
         v['mask'][-1] &= endmask
-        v['mask'].shape = (nbytes, 1)
-        v['mult'] = asmatrix(256.0 ** arange(nbytes, dtype=float64) / float(div))
+        v['shift'] = startbit
         statedefs[v['Name']] = v
 
     return statedefs
@@ -4,14 +4,16 @@ from os import SEEK_SET, SEEK_CUR, SEEK_END
 from os.path import splitext
 from struct import unpack
 
-from numpy import (asarray, empty, expand_dims, fromfile, iinfo, NaN, ones,
-                   reshape, where)
+from numpy import (asarray, dtype, empty, expand_dims, fromfile, iinfo,
+                   memmap, NaN, ones, reshape, where)
 
 lg = getLogger(__name__)
 
 BLACKROCK_FORMAT = 'int16'  # by definition
 blackrock_iinfo = iinfo(BLACKROCK_FORMAT)
 N_BYTES = int(blackrock_iinfo.bits / 8)
+DIGITAL_PACKET_ID = 0  # packet ID of digital (and serial) events in NEV
+MAX_ELECTRODE_ID = 2048  # packet IDs of spikes are the electrode IDs
 
 
 class BlackRock:
@@ -165,6 +167,21 @@ class BlackRock:
 
         return markers_no_zero
 
+    def return_spikes(self):
+        """Return the spikes stored in the NEV file.
+
+        Returns
+        -------
+        dict of ndarray
+            'time' (in s), 'electrode' (electrode ID) and 'unit' (unit
+            classification) of each spike
+        """
+        nev_file = splitext(self.filename)[0] + '.nev'
+        disable(WARNING)
+        hdr = _read_neuralev(nev_file)
+        disable(NOTSET)
+        return _read_spikes(nev_file, hdr)
+
 
 def _read_nsx(filename, BOData, sess_begin, sess_end, factor, begsam, endsam):
     """
@@ -528,51 +545,126 @@ def _read_neuralev(filename, read_markers=False, trigger_bits=16,
         fExtendedHeader = f.tell()
         fData = f.seek(0, SEEK_END)
         countDataPacket = int((fData - fExtendedHeader) / hdr['PacketBytes'])
+        hdr['DataPacketOffset'] = fExtendedHeader
+        hdr['countDataPacket'] = countDataPacket
 
-        markers = []
-        if read_markers and countDataPacket:
+    markers = []
+    if read_markers and countDataPacket:
+        packets = _read_nev_packets(filename, fExtendedHeader,
+                                    countDataPacket, hdr['PacketBytes'])
+        markers = _nev_markers(packets, hdr['SampleRes'], trigger_bits)
 
-            f.seek(fExtendedHeader)
-            x = f.read(countDataPacket * hdr['PacketBytes'])
+    if read_markers:
+        return markers
+    else:
+        return hdr
 
-            DigiValues = []
-            for j in range(countDataPacket):
-                i = j * hdr['PacketBytes']
 
-                if trigger_bits == 16:
-                    tempDigiVals = unpack('<H', x[8 + i:10 + i])[0]
-                else:
-                    tempDigiVals = unpack('<H', x[8 + i:9 + i] + b'\x00')[0]
+def _read_nev_packets(filename, offset, n_packets, packet_bytes):
+    """Memory-map the data packets of a NEV file.
 
-                val = {'timestamp': unpack('<I', x[0 + i:4 + i])[0],
-                       'packetID': unpack('<H', x[4 + i:6 + i])[0],
-                       'tempClassOrReason': unpack('<B', x[6 + i:7 + i])[0],
-                       'tempDigiVals': tempDigiVals}
+    Parameters
+    ----------
+    filename : str
+        path to NEV file
+    offset : int
+        position of the first data packet (after the extended headers)
+    n_packets : int
+        number of data packets
+    packet_bytes : int
+        size of each packet in bytes
 
-                if tempDigiVals != 0 or False:
-                    DigiValues.append(val)
+    Returns
+    -------
+    memmap
+        structured array, with fields 'timestamp', 'packetID', 'class' (which
+        is the unit for spikes and the reason for digital events) and
+        'digital' (the digital value, only meaningful for digital events)
+    """
+    packet_dtype = dtype({'names': ['timestamp', 'packetID', 'class',
+                                    'digital'],
+                          'formats': ['<u4', '<u2', 'u1', '<u2'],
+                          'offsets': [0, 4, 6, 8],
+                          'itemsize': packet_bytes,
+                          })
+    return memmap(filename, dtype=packet_dtype, mode='r', offset=offset,
+                  shape=(n_packets, ))
 
-            digserPacketID = 0
-            not_serialdigital = [x for x in DigiValues
-                                 if not x['packetID'] == digserPacketID]
 
-            if not_serialdigital:
-                lg.debug('Code not implemented to read PacketID ' +
-                         str(not_serialdigital[0]['packetID']))
+def _nev_markers(packets, sample_res, trigger_bits=16):
+    """Convert the packets with a non-zero digital value into markers.
 
-            # convert to markers
-            for val in DigiValues:
-                m = {'name': str(val['tempDigiVals']),
-                     'start': val['timestamp'] / hdr['SampleRes'],
-                     'end': val['timestamp'] / hdr['SampleRes'],
-                     'chan': [''],
-                     }
-                markers.append(m)
+    Parameters
+    ----------
+    packets : ndarray
+        structured array, as returned by _read_nev_packets
+    sample_res : int
+        resolution of the timestamps (samples per second)
+    trigger_bits : int
+        16 to use the whole digital value, otherwise only the first byte
 
-    if read_markers:
-        return markers
-    else:
-        return hdr
+    Returns
+    -------
+    list of dict
+        markers, with 'name', 'start', 'end', 'chan'
+
+    Notes
+    -----
+    Only the packets with ID 0 are digital events, but the spike packets are
+    not excluded, so that the markers are the same as in previous versions
+    (bytes 8-9 of the spike packets are not always zero).
+    """
+    digital_values = packets['digital']
+    if trigger_bits != 16:
+        digital_values = digital_values & 0xff
+
+    i_event = (digital_values != 0).nonzero()[0]
+    packet_id = packets['packetID'][i_event]
+    not_digital = packet_id[packet_id != DIGITAL_PACKET_ID]
+    if len(not_digital) > 0:
+        lg.debug('Code not implemented to read PacketID ' +
+                 str(not_digital[0]))
+
+    timestamps = packets['timestamp'][i_event] / sample_res
+
+    markers = []
+    for value, t in zip(digital_values[i_event], timestamps):
+        m = {'name': str(value),
+             'start': t,
+             'end': t,
+             'chan': [''],
+             }
+        markers.append(m)
+
+    return markers
+
+
+def _read_spikes(filename, hdr):
+    """Read the spike packets of a NEV file.
+
+    Parameters
+    ----------
+    filename : str
+        path to NEV file
+    hdr : dict
+        header of the NEV file, as returned by _read_neuralev
+
+    Returns
+    -------
+    dict of ndarray
+        'time' (in s), 'electrode' (electrode ID) and 'unit' (unit
+        classification) of each spike
+    """
+    packets = _read_nev_packets(filename, hdr['DataPacketOffset'],
+                                hdr['countDataPacket'], hdr['PacketBytes'])
+    is_spike = ((packets['packetID'] > 0) &
+                (packets['packetID'] <= MAX_ELECTRODE_ID))
+    spikes = packets[is_spike]
+
+    return {'time': spikes['timestamp'] / hdr['SampleRes'],
+            'electrode': spikes['packetID'].astype('u2'),
+            'unit': spikes['class'].astype('u1'),
+            }
 
 
 def _str(t_in):
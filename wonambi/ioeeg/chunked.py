@@ -0,0 +1,435 @@
+"""Chunked format, to read random windows and whole-night overviews quickly.
+
+The recording is stored in a directory, with:
+
+  - chunked.json : header (the same info as the Wonambi format, plus the
+    markers and the size of the chunks)
+  - chunks.dat : the data, divided into chunks of (chan block x time block),
+    each compressed independently with zlib
+  - index.npy : the offset of each chunk in chunks.dat
+  - summary.npz : min, max and RMS of each channel in short consecutive
+    windows, computed when the data is written
+
+To read a window of data, only the chunks containing those channels and
+samples are decompressed. The bytes of each value are shuffled before
+compression (first byte of all the values, then the second byte, etc), which
+compresses much better than the raw floats.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from itertools import chain
+from json import dump, load
+from logging import getLogger
+from pathlib import Path
+from zlib import compress, decompress
+
+from numpy import (arange, asarray, ascontiguousarray, dtype as np_dtype,
+                   empty, frombuffer, hstack, int64, load as np_load, NaN,
+                   save, savez, sqrt, uint8, unique, zeros)
+
+lg = getLogger(__name__)
+
+HEADER_FILE = 'chunked.json'
+DATA_FILE = 'chunks.dat'
+INDEX_FILE = 'index.npy'
+SUMMARY_FILE = 'summary.npz'
+
+CHAN_BLOCK = 16  # number of channels in each chunk
+TIME_BLOCK = 65536  # number of samples in each chunk
+SUMMARY_BLOCK = 1024  # number of samples in each window of the summary
+N_CACHED_CHUNKS = 64
+
+
+class Chunked:
+    """Class to read the data in chunked format.
+
+    Parameters
+    ----------
+    filename : path to directory
+        the name of the directory (containing chunked.json)
+    """
+    def __init__(self, filename):
+        self.filename = Path(filename)
+        self._chunks = OrderedDict()
+        self._summary = None
+
+    def __getstate__(self):
+        """Pickle without the decompressed chunks and the summary."""
+        state = self.__dict__.copy()
+        state['_chunks'] = OrderedDict()
+        state['_summary'] = None
+        return state
+
+    def return_hdr(self):
+        """Return the header for further use.
+
+        Returns
+        -------
+        subj_id : str
+            subject identification code
+        start_time : datetime
+            start time of the dataset
+        s_freq : float
+            sampling frequency
+        chan_name : list of str
+            list of all the channels
+        n_samples : int
+            number of samples in the dataset
+        orig : dict
+            the json file
+        """
+        with (self.filename / HEADER_FILE).open('r') as f:
+            orig = load(f)
+
+        start_time = datetime.strptime(orig['start_time'],
+                                       '%Y-%m-%d %H:%M:%S.%f')
+        self.n_chan = len(orig['chan_name'])
+        self.n_samples = orig['n_samples']
+        self.dtype = np_dtype(orig['dtype'])
+        self.chan_block = orig['chan_block']
+        self.time_block = orig['time_block']
+        self.n_chan_blocks = -(-self.n_chan // self.chan_block)
+        self.offsets = np_load(str(self.filename / INDEX_FILE))
+        self.markers = orig.get('markers', [])
+
+        self._chunks = OrderedDict()
+        self._summary = None
+
+        return (orig['subj_id'], start_time, orig['s_freq'], orig['chan_name'],
+                orig['n_samples'], orig)
+
+    def return_dat(self, chan, begsam, endsam):
+        """Return the data as 2D numpy.ndarray.
+
+        Parameters
+        ----------
+        chan : int or list
+            index (indices) of the channels to read
+        begsam : int
+            index of the first sample
+        endsam : int
+            index of the last sample
+
+        Returns
+        -------
+        numpy.ndarray
+            A 2d matrix, with dimension chan X samples.
+
+        Notes
+        -----
+        When asking for an interval outside the data boundaries, it returns NaN
+        for those values.
+
+        Only the chunks containing the selected channels and samples are
+        decompressed (the last ones are cached).
+        """
+        chan = asarray(chan).reshape(-1)
+
+        dat = empty((len(chan), endsam - begsam))
+        dat.fill(NaN)
+
+        first = max((begsam, 0))
+        last = min((endsam, self.n_samples))
+        if first >= last:
+            return dat
+
+        chan_blk = chan // self.chan_block
+        for c_blk in unique(chan_blk):
+            i_out = (chan_blk == c_blk).nonzero()[0]
+            i_chunk = chan[i_out] - c_blk * self.chan_block
+
+            first_blk = first // self.time_block
+            last_blk = (last - 1) // self.time_block
+            for t_blk in range(first_blk, last_blk + 1):
+                chunk = self._read_chunk(c_blk, t_blk)
+                blk_beg = t_blk * self.time_block
+                i0 = max(first, blk_beg)
+                i1 = min(last, blk_beg + chunk.shape[1])
+                dat[i_out, i0 - begsam:i1 - begsam] = chunk[
+                    i_chunk, i0 - blk_beg:i1 - blk_beg]
+
+        return dat
+
+    def return_markers(self):
+        """Return the markers stored in the header.
+
+        Returns
+        -------
+        list of dict
+            where each dict contains 'name' as str, 'start' and 'end' as float
+            in seconds from the start of the recordings, and 'chan' as list of
+            str with the channels involved (if not of relevance, it's None).
+        """
+        return self.markers
+
+    def return_summary(self, chan):
+        """Return min, max and RMS in short consecutive windows, without
+        reading the data (useful to plot the whole recording).
+
+        Parameters
+        ----------
+        chan : int or list
+            index (indices) of the channels to read
+
+        Returns
+        -------
+        ndarray
+            index of the first sample of each window
+        dict of 2d ndarray
+            'min', 'max' and 'rms' in each window (chan x window)
+        """
+        if self._summary is None:
+            with np_load(str(self.filename / SUMMARY_FILE)) as f:
+                self._summary = {k: f[k] for k in ('start', 'min', 'max',
+                                                   'rms')}
+
+        chan = asarray(chan).reshape(-1)
+        summary = {k: self._summary[k][chan, :] for k in ('min', 'max',
+                                                          'rms')}
+        return self._summary['start'], summary
+
+    def _read_chunk(self, c_blk, t_blk):
+        """Decompress one chunk, keeping the last ones in memory."""
+        key = (c_blk, t_blk)
+        if key in self._chunks:
+            self._chunks.move_to_end(key)
+            return self._chunks[key]
+
+        i = t_blk * self.n_chan_blocks + c_blk
+        with (self.filename / DATA_FILE).open('rb') as f:
+            f.seek(self.offsets[i])
+            raw = f.read(self.offsets[i + 1] - self.offsets[i])
+
+        n_chan = min(self.chan_block, self.n_chan - c_blk * self.chan_block)
+        chunk = _unshuffle(decompress(raw), self.dtype).reshape((n_chan, -1))
+
+        self._chunks[key] = chunk
+        if len(self._chunks) > N_CACHED_CHUNKS:
+            self._chunks.popitem(last=False)
+
+        return chunk
+
+
+class ChunkedWriter:
+    """Write data in chunked format, one piece at the time.
+
+    Parameters
+    ----------
+    filename : path to directory
+        directory to export to (it's created if it doesn't exist)
+    chan_name : list of str
+        names of the channels
+    s_freq : float
+        sampling frequency
+    start_time : datetime
+        start time of the recordings
+    subj_id : str
+        subject id
+    markers : list of dict, optional
+        markers, with 'name', 'start', 'end', 'chan' (as returned by
+        Dataset.read_markers)
+    dtype : str
+        numpy (float) dtype in which you want to save the data
+    chan_block : int
+        number of channels in each chunk
+    time_block : int
+        number of samples in each chunk
+    summary_block : int
+        number of samples in each window of the summary (time_block should be
+        a multiple of summary_block)
+
+    Notes
+    -----
+    The header, the index and the summary are written when the writer is
+    closed (it's better to use it as context manager).
+
+    >>> with ChunkedWriter(filename, chan_name, s_freq, start_time) as w:
+    >>>     for piece in pieces:
+    >>>         w.write(piece)
+    """
+    def __init__(self, filename, chan_name, s_freq, start_time, subj_id='',
+                 markers=None, dtype='float32', chan_block=CHAN_BLOCK,
+                 time_block=TIME_BLOCK, summary_block=SUMMARY_BLOCK):
+        if np_dtype(dtype).kind != 'f':
+            raise ValueError('Chunked format only supports float dtypes')
+        if time_block % summary_block != 0:
+            raise ValueError('time_block should be a multiple of '
+                             'summary_block')
+
+        self.filename = Path(filename)
+        self.filename.mkdir(parents=True, exist_ok=True)
+
+        if markers is None:
+            markers = []
+        self.dataset = {'subj_id': subj_id,
+                        'start_time': start_time.strftime(
+                            '%Y-%m-%d %H:%M:%S.%f'),
+                        's_freq': float(s_freq),
+                        'chan_name': list(chan_name),
+                        'n_samples': 0,
+                        'dtype': np_dtype(dtype).str,
+                        'chan_block': chan_block,
+                        'time_block': time_block,
+                        'summary_block': summary_block,
+                        'markers': [_marker_to_json(m) for m in markers],
+                        }
+
+        self._offsets = [0, ]
+        self._summary = []
+        self._buffer = None
+        self._f = (self.filename / DATA_FILE).open('wb')
+
+    def write(self, dat):
+        """Append one piece of data.
+
+        Parameters
+        ----------
+        dat : ndarray or instance of ChanTime
+            data (chan x time) to append (ChanTime with only one trial)
+        """
+        if hasattr(dat, 'axis'):
+            dat = dat.data[0]
+
+        if self._buffer is not None:
+            dat = hstack((self._buffer, dat))
+            self._buffer = None
+
+        time_block = self.dataset['time_block']
+        n_blocks = dat.shape[1] // time_block
+        for blk in range(n_blocks):
+            self._write_block(dat[:, blk * time_block:(blk + 1) * time_block])
+
+        if dat.shape[1] > n_blocks * time_block:
+            self._buffer = dat[:, n_blocks * time_block:]
+
+    def _write_block(self, dat):
+        """Write the chunks of all the channels for one time block."""
+        dat = dat.astype(self.dataset['dtype'])
+        chan_block = self.dataset['chan_block']
+        for c0 in range(0, dat.shape[0], chan_block):
+            self._f.write(compress(_shuffle(dat[c0:c0 + chan_block, :])))
+            self._offsets.append(self._f.tell())
+
+        self._summary.append(_summarize(dat, self.dataset['summary_block']))
+        self.dataset['n_samples'] += dat.shape[1]
+
+    def close(self):
+        """Write the last (incomplete) block, the index, the summary and the
+        header."""
+        if self._buffer is not None:
+            self._write_block(self._buffer)
+            self._buffer = None
+        self._f.close()
+
+        save(str(self.filename / INDEX_FILE), asarray(self._offsets,
+                                                      dtype=int64))
+
+        n_chan = len(self.dataset['chan_name'])
+        summary_block = self.dataset['summary_block']
+        if self._summary:
+            summary = {k: hstack([s[k] for s in self._summary])
+                       for k in ('min', 'max', 'rms')}
+        else:
+            summary = {k: zeros((n_chan, 0)) for k in ('min', 'max', 'rms')}
+        summary['start'] = arange(summary['min'].shape[1]) * summary_block
+        savez(str(self.filename / SUMMARY_FILE), **summary)
+
+        with (self.filename / HEADER_FILE).open('w') as f:
+            dump(self.dataset, f, sort_keys=True, indent=4)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_chunked(data, filename, subj_id='', markers=None, **options):
+    """Write data in chunked format.
+
+    Parameters
+    ----------
+    data : instance of ChanTime or iterable of ChanTime
+        data with only one trial, or consecutive pieces of data (each piece
+        is a ChanTime with only one trial)
+    filename : path to directory
+        directory to export to
+    subj_id : str
+        subject id
+    markers : list of dict, optional
+        markers, with 'name', 'start', 'end', 'chan'
+    **options
+        options passed to ChunkedWriter (dtype, chan_block, time_block,
+        summary_block)
+
+    Notes
+    -----
+    It will happily overwrite any existing file with the same name.
+    """
+    if hasattr(data, 'axis'):
+        pieces = (data, )
+    else:
+        pieces = iter(data)
+        data = next(pieces)
+        pieces = chain((data, ), pieces)
+
+    start_time = data.start_time + timedelta(seconds=data.axis['time'][0][0])
+
+    with ChunkedWriter(filename, chan_name=data.axis['chan'][0],
+                       s_freq=data.s_freq, start_time=start_time,
+                       subj_id=subj_id, markers=markers,
+                       **options) as writer:
+        for piece in pieces:
+            writer.write(piece)
+
+
+def _shuffle(x):
+    """Group the bytes of the values (all the first bytes, then all the
+    second bytes, etc.), so that they compress better."""
+    x = ascontiguousarray(x)
+    return x.view(uint8).reshape((-1, x.dtype.itemsize)).T.tobytes()
+
+
+def _unshuffle(raw, dtype):
+    """Inverse of _shuffle, returns 1d array."""
+    x = frombuffer(raw, dtype=uint8).reshape((dtype.itemsize, -1))
+    return ascontiguousarray(x.T).view(dtype).reshape(-1)
+
+
+def _summarize(dat, summary_block):
+    """Compute min, max and RMS in consecutive windows (the last one can be
+    shorter)."""
+    dat = dat.astype('float64')
+    n_chan, n_smp = dat.shape
+    n_win = -(-n_smp // summary_block)
+
+    padded = empty((n_chan, n_win * summary_block))
+    padded[:, :n_smp] = dat
+    # repeat the last value, so that it doesn't change min and max
+    padded[:, n_smp:] = dat[:, -1:]
+    padded = padded.reshape((n_chan, n_win, summary_block))
+
+    sum_sq = zeros((n_chan, n_win * summary_block))
+    sum_sq[:, :n_smp] = dat ** 2
+    n_in_win = zeros(n_win) + summary_block
+    n_in_win[-1] = n_smp - (n_win - 1) * summary_block
+    rms = sqrt(sum_sq.reshape((n_chan, n_win, summary_block)).sum(axis=2) /
+               n_in_win)
+
+    return {'min': padded.min(axis=2),
+            'max': padded.max(axis=2),
+            'rms': rms,
+            }
+
+
+def _marker_to_json(marker):
+    """Convert the values of one marker to types which can be stored in
+    json."""
+    chan = marker.get('chan', None)
+    if chan is not None and not isinstance(chan, str):
+        chan = list(chan)
+    return {'name': str(marker['name']),
+            'start': float(marker['start']),
+            'end': float(marker['end']),
+            'chan': chan,
+            }
@@ -3,20 +3,27 @@
 from logging import getLogger
 
 from datetime import datetime, timedelta
+from itertools import chain
+from math import ceil, fabs, floor, log10
 from pathlib import Path
 from re import findall, finditer
-from struct import pack
 
 from numpy import (abs,
                    asarray,
+                   clip,
                    empty,
+                   frombuffer,
                    fromfile,
+                   hstack,
                    iinfo,
                    ones,
                    max,
                    NaN,
                    newaxis,
                    repeat,
+                   rint,
+                   unique,
+                   zeros,
                    )
 
 from .utils import decode, _select_blocks
@@ -30,6 +37,8 @@ DIGITAL_MAX = edf_iinfo.max
 DIGITAL_MIN = -1 * edf_iinfo.max  # so that digital 0 = physical 0
 
 ANNOT_NAME = 'EDF Annotations'
+N_RECORDS_POS = 236  # position of the number of records in the header
+CHUNK_RECORDS = 60  # number of records to read at once from a Dataset
 PATTERN = b'(?P<onset>[+\-]\d+(?:\.\d*)?)(?:\x15(?P<duration>\d+(?:\.\d*)?))?(\x14(?P<annotation>[^\x00]*))?(?:\x14\x00)'
 
 
@@ -137,7 +146,9 @@ class Edf:
 
         self.smp_in_blk = sum(self.hdr['n_samples_per_record'])
 
-        self.max_smp = max(self.hdr['n_samples_per_record'])
+        self.max_smp = max([n_smp for n_smp, label in
+                            zip(self.hdr['n_samples_per_record'],
+                                self.hdr['label']) if label != ANNOT_NAME])
         n_blocks = self.hdr['n_records']
         self.blocks = ones(n_blocks, dtype='int') * self.max_smp
 
@@ -244,7 +255,7 @@ class Edf:
             for blk in range(self.hdr['n_records']):
                 offset, n_smp_per_chan = self._offset(blk, self.i_annot)
                 f.seek(offset)
-                annotations.extend(_read_tal(f.read(n_smp_per_chan)))
+                annotations.extend(_read_tal(f.read(n_smp_per_chan * N_BYTES)))
 
         markers = []
         for annot in annotations:
@@ -259,20 +270,35 @@ class Edf:
         return markers
 
 
-def write_edf(data, filename, subj_id='X X X X', physical_max=1000):
-    """Export data to FieldTrip.
+def write_edf(data, filename, subj_id='X X X X', physical_max=1000,
+              physical_min=None, markers=None, chan=None):
+    """Export data to EDF (or EDF+, if there are markers).
 
     Parameters
     ----------
-    data : instance of ChanTime
-        data with only one trial
+    data : instance of ChanTime or Dataset or iterable of ChanTime
+        data with only one trial. It can also be a Dataset (which is read in
+        chunks) or an iterable with consecutive chunks of data (each chunk is
+        a ChanTime with only one trial), so that the whole recording does not
+        need to be in memory.
     filename : path to file
-        file to export to (include '.mat')
+        file to export to (include '.edf')
     subj_id : str
         subject id
-    physical_max : int
-        values above this parameter will be considered saturated (and also
-        those that are too negative). This parameter defines the precision.
+    physical_max : int or list of int
+        values above this parameter will be considered saturated. This
+        parameter defines the precision. It can be one value for all the
+        channels or one value per channel. If None, it uses the max absolute
+        value of each channel (only if data is ChanTime).
+    physical_min : int or list of int
+        values below this parameter will be considered saturated (default:
+        -physical_max)
+    markers : list of dict, optional
+        markers to write as EDF+ annotations, where each dict has 'name',
+        'start', 'end' (in s from the beginning of the data), like the output
+        of Dataset.read_markers
+    chan : list of str, optional
+        channels to export, only if data is Dataset (default: all channels)
 
     Notes
     -----
@@ -280,74 +306,327 @@ def write_edf(data, filename, subj_id='X X X X', physical_max=1000):
     limited. You can control the precision with physical_max. To get the
     precision:
 
-    >>> precision = physical_max / DIGITAL_MAX
+    >>> precision = (physical_max - physical_min) / (DIGITAL_MAX - DIGITAL_MIN)
 
-    where DIGITAL_MAX is 32767.
+    where DIGITAL_MAX is 32767 and DIGITAL_MIN is -32767. physical_max and
+    physical_min are rounded (outwards) to fit in the 8 characters of the
+    header.
+
+    Each data record is 1 s long. If the number of samples is not a multiple
+    of the sampling frequency, the last record is padded with zeros.
+
+    The records are written directly from the digital values of each chunk,
+    the number of records in the header is updated at the end.
     """
-    if data.start_time is None:
+    chunks, header = _edf_chunks(data, chan)
+    if header['start_time'] is None:
         raise ValueError('Data should contain a valid start_time (as datetime)')
-    start_time = data.start_time + timedelta(seconds=data.axis['time'][0][0])
+
+    s_freq = int(header['s_freq'])
+    n_chan = len(header['chan_name'])
 
     if physical_max is None:
-        physical_max = max(abs(data.data[0]))
+        if not isinstance(chunks, tuple):
+            raise ValueError('physical_max can be None only if data is '
+                             'ChanTime')
+        physical_max = max(abs(chunks[0].data[0]), axis=1)
+    phys_max = ones(n_chan) * asarray(physical_max, dtype='float64')
+    if physical_min is None:
+        phys_min = -1 * phys_max
+    else:
+        phys_min = ones(n_chan) * asarray(physical_min, dtype='float64')
+
+    # use the values as they are written in the header (8 characters), so that
+    # the gain is the same when the file is read
+    phys_max = asarray([float(_format_edf_number(x, 1)) for x in phys_max])
+    phys_min = asarray([float(_format_edf_number(x, -1)) for x in phys_min])
+    flat = phys_max <= phys_min
+    if flat.any():
+        lg.warning('physical_max is not larger than physical_min for ' +
+                   ', '.join(asarray(header['chan_name'])[flat]) +
+                   ', using a range of 1')
+        phys_max[flat] = [float(_format_edf_number(x, 1))
+                          for x in phys_min[flat] + 1]
+
+    precision = (phys_max - phys_min) / (DIGITAL_MAX - DIGITAL_MIN)
+    lg.info('Data exported to EDF will have precision ' +
+            ', '.join('{:.3g}'.format(x) for x in unique(precision)))
+    gain = ((DIGITAL_MAX - DIGITAL_MIN) / (phys_max - phys_min))[:, newaxis]
+
+    if markers is not None:
+        tals = _create_tals(markers)
+        n_annot_smp = _compute_n_annot_smp(tals)
+    else:
+        tals = None
+        n_annot_smp = 0
 
-    precision = physical_max / DIGITAL_MAX
-    lg.info('Data exported to EDF will have precision ' + str(precision))
+    with open(filename, 'wb') as f:
+        _write_edf_header(f, header, subj_id, s_freq, phys_min, phys_max,
+                          n_annot_smp)
+
+        n_records = 0
+        leftover = empty((n_chan, 0), dtype=EDF_FORMAT)
+        for chunk in chunks:
+            dat = (chunk.data[0] - phys_min[:, newaxis]) * gain + DIGITAL_MIN
+            dat = rint(clip(dat, DIGITAL_MIN, DIGITAL_MAX)).astype(EDF_FORMAT)
+            dat = hstack((leftover, dat))
+
+            n_rec_in_chunk = dat.shape[1] // s_freq
+            leftover = dat[:, n_rec_in_chunk * s_freq:]
+            _write_records(f, dat[:, :n_rec_in_chunk * s_freq], s_freq,
+                           n_records, tals, n_annot_smp)
+            n_records += n_rec_in_chunk
+
+        if leftover.shape[1] > 0:
+            lg.info('Padding last record with ' +
+                    str(s_freq - leftover.shape[1]) + ' samples')
+            dat = zeros((n_chan, s_freq), dtype=EDF_FORMAT)
+            dat[:, :leftover.shape[1]] = leftover
+            _write_records(f, dat, s_freq, n_records, tals, n_annot_smp)
+            n_records += 1
+
+        if tals is not None and any(i >= n_records for i in tals):
+            lg.warning('Some markers are after the end of the data and they '
+                       'were not exported')
+
+        f.seek(N_RECORDS_POS)
+        f.write('{:<8}'.format(n_records).encode('ascii'))
 
-    physical_min = -1 * physical_max
-    dat = data.data[0] / physical_max * DIGITAL_MAX
-    dat = dat.astype(EDF_FORMAT)
-    dat[dat > DIGITAL_MAX] = DIGITAL_MAX
-    dat[dat < DIGITAL_MIN] = DIGITAL_MIN
 
-    with open(filename, 'wb') as f:
-        f.write('{:<8}'.format(0).encode('ascii'))
-        f.write('{:<80}'.format(subj_id).encode('ascii'))  # subject_id
-        f.write('{:<80}'.format('Startdate X X X X').encode('ascii'))
-        f.write(start_time.strftime('%d.%m.%y').encode('ascii'))
-        f.write(start_time.strftime('%H.%M.%S').encode('ascii'))
-
-        n_smp = data.data[0].shape[1]
-        s_freq = int(data.s_freq)
-        n_records = n_smp // s_freq  # floor
-        record_length = 1
-        n_channels = data.number_of('chan')[0]
-
-        header_n_bytes = 256 + 256 * n_channels
-        f.write('{:<8d}'.format(header_n_bytes).encode('ascii'))
+def _edf_chunks(data, chan=None):
+    """Return the chunks of data to write and the general information.
+
+    Returns
+    -------
+    tuple or generator of ChanTime
+        chunks of data
+    dict
+        with 'start_time', 's_freq', 'chan_name'
+    """
+    if hasattr(data, 'read_data'):  # Dataset
+        if chan is None:
+            chan = data.header['chan_name']
+        header = {'start_time': data.header['start_time'],
+                  's_freq': data.header['s_freq'],
+                  'chan_name': chan,
+                  }
+        return _read_dataset_in_chunks(data, chan), header
+
+    if hasattr(data, 'axis'):  # ChanTime
+        chunks = (data, )
+    else:
+        chunks = iter(data)
+        first_chunk = next(chunks)
+        chunks = chain((first_chunk, ), chunks)
+        data = first_chunk
+
+    start_time = data.start_time
+    if start_time is not None:
+        start_time += timedelta(seconds=data.axis['time'][0][0])
+    header = {'start_time': start_time,
+              's_freq': data.s_freq,
+              'chan_name': list(data.axis['chan'][0]),
+              }
+    return chunks, header
+
+
+def _read_dataset_in_chunks(dataset, chan):
+    n_samples = dataset.header['n_samples']
+    chunk_size = int(dataset.header['s_freq']) * CHUNK_RECORDS
+    for begsam in range(0, n_samples, chunk_size):
+        endsam = min(begsam + chunk_size, n_samples)
+        yield dataset.read_data(chan=chan, begsam=begsam, endsam=endsam)
+
+
+def _write_edf_header(f, header, subj_id, s_freq, phys_min, phys_max,
+                      n_annot_smp):
+    """Write the header of the EDF file, the number of records (-1) needs to
+    be updated at the end."""
+    start_time = header['start_time']
+    labels = list(header['chan_name'])
+    if n_annot_smp > 0:
+        labels.append(ANNOT_NAME)
+    n_channels = len(labels)
+    n_smp = [s_freq] * len(header['chan_name'])
+    phys_min = [_format_edf_number(x) for x in phys_min]
+    phys_max = [_format_edf_number(x) for x in phys_max]
+    dig_min = [DIGITAL_MIN] * len(header['chan_name'])
+    dig_max = [DIGITAL_MAX] * len(header['chan_name'])
+
+    if n_annot_smp > 0:
+        n_smp.append(n_annot_smp)
+        phys_min.append(-1)
+        phys_max.append(1)
+        dig_min.append(-32768)
+        dig_max.append(32767)
+
+    f.write('{:<8}'.format(0).encode('ascii'))
+    f.write('{:<80}'.format(subj_id).encode('ascii'))  # subject_id
+    f.write('{:<80}'.format('Startdate X X X X').encode('ascii'))
+    f.write(start_time.strftime('%d.%m.%y').encode('ascii'))
+    f.write(start_time.strftime('%H.%M.%S').encode('ascii'))
+
+    header_n_bytes = 256 + 256 * n_channels
+    f.write('{:<8d}'.format(header_n_bytes).encode('ascii'))
+    if n_annot_smp > 0:
+        f.write('{:<44}'.format('EDF+C').encode('ascii'))
+    else:
         f.write((' ' * 44).encode('ascii'))  # reserved for EDF+
 
-        f.write('{:<8}'.format(n_records).encode('ascii'))
-        f.write('{:<8d}'.format(record_length).encode('ascii'))
-        f.write('{:<4}'.format(n_channels).encode('ascii'))
-
-        for chan in data.axis['chan'][0]:
-            f.write('{:<16}'.format(chan).encode('ascii'))  # label
-        for _ in range(n_channels):
-            f.write(('{:<80}').format('').encode('ascii'))  # tranducer
-        for _ in range(n_channels):
-            f.write('{:<8}'.format('uV').encode('ascii'))  # physical_dim
-        for _ in range(n_channels):
-            f.write('{:<8}'.format(physical_min).encode('ascii'))
-        for _ in range(n_channels):
-            f.write('{:<8}'.format(physical_max).encode('ascii'))
-        for _ in range(n_channels):
-            f.write('{:<8}'.format(DIGITAL_MIN).encode('ascii'))
-        for _ in range(n_channels):
-            f.write('{:<8}'.format(DIGITAL_MAX).encode('ascii'))
-        for _ in range(n_channels):
-            f.write('{:<80}'.format('').encode('ascii'))  # prefiltering
-        for _ in range(n_channels):
-            f.write('{:<8d}'.format(s_freq).encode('ascii'))  # n_smp in record
-        for _ in range(n_channels):
-            f.write((' ' * 32).encode('ascii'))
-
-        length_record = s_freq * n_channels  # length of one record
-        for i in range(n_records):
-            i0 = i * s_freq
-            i1 = i0 + s_freq
-            x = dat[:, i0:i1].flatten(order='C')  # assumes it's ChanTimeData
-            f.write(pack('<' + 'h' * length_record, *x))
+    f.write('{:<8}'.format(-1).encode('ascii'))  # n_records, updated later
+    f.write('{:<8d}'.format(1).encode('ascii'))  # record_length
+    f.write('{:<4}'.format(n_channels).encode('ascii'))
+
+    for label in labels:
+        f.write('{:<16}'.format(label).encode('ascii'))
+    for _ in range(n_channels):
+        f.write(('{:<80}').format('').encode('ascii'))  # tranducer
+    for label in labels:
+        unit = '' if label == ANNOT_NAME else 'uV'
+        f.write('{:<8}'.format(unit).encode('ascii'))  # physical_dim
+    for value in phys_min:
+        f.write('{:<8}'.format(value).encode('ascii'))
+    for value in phys_max:
+        f.write('{:<8}'.format(value).encode('ascii'))
+    for value in dig_min:
+        f.write('{:<8}'.format(value).encode('ascii'))
+    for value in dig_max:
+        f.write('{:<8}'.format(value).encode('ascii'))
+    for _ in range(n_channels):
+        f.write('{:<80}'.format('').encode('ascii'))  # prefiltering
+    for value in n_smp:
+        f.write('{:<8d}'.format(value).encode('ascii'))  # n_smp in record
+    for _ in range(n_channels):
+        f.write((' ' * 32).encode('ascii'))
+
+
+def _format_edf_number(x, direction=0):
+    """Format a number so that it fits in the 8 characters of the EDF header,
+    without cutting it.
+
+    Parameters
+    ----------
+    x : float
+        value to format
+    direction : int
+        1 to round up, -1 to round down, 0 to round to the nearest value
+
+    Returns
+    -------
+    str
+        the value with as many significant digits as possible, in plain
+        notation if it fits, otherwise in scientific notation
+    """
+    if x == 0:
+        return '0'
+
+    exponent = floor(log10(fabs(x)))
+    for n_digits in range(8, 0, -1):
+        n_dec = n_digits - 1 - exponent
+        scale = 10. ** n_dec
+        scaled = x * scale
+        if fabs(scaled - round(scaled)) < 1e-6:  # rounding error
+            scaled = round(scaled)
+        if direction > 0:
+            value = ceil(scaled) / scale
+        elif direction < 0:
+            value = floor(scaled) / scale
+        else:
+            value = round(scaled) / scale
+
+        plain = '{:.{}f}'.format(value, n_dec if n_dec > 0 else 0)
+        if '.' in plain:
+            plain = plain.rstrip('0').rstrip('.')
+        if len(plain) <= 8:
+            return plain
+        mantissa, exp = '{:.{}e}'.format(value, n_digits - 1).split('e')
+        if '.' in mantissa:
+            mantissa = mantissa.rstrip('0').rstrip('.')
+        scientific = mantissa + 'e' + str(int(exp))
+        if len(scientific) <= 8:
+            return scientific
+
+    raise ValueError('Cannot write ' + str(x) + ' in the EDF header')
+
+
+def _write_records(f, dat, s_freq, first_record, tals=None, n_annot_smp=0):
+    """Write complete records, with one call if there are no annotations.
+
+    Parameters
+    ----------
+    f : file
+        file open for writing, at the end of the last record
+    dat : 2d ndarray (dtype='int16')
+        digital values (chan x time), the number of samples is a multiple of
+        s_freq
+    s_freq : int
+        number of samples in one record
+    first_record : int
+        index of the first record in dat
+    tals : dict, optional
+        TAL bytes for each record (see _create_tals)
+    n_annot_smp : int
+        number of samples (2 bytes each) of the annotation channel
+    """
+    n_chan = dat.shape[0]
+    n_rec = dat.shape[1] // s_freq
+    if n_rec == 0:
+        return
+
+    # records x chan x samples, as on disk
+    records = dat.reshape(n_chan, n_rec, s_freq).transpose(1, 0, 2)
+    records = records.astype('<i2', copy=False)
+
+    if tals is None:
+        f.write(records.tobytes())
+        return
+
+    annot = zeros((n_rec, n_annot_smp * 2), dtype='u1')
+    for i in range(n_rec):
+        tal = _timekeeping_tal(first_record + i) + tals.get(first_record + i,
+                                                            b'')
+        annot[i, :len(tal)] = frombuffer(tal, dtype='u1')
+
+    records = records.reshape(n_rec, -1).view('u1')
+    f.write(hstack((records, annot)).tobytes())
+
+
+def _timekeeping_tal(i_record):
+    return '+{}\x14\x14\x00'.format(i_record).encode('utf-8')
+
+
+def _create_tals(markers):
+    """Convert markers into TAL (Time-stamped Annotations Lists), grouped by
+    the record (of 1 s) where they start.
+
+    Returns
+    -------
+    dict
+        key is the index of the record, value is the bytes with the TALs of
+        the markers in that record
+    """
+    tals = {}
+    for mrk in markers:
+        onset = mrk['start']
+        duration = mrk['end'] - mrk['start']
+        if duration > 0:
+            tal = '{:+.4f}\x15{:.4f}\x14{}\x14\x00'.format(onset, duration,
+                                                          mrk['name'])
+        else:
+            tal = '{:+.4f}\x14{}\x14\x00'.format(onset, mrk['name'])
+
+        i_record = int(onset) if onset > 0 else 0
+        tals[i_record] = tals.get(i_record, b'') + tal.encode('utf-8')
+
+    return tals
+
+
+def _compute_n_annot_smp(tals):
+    """Number of samples in the annotation channel, so that the longest list
+    of TALs fits in one record (with the time-keeping TAL)."""
+    longest = max([len(x) for x in tals.values()] + [0, ])
+    n_bytes = len(_timekeeping_tal(10 ** 8)) + longest
+    return (n_bytes + 1) // 2
 
 
 def _read_tal(rawbytes):
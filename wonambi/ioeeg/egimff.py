@@ -5,8 +5,8 @@ from pathlib import Path
 from struct import unpack
 from xml.etree.ElementTree import parse
 
-from numpy import (append, asarray, cumsum, diff, empty, NaN, sum,
-                   where, ndarray, unique)
+from numpy import (append, asarray, cumsum, diff, empty, memmap, NaN, sum,
+                   ndarray, searchsorted, unique)
 
 from .utils import DEFAULT_DATETIME
 
@@ -30,8 +30,17 @@ class EgiMff:
         self._i_data = []
         self._nchan_signal1 = []  # n of channels in signal1
         self._n_samples = []
+        self._first_smp = []  # first sample of each block (and total)
+        self._dtype = []
+        self._memmap = None
         self._orig = {}
 
+    def __getstate__(self):
+        """Pickle without the memory-mapped signal files."""
+        state = self.__dict__.copy()
+        state['_memmap'] = None
+        return state
+
     def return_hdr(self):
         """Return the header for further use.
 
@@ -65,6 +74,8 @@ class EgiMff:
             self._i_data.append(i_data)
             n_samples = asarray([x['n_samples'][0] for x in block_hdr], 'q')
             self._n_samples.append(n_samples)
+            self._first_smp.append(cumsum(append(0, n_samples)))
+            self._dtype.append(_block_dtype(block_hdr))
 
         try:
             subj_id = orig['subject'][0][0]['name']
@@ -117,15 +128,14 @@ class EgiMff:
         Notes
         -----
         This format is tricky for both channels and samples. For the samples,
-        we just use the boundaries in the block header. For the channels, we
-        assume that there are max two signals, one EEG and one PIB box. We
-        just use the boundary between them to define if a channel belongs to
-        the first group or to the second.
-
-        TODO
-        ----
-        use wonambi.ioeeg.utils._select_blocks here, but you need to test it
-        with a PIB box.
+        we use the table of blocks which is computed when reading the header.
+        For the channels, we assume that there are max two signals, one EEG
+        and one PIB box. We just use the boundary between them to define if a
+        channel belongs to the first group or to the second.
+
+        The signal files are memory-mapped and, when consecutive blocks have
+        the same size, the requested channels are read from all the blocks at
+        once. Each signal file is only read once.
         """
         assert begsam < endsam
 
@@ -135,71 +145,37 @@ class EgiMff:
         chan = asarray(chan)
 
         # we assume there are only two signals
-        signals_to_read = []
-        if (chan < self._nchan_signal1).any():
-            signals_to_read.append(0)
-        if (chan >= self._nchan_signal1).any():
-            signals_to_read.append(1)
-
-        for one_signal in signals_to_read:
+        for one_signal in range(min(len(self._signal), 2)):
             if one_signal == 0:
-                i_chan_data = chan < self._nchan_signal1
+                i_chan_data = (chan < self._nchan_signal1).nonzero()[0]
                 i_chan_rec = chan[i_chan_data]
-
-            if one_signal == 1:
-                i_chan_data = chan >= self._nchan_signal1
+            else:
+                i_chan_data = (chan >= self._nchan_signal1).nonzero()[0]
                 i_chan_rec = chan[i_chan_data] - self._nchan_signal1
 
-            x = self._n_samples[one_signal]
-            x1 = cumsum(append(0, x))
-
-            # begrec is -1 when begsam is before start of the recordings
-            begrec = where(begsam < x1)[0][0] - 1
-            try:
-                endrec = where(endsam < x1)[0][0] - 1
-            except IndexError:
-                endrec = len(x)
-
-            f = self._signal[one_signal].open('rb')
-
-            i0 = 0
-            for rec in range(begrec, endrec + 1):
-
-                # if begsam is before start of the recordings, we just shift the baseline
-                if rec == -1:
-                    i0 = - begsam
-                    continue
-
-                # if endsam is after end of the recordings, we just stop here
-                if rec == len(self._n_samples[one_signal]):
-                    break
-
-                if rec == begrec:
-                    begpos_rec = begsam - x1[rec]
-                else:
-                    begpos_rec = 0
+            if len(i_chan_data) == 0:
+                continue
 
-                if rec == endrec:
-                    endpos_rec = endsam - x1[rec]
-                else:
-                    endpos_rec = x[rec]
+            first_smp = self._first_smp[one_signal]
+            first = max(begsam, 0)
+            last = min(endsam, first_smp[-1])
+            if first >= last:
+                continue
 
-                i1 = i0 + endpos_rec - begpos_rec
-
-                lg.debug('data {: 8d}-{: 8d}, rec ({}) {: 5d} - {: 5d}'.format(i0, i1, rec, begpos_rec, endpos_rec))
-
-                rec_dat = _read_block(f,
-                                      self._block_hdr[one_signal][rec],
-                                      self._i_data[one_signal][rec])
-
-                data[i_chan_data, i0:i1] = rec_dat[i_chan_rec,
-                                                   begpos_rec:endpos_rec]
-                i0 = i1
-
-            f.close()
+            data[i_chan_data, first - begsam:last - begsam] = _read_samples(
+                self._get_memmap(one_signal), self._i_data[one_signal],
+                first_smp, self._block_hdr[one_signal][0]['n_signals'],
+                self._dtype[one_signal], i_chan_rec, first, last)
 
         return data
 
+    def _get_memmap(self, one_signal):
+        """Memory-map the signal files (only the first time)."""
+        if self._memmap is None:
+            self._memmap = [memmap(str(x), dtype='u1', mode='r')
+                            for x in self._signal]
+        return self._memmap[one_signal]
+
     def return_markers(self):
         """"""
         xml_files = self._orig.keys()
@@ -260,28 +236,103 @@ class EgiMff:
         return mp4_file, begtime, endtime
 
 
-def _read_block(filename, block_hdr, i):
-    f = filename
-
-    # Can we assume constant depth across blocks?
-    depth = unique(block_hdr['depth'])
+def _block_dtype(block_hdr):
+    """Data type of the values, which should be the same for all the blocks.
+    """
+    depth = unique([x for one_hdr in block_hdr for x in one_hdr['depth']])
     assert(len(depth) == 1)
-    n_bytes = (depth[0] / 8).astype('B')
+    n_bytes = depth[0] // 8
 
     if n_bytes == 2:
-        data_type = '<h'
+        return '<h'
     elif n_bytes == 4:
-        data_type = '<f'
+        return '<f'
     elif n_bytes == 8:
-        data_type = '<d'
+        return '<d'
     else:
         raise ValueError("Invalid depth parameter.")
 
-    f.seek(i)
 
-    return ndarray((block_hdr['n_signals'], block_hdr['n_samples'][0]),
-                   data_type,
-                   f.read(sum(n_bytes * block_hdr['n_samples'])))
+def _read_samples(signal, i_data, first_smp, n_chan, dtype, chan, begsam,
+                  endsam):
+    """Read samples from consecutive blocks.
+
+    Parameters
+    ----------
+    signal : memmap
+        the signal file (as bytes)
+    i_data : ndarray
+        position of the data of each block in the file
+    first_smp : ndarray
+        index of the first sample of each block (and total n of samples)
+    n_chan : int
+        number of channels in the signal file
+    dtype : str
+        data type of the values
+    chan : ndarray
+        indices of the channels to read
+    begsam : int
+        index of the first sample (inside the recordings)
+    endsam : int
+        index of the last sample (inside the recordings)
+
+    Returns
+    -------
+    ndarray
+        chan x time
+
+    Notes
+    -----
+    Each block contains all the samples of one channel, then all the samples
+    of the next channel. Consecutive blocks with the same number of samples
+    and at the same distance in the file are read as one strided array
+    (block x chan x time) and only the channels of interest are copied.
+    """
+    itemsize = ndarray(0, dtype).itemsize
+    n_samples = diff(first_smp)
+
+    blk0 = searchsorted(first_smp, begsam, side='right') - 1
+    blk1 = searchsorted(first_smp, endsam, side='left')
+
+    dat = empty((len(chan), endsam - begsam), dtype)
+    for r0, r1 in _find_runs(n_samples[blk0:blk1], i_data[blk0:blk1]):
+        r0 += blk0
+        r1 += blk0
+        n_smp = n_samples[r0]
+        stride = i_data[r0 + 1] - i_data[r0] if r1 - r0 > 1 else 0
+        blocks = ndarray((r1 - r0, n_chan, n_smp), dtype, buffer=signal,
+                         offset=i_data[r0],
+                         strides=(stride, n_smp * itemsize, itemsize))
+        x = blocks[:, chan, :].transpose(1, 0, 2).reshape((len(chan), -1))
+
+        i0 = max(begsam, first_smp[r0])
+        i1 = min(endsam, first_smp[r1])
+        dat[:, i0 - begsam:i1 - begsam] = x[:, i0 - first_smp[r0]:
+                                            i1 - first_smp[r0]]
+
+    return dat
+
+
+def _find_runs(n_samples, i_data):
+    """Find consecutive blocks with the same number of samples and at the
+    same distance in the file.
+
+    Returns
+    -------
+    list of tuple of int
+        index of first block and last block (excluded) of each run
+    """
+    runs = []
+    r0 = 0
+    for i in range(1, len(n_samples)):
+        same_size = n_samples[i] == n_samples[r0]
+        same_step = (i - r0 == 1 or
+                     i_data[i] - i_data[i - 1] == i_data[r0 + 1] - i_data[r0])
+        if not (same_size and same_step):
+            runs.append((r0, i))
+            r0 = i
+    runs.append((r0, len(n_samples)))
+    return runs
 
 
 def read_block_hdr(f):
@@ -1,10 +1,12 @@
+from collections import OrderedDict
 from datetime import datetime
 from logging import getLogger
-from numpy import around, empty
+from numpy import around, asarray, empty, NaN, unique
 from scipy.io import loadmat, savemat
 
 lg = getLogger(__name__)
 VAR = 'data'
+N_CACHED_TRIALS = 1  # number of trials of non-hdf5 files to keep in memory
 
 
 class FieldTrip:
@@ -18,6 +20,14 @@ class FieldTrip:
     """
     def __init__(self, filename):
         self.filename = filename
+        self._hdf5 = False
+        self._trials = OrderedDict()
+
+    def __getstate__(self):
+        """Pickle without the trials in memory."""
+        state = self.__dict__.copy()
+        state['_trials'] = OrderedDict()
+        return state
 
     def return_hdr(self):
         """Return the header for further use.
@@ -48,6 +58,7 @@ class FieldTrip:
         orig = dict()
         subj_id = str()
         start_time = datetime.fromordinal(1)  # fake
+        self._trials = OrderedDict()
 
         try:
             ft_data = loadmat(self.filename, struct_as_record=True,
@@ -58,25 +69,30 @@ class FieldTrip:
             ft_data = ft_data[VAR]
 
             s_freq = ft_data['fsample'].astype('float64').item()
-            n_samples = ft_data['trial'].item().shape[1]
+            trial = ft_data['trial'].item(0)
+            n_samples = trial.shape[1]
             chan_name = list(ft_data['label'].item())
 
+            # the whole file is already in memory, keep the trial for return_dat
+            self._trials[0] = trial
+
         except NotImplementedError:
             from h5py import File
+            self._hdf5 = True
 
-            with File(self.filename) as f:
+            with File(self.filename, 'r') as f:
 
                 if VAR not in f.keys():
                     raise KeyError('Save the FieldTrip variable as ''{}'''
                                    ''.format(VAR))
 
-                s_freq = int(f[VAR]['fsample'].value.squeeze())
+                s_freq = int(f[VAR]['fsample'][()].squeeze())
 
                 # some hdf5 magic
                 # https://groups.google.com/forum/#!msg/h5py/FT7nbKnU24s/NZaaoLal9ngJ
                 chan_name = []
-                for l in f[VAR]['label'].value.flat:  # convert to np for flat
-                    chan_name.append(''.join([chr(x) for x in f[l].value]))
+                for l in f[VAR]['label'][()].flat:  # convert to np for flat
+                    chan_name.append(''.join([chr(x) for x in f[l][()]]))
 
                 n_samples = int(around(f[f[VAR]['trial'][0].item()].shape[0]))
 
@@ -99,22 +115,53 @@ class FieldTrip:
         numpy.ndarray
             A 2d matrix, with dimension chan X samples
 
+        Notes
+        -----
+        Matlab files (v6 and v7) are loaded only once and the trial is kept in
+        memory. For hdf5 files (v7.3), only the selected channels and samples
+        are read from disk.
         """
         TRL = 0
-        try:
-            ft_data = loadmat(self.filename, struct_as_record=True,
-                              squeeze_me=True)
-            ft_data = ft_data[VAR]
+        chan = asarray(chan).reshape(-1)
 
-            data = ft_data['trial'].item(TRL)
+        dat = empty((len(chan), endsam - begsam))
+        dat.fill(NaN)
+        first = max(begsam, 0)
 
-        except NotImplementedError:
+        if self._hdf5:
             from h5py import File
 
-            with File(self.filename) as f:
-                data = f[f[VAR]['trial'][TRL].item()].value.T
+            with File(self.filename, 'r') as f:
+                trial = f[f[VAR]['trial'][TRL].item()]  # time x chan
+                last = min(endsam, trial.shape[0])
+                if first < last:
+                    dat[:, first - begsam:last - begsam] = _read_hdf5_trial(
+                        trial, chan, first, last)
+
+        else:
+            trial = self._read_trial(TRL)
+            last = min(endsam, trial.shape[1])
+            if first < last:
+                dat[:, first - begsam:last - begsam] = trial[chan, first:last]
+
+        return dat
+
+    def _read_trial(self, trl):
+        """Load one trial from the matlab file, keeping the last ones in
+        memory."""
+        if trl in self._trials:
+            self._trials.move_to_end(trl)
+            return self._trials[trl]
 
-        return data[chan, begsam:endsam]
+        ft_data = loadmat(self.filename, struct_as_record=True,
+                          squeeze_me=True)
+        trial = ft_data[VAR]['trial'].item(trl)
+
+        self._trials[trl] = trial
+        if len(self._trials) > N_CACHED_TRIALS:
+            self._trials.popitem(last=False)
+
+        return trial
 
     def return_markers(self):
         """Return all the markers (also called triggers or events).
@@ -133,6 +180,39 @@ class FieldTrip:
         return []
 
 
+def _read_hdf5_trial(trial, chan, begsam, endsam):
+    """Read some channels and samples from the hdf5 dataset of one trial.
+
+    Parameters
+    ----------
+    trial : instance of h5py.Dataset
+        trial stored as time x chan
+    chan : ndarray
+        indices of the channels to read
+    begsam : int
+        index of the first sample (inside the recordings)
+    endsam : int
+        index of the last sample (inside the recordings)
+
+    Returns
+    -------
+    ndarray
+        chan x time
+
+    Notes
+    -----
+    h5py only accepts channels in increasing order and it's much faster to
+    read a contiguous block of channels.
+    """
+    chan_sorted, i_chan = unique(chan, return_inverse=True)
+    if chan_sorted[-1] - chan_sorted[0] + 1 == len(chan_sorted):
+        x = trial[begsam:endsam, chan_sorted[0]:chan_sorted[-1] + 1]
+    else:
+        x = trial[begsam:endsam, chan_sorted.tolist()]
+
+    return x.T[i_chan, :]
+
+
 def write_fieldtrip(data, filename):
     """Export data to FieldTrip.
 
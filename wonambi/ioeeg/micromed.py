@@ -2,7 +2,8 @@ from os import SEEK_SET, SEEK_END, SEEK_CUR
 from datetime import datetime, date
 from struct import unpack
 
-from numpy import array, dtype, empty, fromfile, iinfo, memmap, NaN, pad
+from numpy import (array, asarray, dtype, empty, fromfile, iinfo, memmap, NaN,
+                   subtract)
 
 N_ZONES = 15
 MAX_SAMPLE = 128
@@ -39,6 +40,13 @@ class Micromed:
 
         self._triggers = self._header['trigger']
         self._videos = self._header['dvideo']
+        self._memmap = None
+
+    def __getstate__(self):
+        """Pickle without the memory-mapped data."""
+        state = self.__dict__.copy()
+        state['_memmap'] = None
+        return state
 
     def return_hdr(self):
         """Return the header for further use.
@@ -80,38 +88,38 @@ class Micromed:
         -------
         numpy.ndarray
             A 2d matrix, with dimension chan X samples
+
+        Notes
+        -----
+        The file is memory-mapped only once. Only the selected channels are
+        converted to float and calibrated.
         """
+        chan = asarray(chan).reshape(-1)
 
-        if type(chan) == int:  # if single value is provided it needs to be transformed to list to generate a 2d matrix
-            chan = [chan, ]
+        dat = empty((len(chan), endsam - begsam))
+        dat.fill(NaN)
 
-        if (begsam >= self._n_smp) or (endsam < 0):
-            dat = empty((len(chan), endsam - begsam))
-            dat.fill(NaN)
+        first = max(begsam, 0)
+        last = min(endsam, self._n_smp)
+        if first >= last:
             return dat
 
-        if begsam < 0:
-            begpad = -1 * begsam
-            begsam = 0
-        else:
-            begpad = 0
-
-        if endsam > self._n_smp:
-            endpad = endsam - self._n_smp
-            endsam = self._n_smp
-        else:
-            endpad = 0
-
-        dshape = (self._n_chan, endsam - begsam)
-        sig_dtype = 'u' + str(self._n_bytes)
-        offset = self._bodata + begsam * self._n_bytes * self._n_chan
-        dat = memmap(str(self.filename), dtype=sig_dtype, order='F', mode='r',
-                     shape=dshape, offset=offset).astype('float')
-
-        dat = pad(dat[chan, :], ((0, 0), (begpad, endpad)), mode='constant',
-                  constant_values=NaN)
-
-        return (dat - self._offset[chan, None]) * self._factors[chan, None]
+        # calibrate only the selected channels, directly into the output
+        out = dat[:, first - begsam:last - begsam]
+        subtract(self._get_memmap()[chan, first:last],
+                 self._offset[chan, None], out=out)
+        out *= self._factors[chan, None]
+
+        return dat
+
+    def _get_memmap(self):
+        """Memory-map the data section of the file (only the first time)."""
+        if self._memmap is None:
+            self._memmap = memmap(str(self.filename),
+                                  dtype='u' + str(self._n_bytes), order='F',
+                                  mode='r', shape=(self._n_chan, self._n_smp),
+                                  offset=self._bodata)
+        return self._memmap
 
     def return_markers(self):
         """Return all the markers (also called triggers or events).
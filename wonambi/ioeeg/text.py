@@ -1,7 +1,8 @@
 """Class to import straight text records.
 """
+from json import dump, load
 from logging import getLogger
-from numpy import empty, float64, floor
+from numpy import concatenate, empty, float64, fromstring, memmap, NaN
 from os import listdir
 from os.path import splitext
 from pathlib import Path
@@ -10,6 +11,9 @@ from .utils import DEFAULT_DATETIME
 
 lg = getLogger(__name__)
 
+CACHE_DIR = '.wonambi'  # subdirectory with the binary version of the files
+CHUNK_SIZE = 2 ** 24  # approximate n of bytes of text to convert at once
+
 
 class Text:
     """Class to read text format records. The record consists of a directory 
@@ -25,13 +29,17 @@ class Text:
         
     Notes
     -----
-    Text is a very slow format for reading data. It is best to use this class
-    to import the record, then to export is as a Wonambi (.won) file, and use
-    that for reading.
+    Text is a very slow format for reading data. The first time that a
+    channel is read, the text file is converted into a binary file (float64)
+    in a hidden subdirectory (.wonambi) of the record directory, which is then
+    memory-mapped. The binary file is converted again if the text file
+    changes. If the record directory is read-only, the converted values are
+    kept in memory.
     """
     def __init__(self, rec_dir):
         lg.info('Reading ' + str(rec_dir))
         self.filename = rec_dir
+        self._memmap = {}
         self.hdr = self.return_hdr()
         
         # range data are absent
@@ -39,7 +47,14 @@ class Text:
         self.dig_max = 0.000512 # estimated from max values
         self.phys_min = -800 # estimate
         self.phys_max = 800 # estimate
-        
+
+    def __getstate__(self):
+        """Pickle without the values of the channels (they are memory-mapped
+        again from the binary files)."""
+        state = self.__dict__.copy()
+        state['_memmap'] = {}
+        return state
+
     def return_hdr(self):
         """Return the header for further use.
 
@@ -83,11 +98,10 @@ class Text:
             line0 = f.readline()
             hdr['s_freq'] = int(
                     line0[line0.index('Rate:') + 5:line0.index('Hz')])
-            
-            for i, _ in enumerate(f):
-                pass
-            hdr['n_samples'] = i
-        
+
+        self._memmap = {}
+        hdr['n_samples'] = self._get_memmap(0).shape[0]
+
         output = (hdr['subj_id'], hdr['start_time'], hdr['s_freq'], 
                   hdr['chan_name'], hdr['n_samples'], hdr)
         
@@ -110,27 +124,16 @@ class Text:
         numpy.ndarray
             A 2d matrix, with dimension chan X samples.
         """
-        #n_sam = self.hdr[4]
-        interval = endsam - begsam
-        dat = empty((len(chan), interval))
-        
-        #beg_block = floor((begsam / n_sam) * n_block)
-        #end_block = floor((endsam / n_sam) * n_block)
-                
-        for i, chan in enumerate(chan):
-            k = 0
-            
-            with open(self.chan_files[chan], 'rt') as f:
-                f.readline()
-                
-                for j, datum in enumerate(f):
-                    
-                    if begsam <= j + 1 < endsam:
-                        dat[i, k] = float64(datum)
-                        k += 1
-                        if k == interval:
-                            break
-        
+        dat = empty((len(chan), endsam - begsam))
+        dat.fill(NaN)
+
+        for i, one_chan in enumerate(chan):
+            x = self._get_memmap(one_chan)
+            first = max(begsam, 0)
+            last = min(endsam, x.shape[0])
+            if first < last:
+                dat[i, first - begsam:last - begsam] = x[first:last]
+
         # calibration
         phys_range = self.phys_max - self.phys_min
         dig_range = self.dig_max - self.dig_min
@@ -144,6 +147,91 @@ class Text:
         """
         return []
 
+    def _get_memmap(self, chan):
+        """Return the values of one channel, converting the text file the
+        first time."""
+        if chan not in self._memmap:
+            self._memmap[chan] = _convert_to_binary(self.chan_files[chan])
+        return self._memmap[chan]
+
+
+def _convert_to_binary(txt_file):
+    """Convert the text file of one channel into a binary file, unless it was
+    already converted.
+
+    Parameters
+    ----------
+    txt_file : Path
+        text file of one channel
+
+    Returns
+    -------
+    memmap or ndarray
+        values of the channel (ndarray if the binary file cannot be written)
+    """
+    cache_dir = txt_file.parent / CACHE_DIR
+    dat_file = cache_dir / (txt_file.stem + '.dat')
+    info_file = cache_dir / (txt_file.stem + '.json')
+
+    st = txt_file.stat()
+    info = {'size': st.st_size, 'mtime': st.st_mtime_ns}
+    try:
+        with info_file.open() as f:
+            if load(f) == info:
+                return _open_memmap(dat_file)
+    except (OSError, ValueError):
+        pass
+
+    lg.info('Converting ' + txt_file.name + ' to binary')
+    try:
+        cache_dir.mkdir(exist_ok=True)
+        if info_file.exists():  # written only after a successful conversion
+            info_file.unlink()
+        with dat_file.open('wb') as f:
+            for x in _parse_text(txt_file):
+                f.write(x.tobytes())
+        with info_file.open('w') as f:
+            dump(info, f)
+
+    except OSError as err:
+        lg.warning('Could not write binary file for ' + txt_file.name +
+                   ' (' + str(err) + '), keeping it in memory')
+        return concatenate([empty(0)] + list(_parse_text(txt_file)))
+
+    return _open_memmap(dat_file)
+
+
+def _parse_text(txt_file):
+    """Parse the values (one per line, after the first line), a large number
+    of lines at the time.
+
+    Raises
+    ------
+    ValueError
+        if one of the lines does not contain exactly one number (fromstring
+        stops at the first value it cannot parse, without raising)
+    """
+    with txt_file.open('rt') as f:
+        f.readline()
+        while True:
+            lines = f.readlines(CHUNK_SIZE)
+            if not lines:
+                break
+            x = fromstring(''.join(lines), dtype=float64, sep=' ')
+            n_lines = sum(1 for line in lines if line.strip())
+            if x.shape[0] != n_lines:
+                raise ValueError('Could not parse ' + txt_file.name + ': ' +
+                                 str(n_lines) + ' lines but ' +
+                                 str(x.shape[0]) + ' values')
+            yield x
+
+
+def _open_memmap(dat_file):
+    """Memory-map the binary file (memmap doesn't work with empty files)."""
+    if dat_file.stat().st_size == 0:
+        return empty(0)
+    return memmap(str(dat_file), dtype=float64, mode='r')
+
     
 #==============================================================================
 # def split_file(filepath, lines_per_file=100):
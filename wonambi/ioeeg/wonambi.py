@@ -1,9 +1,21 @@
 """Package to import and export common formats.
 """
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from itertools import chain
 from json import dump, load
+from logging import getLogger
 from pathlib import Path
-from numpy import c_, empty, float64, NaN, memmap
+from zlib import compress, decompress
+
+from numpy import (asarray, count_nonzero, empty, errstate, frombuffer,
+                   hstack, iinfo, isnan, NaN, memmap, nanmax, nanmin, newaxis,
+                   ones, rint, where)
+
+lg = getLogger(__name__)
+
+BLOCK_SIZE = 16384  # number of samples in each compressed block
+N_CACHED_BLOCKS = 8
 
 
 class Wonambi:
@@ -16,6 +28,16 @@ class Wonambi:
     """
     def __init__(self, filename):
         self.filename = filename
+        self._memmap = None
+        self._blocks = OrderedDict()
+
+    def __getstate__(self):
+        """Pickle without the memory-mapped file and the decompressed
+        blocks."""
+        state = self.__dict__.copy()
+        state['_memmap'] = None
+        state['_blocks'] = OrderedDict()
+        return state
 
     def return_hdr(self):
         """Return the header for further use.
@@ -43,6 +65,16 @@ class Wonambi:
         self.memshape = (len(orig['chan_name']),
                          orig['n_samples'])
         self.dtype = orig.get('dtype', 'float64')
+        self.scale = orig.get('scale', None)
+        if self.scale is not None:
+            self.scale = asarray(self.scale)
+            self.offset = asarray(orig['offset'])
+        self.compression = orig.get('compression', None)
+        self.block_size = orig.get('block_size', None)
+        self.block_offset = orig.get('block_offset', None)
+
+        self._memmap = None
+        self._blocks = OrderedDict()
 
         return (orig['subj_id'], start_time, orig['s_freq'], orig['chan_name'],
                 orig['n_samples'], orig)
@@ -62,8 +94,7 @@ class Wonambi:
         Returns
         -------
         numpy.ndarray
-            A 2d matrix, with dimension chan X samples. To save memory, the
-            data are memory-mapped, and you cannot change the values on disk.
+            A 2d matrix, with dimension chan X samples.
 
         Raises
         ------
@@ -73,31 +104,36 @@ class Wonambi:
         Notes
         -----
         When asking for an interval outside the data boundaries, it returns NaN
-        for those values. It then converts the memmap to a normal numpy array,
-        I think, and so it reads the data into memory. However, I'm not 100%
-        sure that this is what happens.
-        """
-        memmap_file = Path(self.filename).with_suffix('.dat')
-        if not memmap_file.exists():
-            raise FileNotFoundError('Could not find ' + str(memmap_file))
-
-        data = memmap(str(memmap_file), self.dtype, mode='c',
-                      shape=self.memshape, order='F')
+        for those values.
 
+        The memory-mapped file is opened only once. Only the selected channels
+        and samples are converted to float64 (and calibrated, if the data is
+        stored as integers). For compressed files, only the blocks containing
+        the samples of interest are decompressed (the last blocks are cached).
+        """
+        chan = asarray(chan).reshape(-1)
         n_smp = self.memshape[1]
-        dat = data[chan, max((begsam, 0)):min((endsam, n_smp))].astype(float64)
 
-        if begsam < 0:
+        dat = empty((len(chan), endsam - begsam))
+        dat.fill(NaN)
 
-            pad = empty((dat.shape[0], 0 - begsam))
-            pad.fill(NaN)
-            dat = c_[pad, dat]
+        first = max((begsam, 0))
+        last = min((endsam, n_smp))
+        if first >= last:
+            return dat
 
-        if endsam >= n_smp:
+        if self.compression is None:
+            x = self._get_memmap()[chan, first:last]
+        else:
+            x = self._read_blocks(chan, first, last)
 
-            pad = empty((dat.shape[0], endsam - n_smp))
-            pad.fill(NaN)
-            dat = c_[dat, pad]
+        dat[:, first - begsam:last - begsam] = x
+        if self.scale is not None:
+            dat *= self.scale[chan, newaxis]
+            dat += self.offset[chan, newaxis]
+            # the lowest integer is reserved for NaN
+            dat[:, first - begsam:last - begsam][
+                x == iinfo(self.dtype).min] = NaN
 
         return dat
 
@@ -116,20 +152,252 @@ class Wonambi:
         """
         return []
 
+    def _get_memmap(self):
+        """Open the memory-mapped file (only the first time)."""
+        if self._memmap is None:
+            memmap_file = Path(self.filename).with_suffix('.dat')
+            if not memmap_file.exists():
+                raise FileNotFoundError('Could not find ' + str(memmap_file))
+
+            self._memmap = memmap(str(memmap_file), self.dtype, mode='r',
+                                  shape=self.memshape, order='F')
+
+        return self._memmap
+
+    def _read_blocks(self, chan, first, last):
+        """Read the samples from the compressed blocks."""
+        x = empty((len(chan), last - first), dtype=self.dtype)
 
-def write_wonambi(data, filename, subj_id='', dtype='float64'):
+        first_blk = first // self.block_size
+        last_blk = (last - 1) // self.block_size
+        for blk in range(first_blk, last_blk + 1):
+            blk_dat = self._read_block(blk)
+            blk_beg = blk * self.block_size
+            i0 = max(first, blk_beg)
+            i1 = min(last, blk_beg + blk_dat.shape[1])
+            x[:, i0 - first:i1 - first] = blk_dat[chan, i0 - blk_beg:
+                                                  i1 - blk_beg]
+
+        return x
+
+    def _read_block(self, blk):
+        """Decompress one block, keeping the last ones in memory."""
+        if blk in self._blocks:
+            self._blocks.move_to_end(blk)
+            return self._blocks[blk]
+
+        memmap_file = Path(self.filename).with_suffix('.dat')
+        with memmap_file.open('rb') as f:
+            f.seek(self.block_offset[blk])
+            raw = f.read(self.block_offset[blk + 1] - self.block_offset[blk])
+
+        n_chan = self.memshape[0]
+        blk_dat = frombuffer(decompress(raw), dtype=self.dtype)
+        blk_dat = blk_dat.reshape((n_chan, -1), order='F')
+
+        self._blocks[blk] = blk_dat
+        if len(self._blocks) > N_CACHED_BLOCKS:
+            self._blocks.popitem(last=False)
+
+        return blk_dat
+
+
+class WonambiWriter:
+    """Write data in Wonambi format, one chunk at the time.
+
+    Parameters
+    ----------
+    filename : path to file
+        file to export to (the extensions .won and .dat will be added)
+    chan_name : list of str
+        names of the channels
+    s_freq : float
+        sampling frequency
+    start_time : datetime
+        start time of the recordings
+    subj_id : str
+        subject id
+    dtype : str
+        numpy dtype in which you want to save the data
+    scale : float or list of float, optional
+        if dtype is an integer, the value of one unit in each channel
+    offset : float or list of float, optional
+        if dtype is an integer, the value of zero in each channel
+    compression : str, optional
+        None (memory-mapped file) or 'zlib' (compressed blocks)
+    block_size : int
+        number of samples in each compressed block
+    append : bool
+        if True, the data is appended to an existing file (the other
+        parameters are read from the existing file)
+
+    Notes
+    -----
+    The .won file is written when the writer is closed (it's better to use it
+    as context manager).
+
+    If dtype is an integer, the lowest integer is reserved for NaN, and the
+    values outside the range of the other integers (with scale and offset) are
+    clipped, with a warning.
+
+    >>> with WonambiWriter(filename, chan_name, s_freq, start_time) as w:
+    >>>     for chunk in chunks:
+    >>>         w.write(chunk)
+    """
+    def __init__(self, filename, chan_name=None, s_freq=None, start_time=None,
+                 subj_id='', dtype='float64', scale=None, offset=None,
+                 compression=None, block_size=BLOCK_SIZE, append=False):
+        filename = Path(filename)
+        self.json_file = filename.with_suffix('.won')
+        self.memmap_file = filename.with_suffix('.dat')
+
+        if append:
+            self._read_existing()
+        else:
+            self.dataset = {'subj_id': subj_id,
+                            'start_time': start_time.strftime(
+                                '%Y-%m-%d %H:%M:%S.%f'),
+                            's_freq': s_freq,
+                            'chan_name': list(chan_name),
+                            'n_samples': 0,
+                            'dtype': dtype,
+                            }
+            if compression is not None:
+                self.dataset['compression'] = compression
+                self.dataset['block_size'] = block_size
+                self.dataset['block_offset'] = [0, ]
+
+            if _iinfo_or_none(dtype) is not None:
+                if scale is None:
+                    raise ValueError('You need to specify scale to store the '
+                                     'data as ' + dtype)
+                n_chan = len(chan_name)
+                if offset is None:
+                    offset = 0
+                self.dataset['scale'] = (ones(n_chan) * scale).tolist()
+                self.dataset['offset'] = (ones(n_chan) * offset).tolist()
+
+            self._buffer = None
+            self._f = self.memmap_file.open('wb')
+
+    def _read_existing(self):
+        """Open an existing file, to append data."""
+        with self.json_file.open('r') as f:
+            self.dataset = load(f)
+
+        self._buffer = None
+        self._f = self.memmap_file.open('r+b')
+
+        if self.dataset.get('compression', None) is None:
+            self._f.seek(0, 2)
+
+        else:
+            # the last block could be incomplete, so we rewrite it
+            offsets = self.dataset['block_offset']
+            n_smp_last = self.dataset['n_samples'] % self.dataset['block_size']
+            if n_smp_last > 0:
+                self._f.seek(offsets[-2])
+                raw = self._f.read(offsets[-1] - offsets[-2])
+                x = frombuffer(decompress(raw), dtype=self.dataset['dtype'])
+                self._buffer = x.reshape((len(self.dataset['chan_name']), -1),
+                                         order='F')
+                offsets.pop()
+                self.dataset['n_samples'] -= n_smp_last
+            self._f.seek(offsets[-1])
+            self._f.truncate()
+
+    def write(self, dat):
+        """Append one chunk of data.
+
+        Parameters
+        ----------
+        dat : ndarray or instance of ChanTime
+            data (chan x time) to append (ChanTime with only one trial)
+        """
+        if hasattr(dat, 'axis'):
+            dat = dat.data[0]
+
+        dtype = self.dataset['dtype']
+        if 'scale' in self.dataset:
+            scale = asarray(self.dataset['scale'])[:, newaxis]
+            offset = asarray(self.dataset['offset'])[:, newaxis]
+            int_info = iinfo(dtype)
+            dat = rint((dat - offset) / scale)
+            is_nan = isnan(dat)
+            with errstate(invalid='ignore'):
+                n_clipped = count_nonzero((dat <= int_info.min) |
+                                          (dat > int_info.max))
+            if n_clipped > 0:
+                lg.warning(str(n_clipped) + ' values are outside the range '
+                           'of ' + dtype + ' (with the scale and offset of '
+                           'the file) and were clipped')
+            dat = dat.clip(int_info.min + 1, int_info.max)
+            dat[is_nan] = int_info.min
+        dat = dat.astype(dtype)
+
+        if self.dataset.get('compression', None) is None:
+            self._f.write(dat.tobytes(order='F'))
+            self.dataset['n_samples'] += dat.shape[1]
+            return
+
+        if self._buffer is not None:
+            dat = hstack((self._buffer, dat))
+            self._buffer = None
+
+        block_size = self.dataset['block_size']
+        n_blocks = dat.shape[1] // block_size
+        for blk in range(n_blocks):
+            self._write_block(dat[:, blk * block_size:(blk + 1) * block_size])
+
+        if dat.shape[1] > n_blocks * block_size:
+            self._buffer = dat[:, n_blocks * block_size:]
+
+    def _write_block(self, dat):
+        self._f.write(compress(dat.tobytes(order='F')))
+        self.dataset['block_offset'].append(self._f.tell())
+        self.dataset['n_samples'] += dat.shape[1]
+
+    def close(self):
+        """Write the last (incomplete) block and the .won file."""
+        if self._buffer is not None:
+            self._write_block(self._buffer)
+            self._buffer = None
+
+        self._f.close()
+        with self.json_file.open('w') as f:
+            dump(self.dataset, f, sort_keys=True, indent=4)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_wonambi(data, filename, subj_id='', dtype='float64', scale=None,
+                  offset=None, compression=None):
     """Write file in simple Wonambi format.
 
     Parameters
     ----------
-    data : instance of ChanTime
-        data with only one trial
+    data : instance of ChanTime or iterable of ChanTime
+        data with only one trial, or consecutive chunks of data (each chunk
+        is a ChanTime with only one trial)
     filename : path to file
         file to export to (the extensions .won and .dat will be added)
     subj_id : str
         subject id
     dtype : str
         numpy dtype in which you want to save the data
+    scale : float or list of float, optional
+        if dtype is an integer (f.e. 'int16' or 'int32'), the value of one
+        unit in each channel. If data is ChanTime, it's computed from the
+        range of each channel.
+    offset : float or list of float, optional
+        if dtype is an integer, the value of zero in each channel
+    compression : str, optional
+        None (memory-mapped file) or 'zlib' (compressed blocks, with an index
+        for random access)
 
     Notes
     -----
@@ -140,29 +408,46 @@ def write_wonambi(data, filename, subj_id='', dtype='float64'):
 
     Memory-mapped matrices are column-major, Fortran-style, to be compatible
     with Matlab.
-    """
-    filename = Path(filename)
 
-    json_file = filename.with_suffix('.won')
-    memmap_file = filename.with_suffix('.dat')
+    To append data to an existing file, use WonambiWriter with append=True.
+    """
+    if hasattr(data, 'axis'):
+        chunks = (data, )
+        if _iinfo_or_none(dtype) is not None and scale is None:
+            scale, offset = _compute_scale(data.data[0], dtype)
+    else:
+        chunks = iter(data)
+        data = next(chunks)
+        chunks = chain((data, ), chunks)
 
     start_time = data.start_time + timedelta(seconds=data.axis['time'][0][0])
 
-    start_time_str = start_time.strftime('%Y-%m-%d %H:%M:%S.%f')
-    dataset = {'subj_id': subj_id,
-               'start_time': start_time_str,
-               's_freq': data.s_freq,
-               'chan_name': list(data.axis['chan'][0]),
-               'n_samples': int(data.number_of('time')[0]),
-               'dtype': dtype,
-               }
-
-    with json_file.open('w') as f:
-        dump(dataset, f, sort_keys=True, indent=4)
-
-    memshape = (len(dataset['chan_name']),
-                dataset['n_samples'])
-
-    mem = memmap(str(memmap_file), dtype, mode='w+', shape=memshape, order='F')
-    mem[:, :] = data.data[0]
-    mem.flush()  # not sure if necessary
+    with WonambiWriter(filename, chan_name=data.axis['chan'][0],
+                       s_freq=data.s_freq, start_time=start_time,
+                       subj_id=subj_id, dtype=dtype, scale=scale,
+                       offset=offset, compression=compression) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+
+def _iinfo_or_none(dtype):
+    """Return the info of an integer dtype (None if it's float)."""
+    try:
+        return iinfo(dtype)
+    except ValueError:
+        return None
+
+
+def _compute_scale(dat, dtype):
+    """Compute scale and offset so that each channel uses the full range of
+    the integer dtype (except the lowest integer, which is reserved for
+    NaN)."""
+    int_info = iinfo(dtype)
+    with errstate(invalid='ignore'):  # channels with only NaN
+        dat_max = nanmax(dat, axis=1)
+        dat_min = nanmin(dat, axis=1)
+    offset = (dat_max + dat_min) / 2
+    offset = where(isnan(offset), 0, offset)
+    scale = (dat_max - dat_min) / (int(int_info.max) - int(int_info.min) - 1)
+    scale = where((scale == 0) | isnan(scale), 1, scale)
+    return scale, offset
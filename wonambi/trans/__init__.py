@@ -8,10 +8,10 @@ basic elements, use the package "detect" for example.
 """
 from .filter import filter_, convolve
 from .select import select, resample
-from .frequency import frequency, timefrequency
+from .frequency import frequency, frequency_batch, timefrequency
 from .merge import concatenate
 from .math import math
 from .montage import montage
 from .peaks import peaks
-from .reject import rejectbadchan
+from .reject import rejectbadchan, rejectbadepochs
 
@@ -0,0 +1,118 @@
+"""Module to compute the analytic signal and the envelope of the data.
+
+The FFT is computed on the data zero-padded to a length which can be
+factorized into small primes (see scipy.fftpack.next_fast_len), because the
+FFT of signals with a large prime factor in their length is very slow. The
+output is then trimmed to the original length.
+"""
+from functools import lru_cache
+from logging import getLogger
+
+from numpy import absolute, zeros
+from numpy.fft import fft, fftfreq, ifft
+from scipy.fftpack import next_fast_len
+
+lg = getLogger(__name__)
+
+
+def hilbert(x, axis=-1, s_freq=None, band=None):
+    """Compute the analytic signal, using the Hilbert transform.
+
+    Parameters
+    ----------
+    x : ndarray
+        real data
+    axis : int
+        axis along which to compute the transform (all the other dimensions,
+        such as the channels, are computed at once)
+    s_freq : float, optional
+        sampling frequency (only necessary with band)
+    band : tuple of two floats, optional
+        low and high frequency of the bandpass filter, applied in the
+        frequency domain (None for no limit on one side)
+
+    Returns
+    -------
+    ndarray (dtype='complex')
+        analytic signal, with the same shape as x
+
+    Notes
+    -----
+    Because of the zero-padding, the values at the edges can be a bit
+    different from scipy.signal.hilbert (the data is not assumed to be
+    periodic).
+
+    The bandpass filter sets to zero the frequencies outside the band, so it
+    has a very sharp cut-off. It's convenient for narrow-band envelopes, but
+    you might prefer a proper filter (see trans.filter_) if the edges of the
+    band are important.
+    """
+    if band is not None and s_freq is None:
+        raise TypeError('You need to specify s_freq to apply the band')
+
+    axis = axis % x.ndim
+    n_smp = x.shape[axis]
+    n_fft = next_fast_len(n_smp)
+    if n_fft != n_smp:
+        lg.debug('Padding {} samples to {}'.format(n_smp, n_fft))
+
+    if band is not None:
+        band = (band[0], band[1])
+    h = _hilbert_multiplier(n_fft, s_freq, band)
+    h = h.reshape((-1, ) + (1, ) * (x.ndim - axis - 1))
+
+    xf = fft(x, n_fft, axis=axis)
+    xf *= h
+    analytic = ifft(xf, axis=axis)
+
+    idx = [slice(None)] * x.ndim
+    idx[axis] = slice(None, n_smp)
+    return analytic[tuple(idx)]
+
+
+def envelope(x, axis=-1, s_freq=None, band=None):
+    """Compute the envelope (absolute value of the analytic signal).
+
+    Parameters
+    ----------
+    x : ndarray
+        real data
+    axis : int
+        axis along which to compute the transform
+    s_freq : float, optional
+        sampling frequency (only necessary with band)
+    band : tuple of two floats, optional
+        low and high frequency of the bandpass filter (see hilbert)
+
+    Returns
+    -------
+    ndarray
+        envelope, with the same shape as x
+    """
+    return absolute(hilbert(x, axis=axis, s_freq=s_freq, band=band))
+
+
+@lru_cache(maxsize=32)
+def _hilbert_multiplier(n_fft, s_freq=None, band=None):
+    """Weights of the FFT to get the analytic signal (positive frequencies
+    are doubled, negative frequencies are removed), with optional band.
+
+    It's read-only because it's cached.
+    """
+    h = zeros(n_fft)
+    if n_fft % 2 == 0:
+        h[0] = h[n_fft // 2] = 1
+        h[1:n_fft // 2] = 2
+    else:
+        h[0] = 1
+        h[1:(n_fft + 1) // 2] = 2
+
+    if band is not None:
+        freq = abs(fftfreq(n_fft, 1 / s_freq))
+        if band[0] is not None:
+            h[freq < band[0]] = 0
+        if band[1] is not None:
+            h[freq > band[1]] = 0
+
+    h.setflags(write=False)
+    return h
@@ -7,11 +7,13 @@ from itertools import product
 from numpy import empty, ix_, expand_dims, squeeze
 from scipy.signal import iirfilter, filtfilt, get_window, fftconvolve
 
+from ..utils.parallel import map_trials
+
 lg = getLogger(__name__)
 
 
 def filter_(data, axis='time', low_cut=None, high_cut=None, order=4,
-            ftype='butter', Rs=None):
+            ftype='butter', Rs=None, n_jobs=1):
     """Design filter and apply it.
 
     Parameters
@@ -28,6 +30,9 @@ def filter_(data, axis='time', low_cut=None, high_cut=None, order=4,
         the data to filter.
     axis : str, optional
         axis to apply the filter on.
+    n_jobs : int, optional
+        number of processes to filter the trials in parallel (-1 uses all
+        the CPUs)
 
     Returns
     -------
@@ -86,13 +91,19 @@ def filter_(data, axis='time', low_cut=None, high_cut=None, order=4,
     b, a = iirfilter(order, Wn, btype=btype, ftype=ftype, rs=Rs)
 
     fdata = data._copy()
-    for i in range(data.number_of('trial')):
-        fdata.data[i] = filtfilt(b, a,
-                                 data.data[i],
-                                 axis=data.index_of(axis))
+    output = map_trials(_filtfilt, [(x, ) for x in data.data], n_jobs=n_jobs,
+                        b=b, a=a, axis=data.index_of(axis))
+    for i, x in enumerate(output):
+        fdata.data[i] = x
+
     return fdata
 
 
+def _filtfilt(x, b, a, axis):
+    """Apply filter to one trial (it needs to be picklable)."""
+    return filtfilt(b, a, x, axis=axis)
+
+
 def convolve(data, window, axis='time', length=1):
     """Design taper and convolve it with the signal.
 
@@ -1,11 +1,12 @@
 """Module to compute frequency representation.
 """
 from copy import deepcopy
+from functools import lru_cache
 from logging import getLogger
 from warnings import warn
 
-from numpy import (arange, array, empty, exp, max, mean, pi, real, sqrt,
-                   swapaxes)
+from numpy import (arange, array, asarray, empty, exp, max, mean, moveaxis,
+                   ndarray, pi, real, sqrt, stack, swapaxes)
 from numpy.linalg import norm
 import numpy.fft as np_fft
 from scipy import fftpack
@@ -13,15 +14,17 @@ from scipy.signal import windows, get_window, fftconvolve
 from scipy.signal import detrend as detrend_func
 
 from .extern.dpss import dpss_windows  # this will be in scipy v1.1
-from ..datatype import ChanFreq, ChanTimeFreq
+from ..datatype import ChanTime, ChanFreq, ChanTimeFreq
 from .select import _create_subepochs
+from ..utils.parallel import map_trials
 
 lg = getLogger(__name__)
 
 
 def frequency(data, output='spectraldensity', scaling='power', sides='one',
               taper=None, halfbandwidth=3, NW=None,
-              duration=None, overlap=0.5, step=None, detrend='linear'):
+              duration=None, overlap=0.5, step=None, detrend='linear',
+              block_size=None, n_jobs=1):
     """Compute the
     power spectral density (PSD, output='spectraldensity', scaling='power'), or
     energy spectral density (ESD, output='spectraldensity', scaling='energy') or
@@ -58,6 +61,14 @@ def frequency(data, output='spectraldensity', scaling='power', sides='one',
         overlap).
     step : float, in s
         step in seconds between epochs (alternative to overlap)
+    block_size : int
+        (only if duration is not None) number of epochs whose PSD / ESD is
+        computed at once. The average is accumulated block by block, so that
+        memory does not depend on the number of epochs. If None, all the
+        epochs are computed at once.
+    n_jobs : int
+        number of processes to compute the trials in parallel (-1 uses all
+        the CPUs)
 
     Returns
     -------
@@ -92,39 +103,27 @@ def frequency(data, output='spectraldensity', scaling='power', sides='one',
         raise ValueError('cannot average the complex spectrum over multiple epochs')
 
     if duration is not None:
-        nperseg = int(duration * data.s_freq)
-        if step is not None:
-            nstep = int(step * data.s_freq)
-        else:
-            nstep = nperseg - int(overlap * nperseg)
-
-    freq = ChanFreq()
-    freq.s_freq = data.s_freq
-    freq.start_time = data.start_time
-    freq.axis['chan'] = data.axis['chan']
-    freq.axis['freq'] = empty(data.number_of('trial'), dtype='O')
-    if output == 'complex':
-        freq.axis['taper'] = empty(data.number_of('trial'), dtype='O')
-    freq.data = empty(data.number_of('trial'), dtype='O')
-
-    for i in range(data.number_of('trial')):
-        x = data(trial=i)
-        if duration is not None:
-            x = _create_subepochs(x, nperseg, nstep)
-
-        f, Sxx = _fft(x,
-                      s_freq=data.s_freq,
-                      detrend=detrend,
-                      taper=taper,
-                      output=output,
-                      sides=sides,
-                      scaling=scaling,
-                      halfbandwidth=halfbandwidth,
-                      NW=NW)
-
-        if duration is not None:
-            Sxx = Sxx.mean(axis=-2)
-
+        nperseg, nstep = _compute_nperseg(data.s_freq, duration, overlap, step)
+    else:
+        nperseg = nstep = None
+
+    freq = _create_chanfreq(data, output)
+
+    output_trials = map_trials(_fft_trial, [(x, ) for x in data.data],
+                               n_jobs=n_jobs,
+                               nperseg=nperseg,
+                               nstep=nstep,
+                               block_size=block_size,
+                               s_freq=data.s_freq,
+                               detrend=detrend,
+                               taper=taper,
+                               output=output,
+                               sides=sides,
+                               scaling=scaling,
+                               halfbandwidth=halfbandwidth,
+                               NW=NW)
+
+    for i, (f, Sxx) in enumerate(output_trials):
         freq.axis['freq'][i] = f
         if output == 'complex':
             freq.axis['taper'][i] = arange(Sxx.shape[-1])
@@ -133,7 +132,100 @@ def frequency(data, output='spectraldensity', scaling='power', sides='one',
     return freq
 
 
-def timefrequency(data, method='morlet', time_skip=1, **options):
+def frequency_batch(data, s_freq=None, stacked=False,
+                    output='spectraldensity', scaling='power', sides='one',
+                    taper=None, halfbandwidth=3, NW=None, duration=None,
+                    overlap=0.5, step=None, detrend='linear', block_size=None):
+    """Compute the frequency representation of many segments in one call.
+
+    Parameters
+    ----------
+    data : list of instances of ChanTime or 3d ndarray
+        segments to analyze (each trial of each ChanTime is one segment). If
+        ndarray, the dimensions should be segment x chan x time.
+    s_freq : int
+        sampling frequency (only if data is ndarray)
+    stacked : bool
+        if False, it returns one ChanFreq for each ChanTime in data (or for
+        each segment, if data is ndarray). If True, it returns one ChanFreq
+        with one trial for each segment.
+    output, scaling, sides, taper, halfbandwidth, NW, duration, overlap, step,
+    detrend, block_size :
+        see wonambi.trans.frequency
+
+    Returns
+    -------
+    list of instances of ChanFreq or instance of ChanFreq
+        see "stacked"
+
+    Raises
+    ------
+    TypeError
+        If data is ndarray and s_freq is not specified.
+    ValueError
+        If data is ndarray but it does not have three dimensions.
+
+    Notes
+    -----
+    Segments with the same number of channels, number of samples and sampling
+    frequency are stacked into one array (segment x chan x time), so that
+    detrending, tapering and fft are computed only once for each group. The
+    results are the same as calling frequency on each segment.
+    """
+    if duration is not None and output == 'complex':
+        raise ValueError('cannot average the complex spectrum over multiple epochs')
+
+    if isinstance(data, ndarray):
+        data = _ndarray_to_chantime(data, s_freq)
+
+    for one_data in data:
+        if 'time' not in one_data.list_of_axes:
+            raise TypeError('\'time\' is not in the axis ' +
+                            str(one_data.list_of_axes))
+        if len(one_data.list_of_axes) != one_data.index_of('time') + 1:
+            raise TypeError('\'time\' should be the last axis')
+
+    freqs = [_create_chanfreq(one_data, output) for one_data in data]
+
+    groups = {}
+    for i_data, one_data in enumerate(data):
+        for i_trl in range(one_data.number_of('trial')):
+            key = one_data.data[i_trl].shape, one_data.s_freq
+            groups.setdefault(key, []).append((i_data, i_trl))
+
+    for (shape, group_s_freq), segments in groups.items():
+        lg.debug('Computing fft on {} segments of shape {}'.format(
+            len(segments), shape))
+        x = stack([data[i_data].data[i_trl] for i_data, i_trl in segments])
+        if duration is not None:
+            nperseg, nstep = _compute_nperseg(group_s_freq, duration, overlap,
+                                              step)
+        else:
+            nperseg = nstep = None
+
+        f, Sxx = _fft_trial(x, nperseg, nstep, block_size,
+                            s_freq=group_s_freq,
+                            detrend=detrend,
+                            taper=taper,
+                            output=output,
+                            sides=sides,
+                            scaling=scaling,
+                            halfbandwidth=halfbandwidth,
+                            NW=NW)
+
+        for one_Sxx, (i_data, i_trl) in zip(Sxx, segments):
+            freqs[i_data].axis['freq'][i_trl] = f
+            if output == 'complex':
+                freqs[i_data].axis['taper'][i_trl] = arange(Sxx.shape[-1])
+            freqs[i_data].data[i_trl] = one_Sxx
+
+    if stacked:
+        return _stack_trials(freqs)
+    else:
+        return freqs
+
+
+def timefrequency(data, method='morlet', time_skip=1, n_jobs=1, **options):
     """Compute the power spectrum over time.
 
     Parameters
@@ -146,6 +238,9 @@ def timefrequency(data, method='morlet', time_skip=1, **options):
         'spectrogram' (corresponds to 'spectraldensity' in frequency()),
         'stft' (short-time fourier transform, corresponds to 'complex' in
         frequency())
+    n_jobs : int
+        number of processes to compute the trials in parallel (-1 uses all
+        the CPUs)
     options : dict
         options depend on the method used, see below.
 
@@ -249,52 +344,49 @@ def timefrequency(data, method='morlet', time_skip=1, **options):
     if method == 'morlet':
 
         wavelets = _create_morlet(deepcopy(options), data.s_freq)
+        idx_chan = data.index_of('chan')
+
+        output_trials = map_trials(_morlet_trial,
+                                   [(moveaxis(x, idx_chan, 0), )
+                                    for x in data.data],
+                                   n_jobs=n_jobs,
+                                   wavelets=wavelets,
+                                   time_skip=time_skip)
 
-        for i in range(data.number_of('trial')):
-            lg.info('Processing trial # {0: 6}'.format(i))
+        for i, tf in enumerate(output_trials):
             timefreq.axis['freq'][i] = array(options['foi'])
             timefreq.axis['time'][i] = data.axis['time'][i][::time_skip]
-
-            timefreq.data[i] = empty((data.number_of('chan')[i],
-                                      data.number_of('time')[i] // time_skip,
-                                      len(options['foi'])),
-                                     dtype='complex')
-            for i_c, chan in enumerate(data.axis['chan'][i]):
-                dat = data(trial=i, chan=chan)
-                for i_f, wavelet in enumerate(wavelets):
-                    tf = fftconvolve(dat, wavelet, 'same')
-                    timefreq.data[i][i_c, :, i_f] = tf[::time_skip]
+            timefreq.data[i] = tf
 
         if time_skip != 1:
             warn('sampling frequency in s_freq refers to the input data, '
                  'not to the timefrequency output')
 
     elif method in ('spectrogram', 'stft'):  # TODO: add timeskip
-        nperseg = int(options['duration'] * data.s_freq)
-        if options['step'] is not None:
-            nstep = int(options['step'] * data.s_freq)
-        else:
-            nstep = nperseg - int(options['overlap'] * nperseg)
+        nperseg, nstep = _compute_nperseg(data.s_freq, options['duration'],
+                                          options['overlap'], options['step'])
 
         if method == 'spectrogram':
             output = 'spectraldensity'
         elif method == 'stft':
             output = 'complex'
 
-        for i in range(data.number_of('trial')):
+        output_trials = map_trials(_spectrogram_trial,
+                                   [(x, ) for x in data.data],
+                                   n_jobs=n_jobs,
+                                   nperseg=nperseg,
+                                   nstep=nstep,
+                                   s_freq=data.s_freq,
+                                   detrend=options['detrend'],
+                                   taper=options['taper'],
+                                   output=output,
+                                   sides=options['sides'],
+                                   scaling=options['scaling'],
+                                   halfbandwidth=options['halfbandwidth'],
+                                   NW=options['NW'])
+
+        for i, (f, Sxx) in enumerate(output_trials):
             t = _create_subepochs(data.time[i], nperseg, nstep).mean(axis=1)
-            x = _create_subepochs(data(trial=i), nperseg, nstep)
-
-            f, Sxx = _fft(x,
-                          s_freq=data.s_freq,
-                          detrend=options['detrend'],
-                          taper=options['taper'],
-                          output=output,
-                          sides=options['sides'],
-                          scaling=options['scaling'],
-                          halfbandwidth=options['halfbandwidth'],
-                          NW=options['NW'])
-
             timefreq.axis['time'][i] = t
             timefreq.axis['freq'][i] = f
             if method == 'stft':
@@ -304,6 +396,174 @@ def timefrequency(data, method='morlet', time_skip=1, **options):
     return timefreq
 
 
+def _compute_nperseg(s_freq, duration, overlap=None, step=None):
+    """Convert duration and overlap / step of the subepochs into samples."""
+    nperseg = int(duration * s_freq)
+    if step is not None:
+        nstep = int(step * s_freq)
+    else:
+        nstep = nperseg - int(overlap * nperseg)
+
+    return nperseg, nstep
+
+
+def _fft_trial(x, nperseg=None, nstep=None, block_size=None, **options):
+    """Compute the frequency representation of one trial, averaging over
+    epochs if nperseg is specified (see _fft_subepochs and _fft)."""
+    if nperseg is None:
+        return _fft(x, **options)
+    else:
+        return _fft_subepochs(x, nperseg, nstep, block_size, **options)
+
+
+def _spectrogram_trial(x, nperseg, nstep, **options):
+    """Compute the frequency representation of each epoch in one trial."""
+    return _fft(_create_subepochs(x, nperseg, nstep), **options)
+
+
+def _morlet_trial(x, wavelets, time_skip=1):
+    """Convolve each channel of one trial with the wavelets.
+
+    Parameters
+    ----------
+    x : 2d ndarray
+        data of one trial (chan x time)
+    wavelets : list of ndarray
+        complex morlet wavelets (see _create_morlet)
+    time_skip : int
+        number of time points to skip
+
+    Returns
+    -------
+    3d ndarray
+        chan x time x freq (complex)
+    """
+    n_time = len(range(0, x.shape[1], time_skip))
+    tf = empty((x.shape[0], n_time, len(wavelets)), dtype='complex')
+    for i_c, dat in enumerate(x):
+        for i_f, wavelet in enumerate(wavelets):
+            tf[i_c, :, i_f] = fftconvolve(dat, wavelet, 'same')[::time_skip]
+
+    return tf
+
+
+def _fft_subepochs(x, nperseg, nstep, block_size=None, **options):
+    """Average the PSD / ESD over the epochs of x, one block at a time.
+
+    Parameters
+    ----------
+    x : ndarray
+        input data (epochs will be created on the last dimension)
+    nperseg : int
+        number of samples in each epoch
+    nstep : int
+        distance in samples between epochs
+    block_size : int
+        number of epochs to compute at once. If None, all the epochs are
+        computed at once.
+    **options
+        options passed to _fft
+
+    Returns
+    -------
+    freqs : 1d ndarray
+        vector with frequencies
+    result : ndarray
+        PSD / ESD averaged over the epochs. It has the same number of dim as
+        the input.
+
+    Notes
+    -----
+    The epochs are a view of x, but _fft creates a few copies of the data
+    (detrending, tapering, fft). By processing only block_size epochs at
+    once, the memory usage does not depend on the number of epochs.
+    """
+    if block_size is not None and block_size < 1:
+        raise ValueError('block_size should be a positive integer, not ' +
+                         str(block_size))
+
+    x = _create_subepochs(x, nperseg, nstep)
+    n_epochs = x.shape[-2]
+
+    if block_size is None or block_size >= n_epochs:
+        freqs, result = _fft(x, **options)
+        return freqs, result.mean(axis=-2)
+
+    result = None
+    for i0 in range(0, n_epochs, block_size):
+        lg.debug('Epochs {0: 6}-{1: 6} of {2: 6}'.format(
+            i0, min(i0 + block_size, n_epochs), n_epochs))
+        freqs, block = _fft(x[..., i0:i0 + block_size, :], **options)
+        if result is None:
+            result = block.sum(axis=-2)
+        else:
+            result += block.sum(axis=-2)
+
+    result /= n_epochs
+
+    return freqs, result
+
+
+def _create_chanfreq(data, output):
+    """Create an empty ChanFreq with the same trials and channels as data."""
+    freq = ChanFreq()
+    freq.s_freq = data.s_freq
+    freq.start_time = data.start_time
+    freq.axis['chan'] = data.axis['chan']
+    freq.axis['freq'] = empty(data.number_of('trial'), dtype='O')
+    if output == 'complex':
+        freq.axis['taper'] = empty(data.number_of('trial'), dtype='O')
+    freq.data = empty(data.number_of('trial'), dtype='O')
+
+    return freq
+
+
+def _ndarray_to_chantime(x, s_freq):
+    """Convert a 3d array (segment x chan x time) into a list of ChanTime."""
+    if s_freq is None:
+        raise TypeError('You need to specify s_freq if data is ndarray')
+    if x.ndim != 3:
+        raise ValueError('data should have three dimensions (segment x chan '
+                         'x time), not ' + str(x.ndim))
+
+    chan_name = asarray(['chan{0:02}'.format(i) for i in range(x.shape[1])],
+                        dtype='U')
+    time = arange(x.shape[2]) / s_freq
+
+    output = []
+    for one_x in x:
+        data = ChanTime()
+        data.s_freq = s_freq
+        data.data = empty(1, dtype='O')
+        data.data[0] = one_x
+        data.axis['chan'] = empty(1, dtype='O')
+        data.axis['chan'][0] = chan_name
+        data.axis['time'] = empty(1, dtype='O')
+        data.axis['time'][0] = time
+        output.append(data)
+
+    return output
+
+
+def _stack_trials(all_data):
+    """Combine a list of Data into one Data, with one trial per trial."""
+    output = all_data[0]._copy(axis=False, attr=False)
+    n_trial = sum(x.number_of('trial') for x in all_data)
+    output.data = empty(n_trial, dtype='O')
+    for one_axis in output.axis:
+        output.axis[one_axis] = empty(n_trial, dtype='O')
+
+    i = 0
+    for one_data in all_data:
+        for i_trl in range(one_data.number_of('trial')):
+            output.data[i] = one_data.data[i_trl]
+            for one_axis in output.axis:
+                output.axis[one_axis][i] = one_data.axis[one_axis][i_trl]
+            i += 1
+
+    return output
+
+
 def _create_morlet(options, s_freq):
     """Create morlet wavelets, with scipy.signal doing the actual computation.
 
@@ -508,27 +768,12 @@ def _fft(x, s_freq, detrend='linear', taper=None, output='spectraldensity',
 
     if taper is None:
         taper = 'boxcar'
+    elif isinstance(taper, list):
+        taper = tuple(taper)  # the tapers are cached, so taper must be hashable
 
-    if taper == 'dpss':
-        if NW is None:
-            NW = halfbandwidth * n_smp / s_freq
-        tapers, eig = dpss_windows(n_smp, NW, 2 * NW - 1)
-        if scaling == 'chronux':
-            tapers *= sqrt(s_freq)
-
-    else:
-        if taper == 'hann':
-            tapers = windows.hann(n_smp, sym=False)[None, :]
-        else:
-            # TODO: it'd be nice to use sym=False if possible, but the difference is very small
-            tapers = get_window(taper, n_smp)[None, :]
-
-        if scaling == 'energy':
-            rms = sqrt(mean(tapers ** 2))
-            tapers /= rms * sqrt(n_smp)
-        elif scaling != 'chronux':
-            # idk how chronux treats other windows apart from dpss
-            tapers /= norm(tapers)
+    if taper == 'dpss' and NW is None:
+        NW = halfbandwidth * n_smp / s_freq
+    tapers = _create_tapers(n_smp, s_freq, taper, scaling, NW)
 
     if detrend is not None:
         x = detrend_func(x, axis=axis, type=detrend)
@@ -576,3 +821,55 @@ def _fft(x, s_freq, detrend='linear', taper=None, output='spectraldensity',
         result = swapaxes(result, axis, -1)
 
     return freqs, result
+
+
+@lru_cache(maxsize=32)
+def _create_tapers(n_smp, s_freq, taper, scaling, NW):
+    """Create the tapers, normalized according to the scaling.
+
+    Parameters
+    ----------
+    n_smp : int
+        number of samples in each taper
+    s_freq : int
+        sampling frequency
+    taper : str or tuple
+        one of the windows in scipy (with its parameters, as tuple), or 'dpss'
+    scaling : str
+        'power', 'energy', 'fieldtrip', 'chronux'
+    NW : float
+        (only if taper='dpss') Normalized half bandwidth
+
+    Returns
+    -------
+    2d ndarray
+        tapers (n_tapers x n_smp). It is read-only, because the same array is
+        reused every time the same tapers are requested.
+
+    Notes
+    -----
+    The tapers are cached because the computation of the dpss tapers is
+    expensive, and it would be repeated for each trial (and for each block of
+    epochs) of the same length.
+    """
+    if taper == 'dpss':
+        tapers, eig = dpss_windows(n_smp, NW, 2 * NW - 1)
+        if scaling == 'chronux':
+            tapers *= sqrt(s_freq)
+
+    else:
+        if taper == 'hann':
+            tapers = windows.hann(n_smp, sym=False)[None, :]
+        else:
+            # TODO: it'd be nice to use sym=False if possible, but the difference is very small
+            tapers = get_window(taper, n_smp)[None, :]
+
+        if scaling == 'energy':
+            rms = sqrt(mean(tapers ** 2))
+            tapers /= rms * sqrt(n_smp)
+        elif scaling != 'chronux':
+            # idk how chronux treats other windows apart from dpss
+            tapers /= norm(tapers)
+
+    tapers.setflags(write=False)
+    return tapers
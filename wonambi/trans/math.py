@@ -10,23 +10,29 @@ from numpy import (absolute,
                    exp,
                    log,
                    log10,
+                   may_share_memory,
                    median,
                    mean,
+                   ndarray,
                    pad,
                    sqrt,
                    square,
                    sum,
                    std,
                    unwrap)
-from scipy.signal import detrend, hilbert
+from scipy.signal import detrend
 from scipy.stats import mode
 
+from .envelope import envelope, hilbert
+from ..utils.parallel import map_trials
+
 lg = getLogger(__name__)
 
 NOKEEPDIM = (median, mode)
 
 
-def math(data, operator=None, operator_name=None, axis=None):
+def math(data, operator=None, operator_name=None, axis=None, inplace=False,
+         n_jobs=1):
     """Apply mathematical operation to each trial and channel individually.
 
     Parameters
@@ -39,6 +45,13 @@ def math(data, operator=None, operator_name=None, axis=None):
         name of the function(s) to run on the data.
     axis : str, optional
         for functions that accept it, which axis you should run it on.
+    inplace : bool, optional
+        if True, the point-wise operators overwrite the data of the input
+        (which should not be used afterwards), instead of creating new arrays.
+    n_jobs : int
+        number of processes to compute the trials in parallel (-1 uses all
+        the CPUs). The operators need to be picklable (f.e. not lambdas) and
+        inplace has no effect on the input data.
 
     Returns
     -------
@@ -66,11 +79,17 @@ def math(data, operator=None, operator_name=None, axis=None):
     'unwrap'
 
     The operator_name's that need an axis, but do not remove it:
-    'hilbert', 'diff', 'detrend'
+    'hilbert', 'envelope', 'diff', 'detrend'
 
     The operator_name's that need an axis and remove it:
     'mean', 'median', 'mode', 'std'
 
+    Consecutive operators are applied to each trial in turn. The point-wise
+    operators 'absolute', 'dB', 'exp', 'log', 'sqrt', 'square' reuse the
+    array created by the previous operator (or the input data, if inplace is
+    True), so that a chain of operators allocates only one new array.
+    Operators that remove an axis only allocate the reduced result.
+
     Examples
     --------
     You can pass a single value or a tuple. The order starts from left to
@@ -78,6 +97,11 @@ def math(data, operator=None, operator_name=None, axis=None):
 
     >>> rms = math(data, operator_name=('hilbert', 'abs'), axis='time')
 
+    which is the same as 'envelope' (the FFT is computed on the zero-padded
+    data, see trans.envelope):
+
+    >>> rms = math(data, operator_name='envelope', axis='time')
+
     If you want to pass the power of three, use lambda (or partial):
 
     >>> p3 = lambda x: power(x, 3)
@@ -145,51 +169,79 @@ def math(data, operator=None, operator_name=None, axis=None):
                            'keepdims': keepdims,
                            })
 
+    for op in operations:
+        lg.info('running operator: ' + op['name'])
+        if op['func'] == mode:
+            op['func'] = _mode
+
     output = data._copy()
 
     if axis is not None:
         idx_axis = data.index_of(axis)
+    else:
+        idx_axis = None
+
+    try:
+        output_trials = map_trials(_math_trial, [(x, ) for x in data.data],
+                                   n_jobs=n_jobs,
+                                   operations=operations,
+                                   idx_axis=idx_axis,
+                                   inplace=inplace)
+
+    except IndexError:
+        raise ValueError('The axis ' + axis + ' does not exist in [' +
+                         ', '.join(list(data.axis.keys())) + ']')
+
+    for i, x in enumerate(output_trials):
+        output.data[i] = x
 
-    first_op = True
     for op in operations:
-        lg.info('running operator: ' + op['name'])
-        func = op['func']
+        if op['on_axis'] and not op['keepdims']:
+            del output.axis[axis]
 
-        if func == mode:
-            func = lambda x, axis: mode(x, axis=axis)[0]
+    return output
 
-        for i in range(output.number_of('trial')):
 
-            # don't copy original data, but use data if it's the first operation
-            if first_op:
-                x = data(trial=i)
-            else:
-                x = output(trial=i)
+def _math_trial(x, operations, idx_axis, inplace=False):
+    """Apply the chain of operations to the data of one trial."""
+    # don't copy original data, the first operation creates a new array
+    x0 = x
+    owned = inplace
 
-            if op['on_axis']:
-                lg.debug('running ' + op['name'] + ' on ' + str(idx_axis))
+    for op in operations:
+        func = op['func']
 
-                try:
-                    if func == diff:
-                        lg.debug('Diff has one-point of zero padding')
-                        x = _pad_one_axis_one_value(x, idx_axis)
-                    output.data[i] = func(x, axis=idx_axis)
+        if op['on_axis']:
+            lg.debug('running ' + op['name'] + ' on ' + str(idx_axis))
+            if func == diff:
+                lg.debug('Diff has one-point of zero padding')
+                x = _pad_one_axis_one_value(x, idx_axis)
+            x = func(x, axis=idx_axis)
 
-                except IndexError:
-                    raise ValueError('The axis ' + axis + ' does not '
-                                     'exist in [' +
-                                     ', '.join(list(data.axis.keys())) + ']')
+        elif owned and func in INPLACE and _writeable_float(x):
+            lg.debug('running ' + op['name'] + ' on each datapoint, '
+                     'in place')
+            func(x, out=x)
 
-            else:
-                lg.debug('running ' + op['name'] + ' on each datapoint')
-                output.data[i] = func(x)
+        else:
+            lg.debug('running ' + op['name'] + ' on each datapoint')
+            x = func(x)
 
-        first_op = False
+        # user-defined operators might return a view of the input data
+        owned = inplace or not may_share_memory(x, x0)
 
-        if op['on_axis'] and not op['keepdims']:
-            del output.axis[axis]
+    return x
+
+
+def _writeable_float(x):
+    """Operators might return numpy scalars or read-only arrays, which cannot
+    be used as output."""
+    return (isinstance(x, ndarray) and x.flags.writeable and
+            x.dtype.kind == 'f')
 
-    return output
+
+def _mode(x, axis):
+    return mode(x, axis=axis)[0]
 
 
 def _pad_one_axis_one_value(x, idx_axis):
@@ -199,5 +251,11 @@ def _pad_one_axis_one_value(x, idx_axis):
 
 
 # additional operators
-def dB(x):
-    return 10 * log10(x)
+def dB(x, out=None):
+    out = log10(x, out=out)
+    out *= 10
+    return out
+
+
+# point-wise operators which can write their output into the input
+INPLACE = (absolute, dB, exp, log, sqrt, square)
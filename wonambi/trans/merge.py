@@ -4,13 +4,14 @@ It does not merge two instances of Data together (TODO).
 """
 from logging import getLogger
 
-from numpy import asarray, empty, expand_dims, unique
+from numpy import asarray, diff, empty, result_type, unique
 from numpy import concatenate as cat
+from numpy.lib.stride_tricks import as_strided
 
 lg = getLogger(__name__)
 
 
-def concatenate(data, axis):
+def concatenate(data, axis, check_unique=True):
     """Concatenate multiple trials into one trials, according to any dimension.
 
     Parameters
@@ -19,6 +20,8 @@ def concatenate(data, axis):
 
     axis : str
         axis that you want to concatenate (it can be 'trial')
+    check_unique : bool
+        if True, it warns when the values of one axis are not unique
 
     Returns
     -------
@@ -34,6 +37,11 @@ def concatenate(data, axis):
     If you want to concatenate across trials, you need:
 
     >>> expand_dims(data1.data[0], axis=1).shape
+
+    If the trials are already stored at regular intervals in one array (f.e.
+    the output of Dataset.read_epochs), the concatenated data along 'trial' is
+    a view of that array (so you should not modify it in place). Otherwise,
+    the output array is allocated once and each trial is copied into it.
     """
     output = data._copy(axis=False)
 
@@ -45,7 +53,7 @@ def concatenate(data, axis):
         else:
             output.axis[dataaxis][0] = data.axis[dataaxis][0]
 
-        if len(unique(output.axis[dataaxis][0])) != len(output.axis[dataaxis][0]):
+        if check_unique and not _is_unique(output.axis[dataaxis][0]):
             lg.warning('Axis ' + dataaxis + ' does not have unique values')
 
     output.data = empty(1, dtype='O')
@@ -59,12 +67,81 @@ def concatenate(data, axis):
         output.axis['trial_axis'] = new_axis
 
         # concatenate along the extra dimension
-        all_trial = []
-        for one_trial in data.data:
-            all_trial.append(expand_dims(one_trial, -1))
-        output.data[0] = cat(all_trial, axis=-1)
+        output.data[0] = _stack_last(data.data)
 
     else:
         output.data[0] = cat(data.data, axis=output.index_of(axis))
 
     return output
+
+
+def _is_unique(values):
+    """Check if the values are unique, in O(n) if they are sorted."""
+    if len(values) < 2:
+        return True
+
+    if values.dtype.kind in 'iuf':
+        if (diff(values) > 0).all():
+            return True
+        return len(unique(values)) == len(values)
+
+    return len(set(values)) == len(values)
+
+
+def _stack_last(trials):
+    """Stack the trials along a new last dimension.
+
+    Parameters
+    ----------
+    trials : ndarray (dtype='O')
+        the data of each trial, all with the same shape
+
+    Returns
+    -------
+    ndarray
+        all the trials, with the trial as last dimension. It's a view if all
+        the trials are at regular intervals in the same buffer.
+    """
+    view = _view_of_buffer(trials)
+    if view is not None:
+        lg.debug('Trials are in the same buffer, concatenating as a view')
+        return view
+
+    first = trials[0]
+    output = empty(first.shape + (len(trials), ),
+                   dtype=result_type(*trials))
+    for i, one_trial in enumerate(trials):
+        output[..., i] = one_trial
+
+    return output
+
+
+def _view_of_buffer(trials):
+    """Return a view of all the trials, if they are stored at regular
+    intervals in the same buffer (f.e. the rows of a 3d array).
+
+    Returns
+    -------
+    ndarray or None
+        view with the trial as last dimension, or None if the trials are not
+        in the same buffer
+    """
+    first = trials[0]
+    if len(trials) < 2 or first.base is None:
+        return None
+
+    pointers = []
+    for one_trial in trials:
+        if (one_trial.base is not first.base or
+                one_trial.shape != first.shape or
+                one_trial.strides != first.strides or
+                one_trial.dtype != first.dtype):
+            return None
+        pointers.append(one_trial.__array_interface__['data'][0])
+
+    step = diff(pointers)
+    if step[0] == 0 or not (step == step[0]).all():
+        return None
+
+    return as_strided(first, shape=first.shape + (len(trials), ),
+                      strides=first.strides + (int(step[0]), ))
@@ -1,14 +1,20 @@
+from functools import lru_cache
 from logging import getLogger
 
-from numpy import asarray, dot, zeros, where, c_, mean
-from numpy.linalg import norm
+from numpy import (asarray, arange, c_, clip, eye, mean, moveaxis, NaN, ones,
+                   outer, pi, r_)
+from numpy.linalg import inv, norm
+from numpy.polynomial.legendre import legval
+from scipy.sparse import csr_matrix
+from scipy.spatial import cKDTree
 
 from ..attr import Channels
 
 lg = getLogger(__name__)
 
 
-def montage(data, ref_chan=None, ref_to_avg=False, bipolar=None):
+def montage(data, ref_chan=None, ref_to_avg=False, bipolar=None,
+            laplacian=None, csd=None):
     """Apply linear transformation to the channels.
 
     Parameters
@@ -22,6 +28,15 @@ def montage(data, ref_chan=None, ref_to_avg=False, bipolar=None):
     bipolar : float
         distance in mm to consider two channels as neighbors and then compute
         the bipolar montage between them.
+    laplacian : float
+        distance in mm to consider two channels as neighbors and then
+        re-reference each channel to the average of its neighbors (Hjorth, or
+        nearest-neighbor, Laplacian).
+    csd : bool or dict
+        if True, compute the current source density (surface Laplacian) with
+        spherical splines. You can pass a dict with the options (see
+        _compile_csd): 'm' (order of the splines, default 4), 'smoothing'
+        (default 1e-5), 'n_terms' (of the Legendre series, default 50).
 
     Returns
     -------
@@ -31,6 +46,15 @@ def montage(data, ref_chan=None, ref_to_avg=False, bipolar=None):
     Notes
     -----
     If you don't change anything, it returns the same instance of data.
+
+    Each montage is compiled into a sparse matrix (or, for references, into
+    the indices of the reference channels), which is cached based on the
+    channels and their positions, so that it can be reused for each trial
+    and for each call with the same channels (f.e. when scrolling in the
+    GUI). The neighbors are found with a KD-tree on the channel positions.
+    The current source density is expensive to compute (Legendre series for
+    each pair of channels), but once it's computed for one layout, it's only
+    one matrix product per trial.
     """
     if ref_to_avg and ref_chan is not None:
         raise TypeError('You cannot specify reference to the average and '
@@ -44,7 +68,23 @@ def montage(data, ref_chan=None, ref_to_avg=False, bipolar=None):
     if ref_chan is None:
         ref_chan = []  # TODO: check bool for ref_chan
 
-    if bipolar:
+    if sum(bool(x) for x in (ref_to_avg or ref_chan, bipolar, laplacian,
+                             csd)) > 1:
+        raise TypeError('You can only specify one of reference, bipolar, '
+                        'laplacian or csd montage')
+
+    if not (ref_to_avg or ref_chan or bipolar or laplacian or csd):
+        return data
+
+    if csd:
+        csd_options = {'m': 4,
+                       'smoothing': 1e-5,
+                       'n_terms': 50,
+                       }
+        if isinstance(csd, dict):
+            csd_options.update(csd)
+
+    if bipolar or laplacian or csd:
         if not data.attr['chan']:
             raise ValueError('Data should have Chan information in attr')
 
@@ -52,33 +92,41 @@ def montage(data, ref_chan=None, ref_to_avg=False, bipolar=None):
         chan_in_data = data.axis['chan'][0]
         chan = data.attr['chan']
         chan = chan(lambda x: x.label in chan_in_data)
-        chan, trans = create_bipolar_chan(chan, bipolar)
-        data.attr['chan'] = chan
+        chan_labels = tuple(chan.return_label())
+        chan_xyz = tuple(tuple(xyz) for xyz in chan.return_xyz().tolist())
 
-    if ref_to_avg or ref_chan or bipolar:
-        mdata = data._copy()
+    if bipolar and not data.index_of('chan') == 0:
+        raise ValueError('For matrix multiplication to work, '
+                         'the first dimension should be chan')
 
-        for i in range(mdata.number_of('trial')):
-            if ref_to_avg or ref_chan:
-                if ref_to_avg:
-                    ref_chan = data.axis['chan'][0]
+    mdata = data._copy()
+    idx_chan = data.index_of('chan')
 
-                ref_data = data(trial=i, chan=ref_chan)
-                mdata.data[i] = (data(trial=i) -
-                                 mean(ref_data,
-                                      axis=mdata.index_of('chan')))
+    for i in range(mdata.number_of('trial')):
+        labels = tuple(data.axis['chan'][i])
 
-            elif bipolar:
+        if ref_to_avg or ref_chan:
+            if ref_to_avg:
+                ref_chan = data.axis['chan'][0]
+            mtg = _compile_reference(labels, tuple(ref_chan))
 
-                if not data.index_of('chan') == 0:
-                    raise ValueError('For matrix multiplication to work, '
-                                     'the first dimension should be chan')
-                mdata.data[i] = dot(trans, data(trial=i))
-                mdata.axis['chan'][i] = asarray(chan.return_label(),
-                                                dtype='U')
+        elif bipolar:
+            mtg = _compile_bipolar(labels, chan_labels, chan_xyz, bipolar)
 
-    else:
-        mdata = data
+        elif laplacian:
+            mtg = _compile_laplacian(labels, chan_labels, chan_xyz,
+                                     laplacian)
+
+        elif csd:
+            mtg = _compile_csd(labels, chan_labels, chan_xyz,
+                               **csd_options)
+
+        mdata.data[i] = _apply_montage(mtg, data.data[i], idx_chan)
+        if mtg['labels'] != labels:
+            mdata.axis['chan'][i] = asarray(mtg['labels'], dtype='U')
+
+    if bipolar:
+        mdata.attr['chan'] = Channels(list(mtg['labels']), asarray(mtg['xyz']))
 
     return mdata
 
@@ -103,34 +151,300 @@ def _assert_equal_channels(axis):
 
 
 def create_bipolar_chan(chan, max_dist):
-    chan_dist = zeros((chan.n_chan, chan.n_chan), dtype='bool')
-    for i0, chan0 in enumerate(chan.chan):
-        for i1, chan1 in enumerate(chan.chan):
-            if i0 < i1 and norm(chan0.xyz - chan1.xyz) < max_dist:
-                chan_dist[i0, i1] = True
+    """Create bipolar channels between neighboring channels.
+
+    Parameters
+    ----------
+    chan : instance of Channels
+        channels with their positions
+    max_dist : float
+        distance in mm to consider two channels as neighbors
+
+    Returns
+    -------
+    instance of Channels
+        bipolar channels, located halfway between the two channels
+    scipy.sparse.csr_matrix
+        n_bipolar x n_chan matrix to convert the data into bipolar montage
+    """
+    labels = tuple(chan.return_label())
+    xyz = tuple(tuple(x) for x in chan.return_xyz().tolist())
+    mtg = _compile_bipolar(labels, labels, xyz, max_dist)
+
+    bipolar = Channels(list(mtg['labels']), asarray(mtg['xyz']))
+
+    return bipolar, mtg['trans']
+
+
+def _find_neighbors(xyz, max_dist):
+    """Find pairs of channels which are closer than max_dist.
+
+    Parameters
+    ----------
+    xyz : ndarray
+        n_chan x 3 matrix with the positions of the channels
+    max_dist : float
+        distance in mm to consider two channels as neighbors
 
-    x_all, y_all = where(chan_dist)
+    Returns
+    -------
+    list of tuple of int
+        pairs of indices (i0 < i1), sorted by i0 and then i1
+    """
+    if len(xyz) == 0:
+        return []
+
+    pairs = cKDTree(xyz).query_pairs(max_dist)
+    # query_pairs includes the channels exactly at max_dist
+    return sorted((i0, i1) for i0, i1 in pairs
+                  if norm(xyz[i0] - xyz[i1]) < max_dist)
+
+
+@lru_cache(maxsize=64)
+def _compile_reference(labels, ref_chan):
+    """Compile the montage to re-reference to some channels (or average).
+
+    Parameters
+    ----------
+    labels : tuple of str
+        labels of the channels in the data
+    ref_chan : tuple of str
+        labels of the reference channels
+
+    Returns
+    -------
+    dict
+        with 'labels' (labels of the output) and 'idx_ref' (indices of the
+        reference channels, or None if some are missing)
+    """
+    idx = {label: i for i, label in reversed(list(enumerate(labels)))}
+    missing = [x for x in ref_chan if x not in idx]
+    if missing:
+        lg.warning('Reference channels ' + ', '.join(missing) + ' are not '
+                   'in the data')
+        idx_ref = None
+    else:
+        idx_ref = asarray([idx[x] for x in ref_chan], dtype=int)
+
+    return {'labels': labels,
+            'idx_ref': idx_ref,
+            'trans': None,
+            }
+
+
+@lru_cache(maxsize=64)
+def _compile_bipolar(labels, chan_labels, chan_xyz, max_dist):
+    """Compile the bipolar montage into a sparse matrix.
+
+    Parameters
+    ----------
+    labels : tuple of str
+        labels of the channels in the data
+    chan_labels : tuple of str
+        labels of the channels with positions (they define the order of the
+        bipolar channels)
+    chan_xyz : tuple of tuple of float
+        positions of the channels in chan_labels
+    max_dist : float
+        distance in mm to consider two channels as neighbors
+
+    Returns
+    -------
+    dict
+        with 'labels' and 'xyz' (labels and positions of the bipolar
+        channels) and 'trans' (sparse matrix, n_bipolar x n_chan in data)
+    """
+    xyz = asarray(chan_xyz).reshape(-1, 3)
+    idx = {label: i for i, label in reversed(list(enumerate(labels)))}
 
     bipolar_labels = []
     bipolar_xyz = []
-    bipolar_trans = []
+    rows = []
+    cols = []
+    values = []
 
-    for x0, x1 in zip(x_all, y_all):
+    for x0, x1 in _find_neighbors(xyz, max_dist):
+        bipolar_labels.append(chan_labels[x0] + '-' + chan_labels[x1])
+        bipolar_xyz.append(mean(c_[xyz[x0], xyz[x1]], axis=1))
 
-        new_label = chan.chan[x0].label + '-' + chan.chan[x1].label
-        bipolar_labels.append(new_label)
+        n_bipolar = len(bipolar_labels) - 1
+        rows.extend((n_bipolar, n_bipolar))
+        cols.extend((idx[chan_labels[x0]], idx[chan_labels[x1]]))
+        values.extend((1, -1))
 
-        xyz = mean(c_[chan.chan[x0].xyz, chan.chan[x1].xyz], axis=1)
-        bipolar_xyz.append(xyz)
+    trans = csr_matrix((values, (rows, cols)),
+                       shape=(len(bipolar_labels), len(labels)))
+
+    return {'labels': tuple(bipolar_labels),
+            'xyz': asarray(bipolar_xyz).reshape(-1, 3),
+            'idx_ref': None,
+            'trans': trans,
+            }
+
+
+@lru_cache(maxsize=64)
+def _compile_laplacian(labels, chan_labels, chan_xyz, max_dist):
+    """Compile the nearest-neighbor (Hjorth) Laplacian into a sparse matrix.
+
+    Parameters
+    ----------
+    labels : tuple of str
+        labels of the channels in the data
+    chan_labels : tuple of str
+        labels of the channels with positions
+    chan_xyz : tuple of tuple of float
+        positions of the channels in chan_labels
+    max_dist : float
+        distance in mm to consider two channels as neighbors
+
+    Returns
+    -------
+    dict
+        with 'labels' (same as the input) and 'trans' (sparse matrix,
+        n_chan x n_chan)
+
+    Raises
+    ------
+    ValueError
+        if some channels in the data do not have a position
+    """
+    missing = [x for x in labels if x not in chan_labels]
+    if missing:
+        raise ValueError('Channels ' + ', '.join(missing) + ' do not have '
+                         'a position in attr')
+
+    xyz = asarray(chan_xyz).reshape(-1, 3)
+    idx = [labels.index(x) for x in chan_labels]
+
+    neighbors = [[] for x in chan_labels]
+    for x0, x1 in _find_neighbors(xyz, max_dist):
+        neighbors[x0].append(x1)
+        neighbors[x1].append(x0)
+
+    rows = []
+    cols = []
+    values = []
+    for x0, one_neighbors in enumerate(neighbors):
+        rows.append(idx[x0])
+        cols.append(idx[x0])
+        values.append(1)
+
+        if not one_neighbors:
+            lg.warning('Channel ' + chan_labels[x0] + ' has no neighbors')
+            continue
+
+        rows.extend([idx[x0]] * len(one_neighbors))
+        cols.extend(idx[x1] for x1 in one_neighbors)
+        values.extend([-1 / len(one_neighbors)] * len(one_neighbors))
+
+    trans = csr_matrix((values, (rows, cols)),
+                       shape=(len(labels), len(labels)))
+
+    return {'labels': labels,
+            'idx_ref': None,
+            'trans': trans,
+            }
+
+
+@lru_cache(maxsize=16)
+def _compile_csd(labels, chan_labels, chan_xyz, m=4, smoothing=1e-5,
+                 n_terms=50):
+    """Compile the current source density (spherical splines) into a matrix.
+
+    Parameters
+    ----------
+    labels : tuple of str
+        labels of the channels in the data
+    chan_labels : tuple of str
+        labels of the channels with positions
+    chan_xyz : tuple of tuple of float
+        positions of the channels in chan_labels
+    m : int
+        order of the splines (flexibility, 4 is commonly used)
+    smoothing : float
+        regularization added to the diagonal of G
+    n_terms : int
+        number of terms of the Legendre series
+
+    Returns
+    -------
+    dict
+        with 'labels' (same as the input) and 'trans' (n_chan x n_chan)
+
+    Raises
+    ------
+    ValueError
+        if some channels in the data do not have a position
+
+    Notes
+    -----
+    It follows Perrin et al. (1989) Electroenceph Clin Neurophysiol, with the
+    same implementation as the CSD toolbox by Kayser and Tenke. The
+    positions are projected onto a unit sphere centered at the origin, so
+    the output is in units of the input per unit area of the unit sphere.
+    G and H are computed from the Legendre series of the cosine of the
+    angle between each pair of channels. The interpolation constraint (the
+    spline coefficients sum to zero) is folded into the matrix, so that
+    CSD = H (Gi - Gi 1 1' Gi / 1' Gi 1) V, where Gi is the inverse of the
+    regularized G.
+    """
+    missing = [x for x in labels if x not in chan_labels]
+    if missing:
+        raise ValueError('Channels ' + ', '.join(missing) + ' do not have '
+                         'a position in attr')
+
+    xyz = asarray(chan_xyz).reshape(-1, 3)
+    xyz = xyz[[chan_labels.index(x) for x in labels], :]
+    xyz = xyz / norm(xyz, axis=1)[:, None]
+    cos_angle = clip(xyz.dot(xyz.T), -1, 1)
+
+    n = arange(1, n_terms + 1, dtype=float)  # n ** m overflows as int
+    coef_g = (2 * n + 1) / (n ** m * (n + 1) ** m) / (4 * pi)
+    coef_h = - (2 * n + 1) / (n ** (m - 1) * (n + 1) ** (m - 1)) / (4 * pi)
+    # legval starts from the polynomial of order 0
+    G = legval(cos_angle, r_[0, coef_g])
+    H = legval(cos_angle, r_[0, coef_h])
+
+    Gi = inv(G + smoothing * eye(len(labels)))
+    TC = Gi.sum(axis=0)
+    trans = H.dot(Gi - outer(TC, TC) / TC.sum())
+
+    return {'labels': labels,
+            'idx_ref': None,
+            'trans': trans,
+            }
+
+
+def _apply_montage(mtg, x, idx_chan):
+    """Apply a compiled montage to the data of one trial.
+
+    Parameters
+    ----------
+    mtg : dict
+        compiled montage (see _compile_reference, _compile_bipolar)
+    x : ndarray
+        data of one trial
+    idx_chan : int
+        index of the channel dimension
+
+    Returns
+    -------
+    ndarray
+        data after montage (the channel dimension might have a different
+        length)
+    """
+    x = moveaxis(x, idx_chan, 0)
+    shape = x.shape
+    x = x.reshape(shape[0], -1)
 
-        trans = zeros(chan.n_chan)
-        trans[x0] = 1
-        trans[x1] = -1
-        bipolar_trans.append(trans)
+    if mtg['trans'] is not None:
+        y = mtg['trans'].dot(x)
 
-    bipolar_xyz = c_[bipolar_xyz]
-    bipolar_trans = c_[bipolar_trans]
+    elif mtg['idx_ref'] is not None:
+        y = x - mean(x[mtg['idx_ref']], axis=0)
 
-    bipolar = Channels(bipolar_labels, bipolar_xyz)
+    else:  # reference channels are missing
+        y = NaN * ones(x.shape)
 
-    return bipolar, bipolar_trans
+    y = y.reshape((y.shape[0], ) + shape[1:])
+    return moveaxis(y, 0, idx_chan)
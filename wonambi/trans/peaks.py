@@ -1,10 +1,15 @@
+from collections import OrderedDict
 from logging import getLogger
-from numpy import nan, nanargmax, nanargmin
+from numpy import (argmax, argmin, flatnonzero, isnan, nan, nanargmax,
+                   nanargmin, stack)
+
+from ..datatype import _axis_key, _same_axis
+from ..utils.parallel import map_trials
 
 lg = getLogger(__name__)
 
 
-def peaks(data, method='max', axis='time', limits=None):
+def peaks(data, method='max', axis='time', limits=None, n_jobs=1):
     """Return the values of an index where the data is at max or min
 
     Parameters
@@ -17,6 +22,9 @@ def peaks(data, method='max', axis='time', limits=None):
         the lowest and highest limits where to search for the peaks
     data : instance of Data
         one of the datatypes
+    n_jobs : int
+        number of processes to compute the trials in parallel (-1 uses all
+        the CPUs)
 
     Returns
     -------
@@ -35,22 +43,118 @@ def peaks(data, method='max', axis='time', limits=None):
     output = data._copy()
     output.axis.pop(axis)
 
-    for trl in range(data.number_of('trial')):
-        values = data.axis[axis][trl]
-        dat = data(trial=trl)
-
-        if limits is not None:
-            limits = (values < limits[0]) | (values > limits[1])
+    if n_jobs == 1:
+        tasks = [[trl] for trl in range(data.number_of('trial'))]
 
-            idx = [slice(None)] * len(data.list_of_axes)
-            idx[idx_axis] = limits
-            dat[idx] = nan
+    else:
+        # trials with the same axis and the same shape are stacked and sent
+        # together to the other processes (where they are copied anyway)
+        groups = OrderedDict()
+        for trl in range(data.number_of('trial')):
+            values = data.axis[axis][trl]
+            same_key = groups.setdefault(
+                (_axis_key(values), data.data[trl].shape), [])
+            for group_values, trls in same_key:
+                if _same_axis(group_values, values):
+                    trls.append(trl)
+                    break
+            else:
+                same_key.append((values, [trl, ]))
+        tasks = [trls for same_key in groups.values() for _, trls in same_key]
 
-        if method == 'max':
-            peak_val = nanargmax(dat, axis=idx_axis)
-        elif method == 'min':
-            peak_val = nanargmin(dat, axis=idx_axis)
+    output_trials = map_trials(_peaks_trial,
+                               _peaks_args(data, tasks, idx_axis, axis,
+                                           limits),
+                               n_jobs=n_jobs, method=method)
 
-        output.data[trl] = values[peak_val]
+    for trls, peak_val in zip(tasks, output_trials):
+        if len(trls) == 1:
+            output.data[trls[0]] = peak_val
+        else:
+            for trl, one_peak_val in zip(trls, peak_val):
+                output.data[trl] = one_peak_val
 
     return output
+
+
+def _peaks_args(data, tasks, idx_axis, axis, limits):
+    """Yield the arguments of _peaks_trial for each group of trials (which
+    have the same axis and the same shape), so that only one group at the time
+    is stacked in memory.
+    """
+    for trls in tasks:
+        values = data.axis[axis][trls[0]]
+        in_limits = _find_limits(values, limits)
+
+        outside = None
+        if isinstance(in_limits, slice):
+            idx = [slice(None)] * data.data[trls[0]].ndim
+            idx[idx_axis] = in_limits
+            dat = [data.data[trl][tuple(idx)] for trl in trls]
+            values = values[in_limits]
+        else:
+            dat = [data.data[trl] for trl in trls]
+            if in_limits is not None:
+                outside = ~in_limits
+
+        if len(trls) == 1:
+            yield dat[0], values, idx_axis, outside
+        else:
+            yield stack(dat), values, idx_axis + 1, outside
+
+
+def _find_limits(values, limits):
+    """Find the values of the axis within the limits.
+
+    Returns
+    -------
+    slice or ndarray or None
+        slice if the values within the limits are contiguous, otherwise
+        boolean mask. None if limits is None.
+    """
+    if limits is None:
+        return None
+
+    in_limits = (limits[0] <= values) & (values <= limits[1])
+    idx = flatnonzero(in_limits)
+    if len(idx) > 0 and idx[-1] - idx[0] + 1 == len(idx):
+        return slice(idx[0], idx[-1] + 1)
+
+    return in_limits
+
+
+def _peaks_trial(dat, values, idx_axis, outside=None, method='max'):
+    """Find the values of the axis at the peaks of one trial (or of multiple
+    trials stacked along the first dimension).
+
+    Parameters
+    ----------
+    dat : ndarray
+        data of one trial, or multiple trials stacked
+    values : ndarray
+        values of the axis
+    idx_axis : int
+        dimension of dat corresponding to the axis
+    outside : ndarray, optional
+        boolean mask of the values of the axis to ignore
+    method : str
+        'max' or 'min'
+
+    Returns
+    -------
+    ndarray
+        values of the axis at the peaks
+    """
+    if outside is not None:
+        idx = [slice(None)] * dat.ndim
+        idx[idx_axis] = outside
+        dat = dat.astype(float)  # copy
+        dat[tuple(idx)] = nan
+
+    # NaN-aware functions copy the data, use them only if necessary
+    if dat.dtype.kind == 'f' and isnan(dat).any():
+        argfunc = {'max': nanargmax, 'min': nanargmin}[method]
+    else:
+        argfunc = {'max': argmax, 'min': argmin}[method]
+
+    return values[argfunc(dat, axis=idx_axis)]
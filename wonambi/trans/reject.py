@@ -1,11 +1,271 @@
 """Module to reject bad channels and bad epochs.
+
+The data is divided into epochs of fixed length and, for each channel and
+epoch, we compute some simple metrics (variance, kurtosis, line noise and
+flatline). Then the metrics are compared across epochs and channels with a
+robust z-score (based on median and median absolute deviation).
 """
 from logging import getLogger
 
+from numpy import (abs, arange, asarray, diff, empty, errstate, hstack, log10,
+                   mean, nanmedian, square, zeros)
+from numpy.fft import rfft, rfftfreq
+
+from ..datatype import ChanTime
+from .select import _create_subepochs
+
 lg = getLogger(__name__)
 
+METRICS = ('variance', 'kurtosis', 'line_noise', 'flatline')
+MAD_TO_SD = 1.4826  # scale factor between MAD and SD for normal distribution
+
+
+def rejectbadchan(data, **options):
+    """Find bad channels.
+
+    Parameters
+    ----------
+    data : instance of ChanTime or Dataset
+        data to check
+    **options
+        options passed to rejectbadepochs
+
+    Returns
+    -------
+    list of str
+        names of the bad channels
+    """
+    bad_chan, _, _ = rejectbadepochs(data, **options)
+    return bad_chan
+
+
+def rejectbadepochs(data, epoch_length=2, chan=None, thresh=5, line_freq=50,
+                    flat_thresh=0.5, bad_prop=0.2, chunk_length=600,
+                    annot=None, evt_name='Artefact'):
+    """Find bad channels and bad epochs.
+
+    Parameters
+    ----------
+    data : instance of ChanTime or Dataset
+        data to check. If it's a Dataset, the recordings are read in chunks,
+        so that it works for long recordings.
+    epoch_length : float
+        duration of each epoch, in s
+    chan : list of str, optional
+        channels to check (only for Dataset, default: all the channels)
+    thresh : float
+        robust z-score above which variance, kurtosis or line noise are
+        considered bad
+    line_freq : float
+        frequency of the line noise, in Hz
+    flat_thresh : float
+        proportion of identical consecutive samples above which the epoch of
+        one channel is considered flat
+    bad_prop : float
+        proportion of good channels which need to be bad, to mark one epoch
+        as bad
+    chunk_length : float
+        duration of the data to read at once from a Dataset, in s
+    annot : instance of Annotations, optional
+        if specified, the bad epochs are added as events to the annotations
+    evt_name : str
+        name of the events for the bad epochs
+
+    Returns
+    -------
+    list of str
+        names of the bad channels
+    instance of ChanTime
+        boolean mask (chan x time) of the bad epochs for each channel, where
+        time is the start of each epoch
+    list of dict
+        bad epochs, where consecutive bad epochs are merged into one event,
+        with 'name', 'start', 'end', 'chan'
+
+    Notes
+    -----
+    The variance (in log scale), the kurtosis and the line noise (power
+    around line_freq, divided by the total power) of each channel are
+    compared across epochs. One epoch of one channel is bad if any of the
+    metrics has a robust z-score higher than thresh, or if it's flat.
 
-def rejectbadchan():
-    """Class to reject bad channels.
+    A channel is bad if the median over epochs of any metric has a robust
+    z-score across channels higher than thresh, or if it's flat in more than
+    half of the epochs.
     """
-    pass
+    if hasattr(data, 'read_data'):
+        chan, time, metrics = _metrics_from_dataset(data, epoch_length, chan,
+                                                    line_freq, chunk_length)
+    else:
+        chan, time, metrics = _metrics_from_data(data, epoch_length,
+                                                 line_freq)
+
+    flat = metrics['flatline'] > flat_thresh
+    bad = flat.copy()
+    with errstate(invalid='ignore'):
+        for metric in ('variance', 'kurtosis', 'line_noise'):
+            bad |= abs(_robust_zscore(metrics[metric], axis=1)) > thresh
+
+        chan_metrics = asarray([nanmedian(metrics[metric], axis=1)
+                                for metric in ('variance', 'kurtosis',
+                                               'line_noise')])
+        bad_chan = (abs(_robust_zscore(chan_metrics, axis=1)) >
+                    thresh).any(axis=0)
+    bad_chan |= mean(flat, axis=1) > 0.5
+    bad_chan = [label for label, is_bad in zip(chan, bad_chan) if is_bad]
+    lg.info('Bad channels: ' + ', '.join(bad_chan))
+
+    good_chan = [label not in bad_chan for label in chan]
+    if any(good_chan):
+        bad_epoch = mean(bad[good_chan, :], axis=0) > bad_prop
+    else:
+        bad_epoch = zeros(len(time), dtype=bool)
+
+    events = _mask_to_events(bad_epoch, time, epoch_length, evt_name)
+    lg.info('Found {} bad epochs ({} events)'.format(sum(bad_epoch),
+                                                      len(events)))
+
+    if annot is not None:
+        for evt in events:
+            annot.add_event(evt_name, (evt['start'], evt['end']), chan='',
+                            save=False)
+        annot.save()
+
+    mask = ChanTime()
+    mask.s_freq = 1 / epoch_length
+    mask.axis['chan'] = empty(1, dtype='O')
+    mask.axis['chan'][0] = asarray(chan, dtype='U')
+    mask.axis['time'] = empty(1, dtype='O')
+    mask.axis['time'][0] = time
+    mask.data = empty(1, dtype='O')
+    mask.data[0] = bad
+
+    return bad_chan, mask, events
+
+
+def _metrics_from_data(data, epoch_length, line_freq):
+    """Compute the metrics for each trial of the data and concatenate them."""
+    nperseg = int(round(epoch_length * data.s_freq))
+
+    time = []
+    metrics = []
+    for i in range(data.number_of('trial')):
+        x = data(trial=i, copy=False)
+        n_epochs = x.shape[1] // nperseg
+        time.append(data.time[i][0] + arange(n_epochs) * epoch_length)
+        metrics.append(_compute_metrics(x, data.s_freq, nperseg, line_freq))
+
+    chan = list(data.axis['chan'][0])
+    return chan, hstack(time), _concatenate_metrics(metrics)
+
+
+def _metrics_from_dataset(dataset, epoch_length, chan, line_freq,
+                          chunk_length):
+    """Compute the metrics reading the dataset one chunk at the time."""
+    if chan is None:
+        chan = dataset.header['chan_name']
+    s_freq = dataset.header['s_freq']
+    n_samples = dataset.header['n_samples']
+
+    nperseg = int(round(epoch_length * s_freq))
+    n_epochs = n_samples // nperseg
+    chunk_epochs = max(int(chunk_length // epoch_length), 1)
+
+    metrics = []
+    for first_epoch in range(0, n_epochs, chunk_epochs):
+        begsam = first_epoch * nperseg
+        endsam = min(first_epoch + chunk_epochs, n_epochs) * nperseg
+        lg.debug('Reading chunk from sample {} to {}'.format(begsam, endsam))
+        x = dataset.read_data(chan=chan, begsam=begsam,
+                              endsam=endsam).data[0]
+        metrics.append(_compute_metrics(x, s_freq, nperseg, line_freq))
+
+    time = arange(n_epochs) * nperseg / s_freq
+    return list(chan), time, _concatenate_metrics(metrics)
+
+
+def _compute_metrics(x, s_freq, nperseg, line_freq):
+    """Compute metrics of each channel and epoch.
+
+    Parameters
+    ----------
+    x : 2d ndarray
+        data (chan x time)
+    s_freq : float
+        sampling frequency
+    nperseg : int
+        number of samples in each epoch
+    line_freq : float
+        frequency of the line noise
+
+    Returns
+    -------
+    dict of 2d ndarray
+        for each metric, the values in each channel and epoch (chan x epoch)
+
+    Notes
+    -----
+    The epochs are a strided view of the data, the only array of the size of
+    the data is the one with the demeaned values (which is then reused).
+    """
+    epochs = _create_subepochs(x, nperseg, nperseg)
+    out = {}
+
+    with errstate(invalid='ignore', divide='ignore'):
+        out['flatline'] = mean(diff(epochs, axis=-1) == 0, axis=-1)
+
+        dat = epochs - mean(epochs, axis=-1, keepdims=True)
+
+        freq = rfftfreq(nperseg, 1 / s_freq)
+        line_band = abs(freq - line_freq) <= 1
+        if line_band.any():
+            power = square(abs(rfft(dat, axis=-1)))
+            out['line_noise'] = (power[..., line_band].sum(axis=-1) /
+                                 power[..., 1:].sum(axis=-1))
+        else:
+            out['line_noise'] = zeros(epochs.shape[:-1])
+
+        square(dat, out=dat)
+        var = mean(dat, axis=-1)
+        square(dat, out=dat)
+        out['kurtosis'] = mean(dat, axis=-1) / square(var) - 3
+        out['variance'] = log10(var)
+
+    return out
+
+
+def _concatenate_metrics(metrics):
+    """Concatenate the metrics of multiple chunks along the epochs."""
+    return {metric: hstack([one_chunk[metric] for one_chunk in metrics])
+            for metric in METRICS}
+
+
+def _robust_zscore(x, axis):
+    """Z-score based on median and median absolute deviation.
+
+    NaN values are ignored, and the z-score is NaN or infinite if the MAD is
+    zero.
+    """
+    with errstate(invalid='ignore', divide='ignore'):
+        med = nanmedian(x, axis=axis, keepdims=True)
+        mad = nanmedian(abs(x - med), axis=axis, keepdims=True) * MAD_TO_SD
+        return (x - med) / mad
+
+
+def _mask_to_events(bad_epoch, time, epoch_length, evt_name):
+    """Merge consecutive bad epochs into events."""
+    events = []
+    for is_bad, start in zip(bad_epoch, time):
+        if not is_bad:
+            continue
+        end = start + epoch_length
+
+        if events and abs(events[-1]['end'] - start) < epoch_length / 2:
+            events[-1]['end'] = end
+        else:
+            events.append({'name': evt_name,
+                           'start': start,
+                           'end': end,
+                           'chan': '',
+                           })
+    return events
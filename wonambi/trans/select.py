@@ -10,16 +10,25 @@ Select should be as flexible as possible. There are quite a few cases, which
 will be added as we need them.
 """
 from collections import Iterable
+from fractions import Fraction
+from functools import lru_cache
 from logging import getLogger
 
-from numpy import asarray, empty, linspace, ones, setdiff1d
+from numpy import arange, asarray, empty, flatnonzero, ones, setdiff1d
 from numpy.lib.stride_tricks import as_strided
-from scipy.signal import decimate
+from scipy.signal import decimate, firwin, resample_poly
+
+from ..datatype import (_axis_key, _get_indices, _same_axis,
+                        _select_from_indices)
+from ..utils.parallel import map_trials
 
 lg = getLogger(__name__)
 
+MAX_CHUNK = 2 ** 20
+MAX_DENOMINATOR = 1000
+
 
-def select(data, trial=None, invert=False, **axes_to_select):
+def select(data, trial=None, invert=False, copy=True, **axes_to_select):
     """Define the selection of trials, using ranges or actual values.
 
     Parameters
@@ -36,11 +45,21 @@ def select(data, trial=None, invert=False, **axes_to_select):
         you can use (None, value_of_interest)
     invert : bool
         take the opposite selection
+    copy : bool
+        if False, the trials where the selection is a contiguous block of the
+        data (f.e. a time interval or a frequency band) are views of the input
+        data, so they should not be modified in place.
 
     Returns
     -------
     instance, same class as input
         data where selection has been applied.
+
+    Notes
+    -----
+    The indices are computed only once for each set of values of an axis, so
+    trials which have the same axis (f.e. after frequency) do not repeat the
+    selection.
     """
     if trial is not None and not isinstance(trial, Iterable):
         raise TypeError('Trial needs to be iterable.')
@@ -63,93 +82,263 @@ def select(data, trial=None, invert=False, **axes_to_select):
         output.axis[one_axis] = empty(len(trial), dtype='O')
     output.data = empty(len(trial), dtype='O')
 
-    to_select = {}
+    selections = {}
     for cnt, i in enumerate(trial):
         lg.debug('Selection on trial {0: 6}'.format(i))
+
+        idx_data = []
+        idx_output = []
+        output_shape = []
         for one_axis in output.axis:
             values = data.axis[one_axis][i]
 
             if one_axis in axes_to_select.keys():
-                values_to_select = axes_to_select[one_axis]
-
-                if len(values_to_select) == 0:
-                    selected_values = ()
-
-                elif isinstance(values_to_select[0], str):
-                    selected_values = asarray(values_to_select, dtype='U')
-
+                same_key = selections.setdefault(
+                    (one_axis, ) + _axis_key(values), [])
+                for cached_values, selection in same_key:
+                    if _same_axis(cached_values, values):
+                        break
                 else:
-                    if (values_to_select[0] is None and
-                       values_to_select[1] is None):
-                        bool_values = ones(len(values), dtype=bool)
-                    elif values_to_select[0] is None:
-                        bool_values = values < values_to_select[1]
-                    elif values_to_select[1] is None:
-                        bool_values = values_to_select[0] <= values
-                    else:
-                        bool_values = ((values_to_select[0] <= values) &
-                                       (values < values_to_select[1]))
-                    selected_values = values[bool_values]
-
-                if invert:
-                    selected_values = setdiff1d(values, selected_values)
-
-                lg.debug('In axis {0}, selecting {1: 6} '
-                         'values'.format(one_axis,
-                                         len(selected_values)))
-                to_select[one_axis] = selected_values
+                    selection = _select_one_axis(
+                        data, one_axis, i, axes_to_select[one_axis], invert)
+                    same_key.append((values, selection))
+                    lg.debug('In axis {0}, selecting {1: 6} '
+                             'values'.format(one_axis, len(selection[0])))
+                selected_values, idx = selection
+                idx_data.append(idx[0])
+                idx_output.append(idx[1])
+
             else:
                 lg.debug('In axis ' + one_axis + ', selecting all the '
                          'values')
-                selected_values = data.axis[one_axis][i]
+                selected_values = values
+                idx_data.append(None)
+                idx_output.append(None)
 
             output.axis[one_axis][cnt] = selected_values
+            output_shape.append(len(selected_values))
 
-        output.data[cnt] = data(trial=i, **to_select)
+        output.data[cnt] = _select_from_indices(data.data[i], idx_data,
+                                                idx_output, output_shape,
+                                                copy=copy)
 
     return output
 
 
-def resample(data, s_freq=None, axis='time', ftype='fir', n=None):
-    """Downsample the data after applying a filter.
+def _select_one_axis(data, axis, trial, values_to_select, invert):
+    """Select the values of one axis in one trial.
+
+    Parameters
+    ----------
+    data : instance of Data
+        data to select from
+    axis : str
+        name of the axis
+    trial : int
+        index of the trial
+    values_to_select : tuple or list
+        labels of interest, or range of numeric values (see select)
+    invert : bool
+        take the opposite selection
+
+    Returns
+    -------
+    ndarray
+        values which were selected
+    tuple
+        indices of the selected values in the data (as slice, if they are
+        contiguous) and in the output
+    """
+    values = data.axis[axis][trial]
+
+    if len(values_to_select) == 0:
+        selected_values = asarray((), dtype=values.dtype)
+
+    elif isinstance(values_to_select[0], str):
+        selected_values = asarray(values_to_select, dtype='U')
+
+    else:
+        if (values_to_select[0] is None and
+           values_to_select[1] is None):
+            bool_values = ones(len(values), dtype=bool)
+        elif values_to_select[0] is None:
+            bool_values = values < values_to_select[1]
+        elif values_to_select[1] is None:
+            bool_values = values_to_select[0] <= values
+        else:
+            bool_values = ((values_to_select[0] <= values) &
+                           (values < values_to_select[1]))
+
+        if not invert:
+            idx_data = flatnonzero(bool_values)
+            idx_output = arange(len(idx_data))
+            if (len(idx_data) > 0 and
+                    idx_data[-1] - idx_data[0] + 1 == len(idx_data)):
+                idx_data = slice(idx_data[0], idx_data[-1] + 1)
+            return values[idx_data], (idx_data, idx_output)
+
+        selected_values = values[bool_values]
+
+    if invert:
+        selected_values = setdiff1d(values, selected_values)
+
+    idx = _get_indices(values, selected_values, tolerance=None,
+                       lookup=data._get_lookup(axis, trial))
+
+    return selected_values, idx
+
+
+def resample(data, s_freq=None, axis='time', ftype='fir', n=None, n_jobs=1,
+             chunk_size=None):
+    """Resample the data after applying an anti-aliasing filter.
 
     Parameters
     ----------
     data : instance of Data
-        data to downsample
+        data to resample
     s_freq : int or float
         desired sampling frequency
     axis : str
-        axis you want to apply downsample on (most likely 'time')
+        axis you want to apply resample on (most likely 'time')
     ftype : str
         filter type to apply. The default here is 'fir', like Matlab but unlike
-        the default in scipy, because it works better
+        the default in scipy, because it works better. 'iir' only works when
+        the original sampling frequency is a multiple of s_freq.
     n : int
         The order of the filter (1 less than the length for ‘fir’).
+    n_jobs : int
+        number of processes to resample the trials in parallel (-1 uses all
+        the CPUs)
+    chunk_size : int
+        maximum number of samples (of the input data) to resample at once
+        with 'fir'. Longer trials are resampled in overlapping chunks, which
+        give the same results as resampling the whole trial.
 
     Returns
     -------
     instance of Data
-        downsampled data
+        resampled data
+
+    Raises
+    ------
+    ValueError
+        if ftype is 'iir' but the ratio between the sampling frequencies is
+        not an integer
+
+    Notes
+    -----
+    With 'fir', the data is resampled with a polyphase filter, so the ratio
+    between the sampling frequencies can be any rational number (f.e. 500 Hz
+    to 256 Hz is upsampled by 64 and downsampled by 125).
     """
-    output = data._copy()
-    ratio = int(data.s_freq / s_freq)
+    up, down = _compute_up_down(data.s_freq, s_freq)
+    idx_axis = data.index_of(axis)
+
+    if ftype == 'fir':
+        b = _design_antialias(up, down, n)
+        if chunk_size is None:
+            chunk_size = MAX_CHUNK
+        output_trials = map_trials(_resample_poly, [(x, ) for x in data.data],
+                                   n_jobs=n_jobs,
+                                   up=up,
+                                   down=down,
+                                   b=b,
+                                   axis=idx_axis,
+                                   chunk_size=chunk_size)
+
+    elif ftype == 'iir':
+        if up != 1:
+            raise ValueError('Sampling frequency of the data (' +
+                             str(data.s_freq) + ' Hz) is not a multiple of ' +
+                             str(s_freq) + ' Hz, use ftype="fir"')
+        output_trials = map_trials(_decimate, [(x, ) for x in data.data],
+                                   n_jobs=n_jobs,
+                                   q=down,
+                                   n=n,
+                                   axis=idx_axis)
 
-    for i in range(data.number_of('trial')):
-        output.data[i] = decimate(data.data[i], ratio,
-                                  axis=data.index_of(axis),
-                                  zero_phase=True)
+    else:
+        raise ValueError('ftype should be "fir" or "iir", not ' + str(ftype))
+
+    output = data._copy()
+    for i, x in enumerate(output_trials):
+        output.data[i] = x
 
-        n_samples = output.data[i].shape[data.index_of(axis)]
-        output.axis[axis][i] = linspace(data.axis[axis][i][0],
-                                        data.axis[axis][i][-1] +
-                                        1 / data.s_freq,
-                                        n_samples)
+        n_samples = x.shape[idx_axis]
+        output.axis[axis][i] = (data.axis[axis][i][0] +
+                                arange(n_samples) / s_freq)
 
     output.s_freq = s_freq
 
     return output
 
+
+def _compute_up_down(old_freq, new_freq):
+    """Find the smallest integer factors to go from one sampling frequency to
+    the other."""
+    ratio = (Fraction(new_freq).limit_denominator(MAX_DENOMINATOR) /
+             Fraction(old_freq).limit_denominator(MAX_DENOMINATOR))
+    return ratio.numerator, ratio.denominator
+
+
+@lru_cache(maxsize=16)
+def _design_antialias(up, down, n=None):
+    """Low-pass FIR filter for polyphase resampling (the same filter as in
+    scipy.signal.decimate). It's read-only because it's cached."""
+    max_rate = max(up, down)
+    if n is None:
+        n = 20 * max_rate
+    b = firwin(n + 1, 1. / max_rate, window='hamming')
+    b.setflags(write=False)
+    return b
+
+
+def _resample_poly(x, up, down, b, axis, chunk_size=MAX_CHUNK):
+    """Resample one trial with a polyphase filter, in chunks if it's long.
+
+    Each chunk starts at a multiple of "down" samples, so that its output
+    samples fall on the same grid as the output of the whole trial. The chunks
+    are extended on both sides by the length of the filter, and the extra
+    output samples are then discarded.
+    """
+    n_in = x.shape[axis]
+    n_out = -(-n_in * up // down)  # ceil
+
+    if n_in <= chunk_size:
+        return resample_poly(x, up, down, axis=axis, window=b.copy())
+
+    step_in = max(chunk_size // down, 1) * down
+    pad_in = (-(-len(b) // (up * down)) + 1) * down
+
+    out_shape = list(x.shape)
+    out_shape[axis] = n_out
+    y = empty(out_shape)
+
+    idx_in = [slice(None)] * x.ndim
+    idx_out = [slice(None)] * x.ndim
+    for start in range(0, n_in, step_in):
+        end = min(start + step_in, n_in)
+        ext_start = max(start - pad_in, 0)
+        ext_end = min(end + pad_in, n_in)
+
+        idx_in[axis] = slice(ext_start, ext_end)
+        chunk = resample_poly(x[tuple(idx_in)], up, down, axis=axis,
+                              window=b.copy())
+
+        out_start = start * up // down
+        out_end = min(end * up // down, n_out) if end < n_in else n_out
+        skip = (start - ext_start) * up // down
+        idx_in[axis] = slice(skip, skip + out_end - out_start)
+        idx_out[axis] = slice(out_start, out_end)
+        y[tuple(idx_out)] = chunk[tuple(idx_in)]
+
+    return y
+
+
+def _decimate(x, q, n, axis):
+    return decimate(x, q, n=n, ftype='iir', axis=axis, zero_phase=True)
+
+
 def _create_subepochs(x, nperseg, step):
     """Transform the data into a matrix for easy manipulation
 
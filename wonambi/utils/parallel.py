@@ -0,0 +1,127 @@
+"""Module to run the same function on each trial, in parallel if requested.
+
+The trials are independent, so they can be sent to a pool of processes. If
+multiprocessing.shared_memory is available (python >= 3.8), the input arrays
+are copied once into shared memory, instead of being pickled and sent to the
+processes.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from logging import getLogger
+from os import cpu_count
+from pickle import dumps, loads, HIGHEST_PROTOCOL
+
+from numpy import ndarray
+
+try:
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:  # python < 3.8
+    SharedMemory = None
+
+lg = getLogger(__name__)
+
+
+def map_trials(func, trials, n_jobs=1, **kwargs):
+    """Apply a function to each trial.
+
+    Parameters
+    ----------
+    func : function
+        function to apply. If n_jobs != 1, it needs to be picklable (so, not
+        a lambda or a nested function).
+    trials : list or iterable of tuple
+        for each trial, the positional arguments to pass to func. It's
+        consumed one trial at the time, so it can be a generator which creates
+        the arguments only when needed.
+    n_jobs : int
+        number of processes to use. 1 (default) runs everything in the
+        current process, -1 uses all the CPUs.
+    **kwargs
+        keyword arguments passed to func (the same for all the trials)
+
+    Returns
+    -------
+    list
+        output of func for each trial, in the same order as trials
+    """
+    if n_jobs == -1 or n_jobs is None:
+        n_jobs = cpu_count()
+    if hasattr(trials, '__len__'):
+        n_jobs = min(n_jobs, len(trials))
+
+    if n_jobs <= 1:
+        return [func(*args, **kwargs) for args in trials]
+
+    name = func.__name__
+    func = partial(_run_in_worker, partial(func, **kwargs))
+
+    shared = []
+    try:
+        if SharedMemory is not None:
+            trials = [tuple(_to_shared(x, shared) for x in args)
+                      for args in trials]
+        else:
+            trials = list(trials)
+        if len(trials) == 0:
+            return []
+        n_jobs = min(n_jobs, len(trials))
+
+        lg.debug('Running ' + name + ' on ' + str(len(trials)) +
+                 ' trials with ' + str(n_jobs) + ' processes')
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            output = [loads(x) for x in executor.map(func, trials)]
+
+    finally:
+        for shm in shared:
+            shm.close()
+            shm.unlink()
+
+    return output
+
+
+class _SharedArray:
+    """Description of an array stored in shared memory, which can be sent to
+    another process."""
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+
+def _to_shared(x, shared):
+    """Copy numeric arrays to shared memory, leave other arguments as they
+    are. The new instances of SharedMemory are appended to "shared"."""
+    if not isinstance(x, ndarray) or x.dtype.hasobject or x.nbytes == 0:
+        return x
+
+    shm = SharedMemory(create=True, size=x.nbytes)
+    shared.append(shm)
+    ndarray(x.shape, dtype=x.dtype, buffer=shm.buf)[...] = x
+
+    return _SharedArray(shm.name, x.shape, x.dtype)
+
+
+def _run_in_worker(func, args):
+    """Run func in a worker process, reading the shared arrays.
+
+    The output is pickled here, so that it doesn't keep any reference to
+    shared memory, which is closed at the end.
+    """
+    opened = []
+    args = list(args)
+    for i, x in enumerate(args):
+        if isinstance(x, _SharedArray):
+            shm = SharedMemory(name=x.name)
+            opened.append(shm)
+            args[i] = ndarray(x.shape, dtype=x.dtype, buffer=shm.buf)
+
+    try:
+        return dumps(func(*args), protocol=HIGHEST_PROTOCOL)
+
+    finally:
+        del args
+        for shm in opened:
+            try:
+                shm.close()
+            except BufferError:  # the arrays are still used by a traceback
+                pass
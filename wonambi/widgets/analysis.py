@@ -39,7 +39,7 @@ from PyQt5.QtWidgets import (QAbstractItemView,
                              )
 
 from .. import ChanTime
-from ..trans import montage, filter_, frequency
+from ..trans import montage, filter_, frequency_batch
 from .notes import ChannelDialog, STAGE_NAME
 from .settings import (FormStr, FormInt, FormFloat, FormBool, FormMenu,
                        FormRadio)
@@ -1078,18 +1078,21 @@ class AnalysisDialog(ChannelDialog):
                          str(overlap), 'step:', str(step), 'detrend:',
                          str(detrend)]))
 
-        xfreq = []
         for seg in self.segments:
             data = seg['data']
             timeline = seg['data'].axis['time'][0]
             seg['times'] = timeline[0], timeline[-1]
             seg['duration'] = len(timeline) / data.s_freq
 
-            lg.info('Compute freq ' + ' ' + str((timeline[0], timeline[-1])))
-            Sxx = frequency(data, output=output, scaling=scaling, sides=sides,
-                            taper=taper, halfbandwidth=halfbandwidth, NW=NW,
-                            duration=duration, overlap=overlap, step=step,
-                            detrend=detrend)
+        lg.info('Compute freq on ' + str(len(self.segments)) + ' segments')
+        all_Sxx = frequency_batch([seg['data'] for seg in self.segments],
+                                  output=output, scaling=scaling, sides=sides,
+                                  taper=taper, halfbandwidth=halfbandwidth,
+                                  NW=NW, duration=duration, overlap=overlap,
+                                  step=step, detrend=detrend)
+
+        xfreq = []
+        for seg, Sxx in zip(self.segments, all_Sxx):
             seg['data'] = Sxx
             xfreq.append(seg)
 
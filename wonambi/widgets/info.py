@@ -22,6 +22,7 @@ from PyQt5.QtWidgets import (QAbstractItemView,
                              )
 
 from .. import Dataset
+from ..dataset import HEADER_CACHE_DIR
 from ..ioeeg import write_wonambi, write_edf
 from .settings import FormBool, FormFloat, FormMenu
 from .utils import (short_strings, ICON, keep_recent_datasets,
@@ -215,7 +216,7 @@ class Info(QWidget):
                                             basename(filename))
         lg.info('Reading dataset: ' + str(filename))
         self.filename = filename # temp
-        self.dataset = Dataset(filename) #temp
+        self.dataset = Dataset(filename, cache_dir=HEADER_CACHE_DIR) #temp
 #==============================================================================
 #         try:
 #             self.filename = filename
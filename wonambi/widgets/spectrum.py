@@ -148,7 +148,8 @@ class Spectrum(QWidget):
 
         if chan_name:
             trial = 0
-            data = self.parent.traces.data(trial=trial, chan=chan_name)
+            data = self.parent.traces.data(trial=trial, chan=chan_name,
+                                           copy=False)
             self.display(data)
         else:
             self.scene.clear()
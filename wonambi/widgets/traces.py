@@ -433,7 +433,7 @@ class Traces(QGraphicsView):
                 chan_name = one_chan + ' (' + one_grp['name'] + ')'
 
                 # trace
-                dat = (self.data(trial=0, chan=chan_name) *
+                dat = (self.data(trial=0, chan=chan_name, copy=False) *
                        self.parent.value('y_scale'))
                 dat *= -1  # flip data, upside down
                 path = self.scene.addPath(Path(self.data.axis['time'][0],
@@ -1093,7 +1093,7 @@ def _create_data_to_plot(data, chan_groups):
             chan_grp_name = chan + ' (' + one_grp['name'] + ')'
             all_chan_grp_name.append(chan_grp_name)
 
-            dat = data1(chan=chan, trial=0)
+            dat = data1(chan=chan, trial=0, copy=False)
             dat = dat - nanmean(dat)
             output.data[0][i_ch, :] = dat * one_grp['scale']
             i_ch += 1